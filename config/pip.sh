@@ -27,3 +27,17 @@ check_virtualenv_install() {
         end_step
     fi
 }
+
+
+install_virtualenv() {
+    # Creates the virtualenv comp is installed in, installing virtualenv
+    # first if needed.
+    if [ ! -e "${PYTHON_DIR}" ]; then
+        installing "Creating virtualenv"
+        if ! command -v virtualenv >/dev/null; then
+            /usr/bin/env pip2 install virtualenv
+        fi
+        virtualenv --no-download --python=python3.6 "${COMP_ROOT}"
+        end_step
+    fi
+}
@@ -1,6 +1,27 @@
-import pkg_resources
+"""
+The package version is only needed for `comp --version`, so it is resolved
+lazily on first access instead of paying for a distribution lookup on every
+invocation of `comp`.
+"""
+DISTRIBUTION_NAME = 'comp-community-scripts'
 
-try:
-    __version__ = pkg_resources.get_distribution('composition-scripts').version
-except pkg_resources.DistributionNotFound:
-    __version__ = None
+
+def get_version():
+    try:
+        from importlib import metadata
+    except ImportError:
+        import pkg_resources
+        try:
+            return pkg_resources.get_distribution(DISTRIBUTION_NAME).version
+        except pkg_resources.DistributionNotFound:
+            return None
+    try:
+        return metadata.version(DISTRIBUTION_NAME)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def __getattr__(name):
+    if name == '__version__':
+        return get_version()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,102 @@
+from __future__ import print_function
+
+import sys
+
+from plumbum import cli, local
+
+
+# Set for every docker-compose comp runs, including the ones run by a
+# `comp daemon`'s children, which take over their caller's environment.
+ENV_DEFAULTS = {"COMPOSE_HTTP_TIMEOUT": "6000"}
+
+local.env.update(**ENV_DEFAULTS)
+
+
+class Composition(cli.Application):
+    """
+    Manages the comp-community containers.
+
+    Operations on the containers go through the Docker daemon's API directly
+    when its socket is reachable, falling back to docker-compose otherwise.
+    """
+    profile = cli.Flag("--profile-startup", default=False,
+        help="Report how long comp takes to start up and quit")
+
+    @cli.switch("--trace", str, help="Record how long each step and external "
+        "command takes, and write it to the given file in Chrome's trace "
+        "event format")
+    def trace(self, path):
+        import atexit
+        from .utils.tracing import tracer
+
+        tracer.enable()
+        root = tracer.start_span(' '.join(['comp'] + self._trace_args()),
+            category='comp', argv=' '.join(sys.argv))
+
+        def export():
+            tracer.finish_span(root)
+            tracer.export_chrome(path)
+            print("Wrote trace of %d spans to %s" % (len(tracer.spans), path))
+        atexit.register(export)
+
+    @classmethod
+    def _trace_args(cls):
+        """
+        The command line without the --trace switch, to name the trace by.
+        """
+        args, skip = [], False
+        for arg in sys.argv[1:]:
+            if skip or arg.startswith('--trace='):
+                skip = False
+            elif arg == '--trace':
+                skip = True
+            else:
+                args.append(arg)
+        return args
+
+    @property
+    def VERSION(self):
+        from comp_community_scripts import get_version
+        return get_version()
+
+    def main(self, *args):
+        if self.profile:
+            from .startup import profile_startup
+            profile_startup()
+            return 0
+        if args:
+            print("Unknown command %r" % (args[0]))
+            return 1
+        if not self.nested_command:
+            print("No command given")
+            return 1
+
+
+# Subcommands are registered by their import path so that a subcommand's
+# module (and anything it depends on) is only imported when it is used.
+Composition.subcommand(
+    "setup", "comp_community_scripts.commands.setup.CompositionSetup")
+Composition.subcommand(
+    "migrate", "comp_community_scripts.commands.migrate.CompositionMigrate")
+Composition.subcommand(
+    "shell", "comp_community_scripts.commands.shell.CompositionShell")
+Composition.subcommand(
+    "start", "comp_community_scripts.commands.start.CompositionStart")
+Composition.subcommand(
+    "ports", "comp_community_scripts.commands.ports.CompositionPorts")
+Composition.subcommand(
+    "daemon", "comp_community_scripts.commands.daemon.CompositionDaemon")
+Composition.subcommand(
+    "logs", "comp_community_scripts.commands.logs.CompositionLogs")
+Composition.subcommand(
+    "stats", "comp_community_scripts.commands.stats.CompositionStats")
+Composition.subcommand(
+    "loadtest", "comp_community_scripts.commands.loadtest.CompositionLoadTest")
+Composition.subcommand(
+    "doctor", "comp_community_scripts.commands.doctor.CompositionDoctor")
+Composition.subcommand(
+    "repos", "comp_community_scripts.commands.repos.CompositionRepos")
+Composition.subcommand(
+    "build", "comp_community_scripts.commands.build.CompositionBuild")
+Composition.subcommand(
+    "db", "comp_community_scripts.commands.db.CompositionDatabase")
@@ -3,12 +3,93 @@ from __future__ import print_function
 import os
 import sys
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
-app_ports = {
+
+# The ports used for services that the compose files do not publish a port
+# for (or when they cannot be read).
+DEFAULT_APP_PORTS = {
     "api": 8000,
     'admin': 3000,
 }
 
+# The project of the instance comp is operating on (see instances.py), whose
+# ports are the ones leased to it.
+PROJECT_SETTING = 'COMP_PROJECT'
+
+
+class AppPorts(Mapping):
+    """
+    The port each app is published on, as a mapping of service name to port.
+
+    The ports come from the compose model, which is only loaded the first
+    time a port is looked up, on top of DEFAULT_APP_PORTS.  When operating on
+    an instance (comp --instance/--project), the ports leased to it win.
+
+    >>> app_ports.for_project('compcommunity2')['api']
+    >>> 20000
+    """
+    def __init__(self, root=None, files=None, defaults=DEFAULT_APP_PORTS,
+            project=None):
+        self.root = root or os.path.realpath(
+            os.path.join(os.path.dirname(__file__), '..', '..'))
+        self.files = files
+        self.defaults = defaults
+        self.project = project
+        self._ports = {}
+
+    def for_project(self, project):
+        return AppPorts(root=self.root, files=self.files,
+            defaults=self.defaults, project=project)
+
+    @property
+    def ports(self):
+        project = self.project or os.environ.get(PROJECT_SETTING) or None
+        if project not in self._ports:
+            ports = dict(self.defaults)
+            try:
+                ports.update(self._published_ports())
+                if project:
+                    ports.update(self._leased_ports(project))
+            except ImportError:
+                # Run as a script, outside of the package.
+                pass
+            self._ports[project] = ports
+        return self._ports[project]
+
+    def _published_ports(self):
+        from comp_community_scripts.compose import ComposeModel
+        from comp_community_scripts.utils.exceptions import ComposeFileError
+
+        try:
+            return ComposeModel.load(self.root, files=self.files).published_ports
+        except ComposeFileError:
+            return {}
+
+    def _leased_ports(self, project):
+        from comp_community_scripts.instances import PortLeases
+
+        lease = PortLeases().get(project)
+        return lease.ports if lease else {}
+
+    def __getitem__(self, app):
+        return self.ports[app]
+
+    def __iter__(self):
+        return iter(self.ports)
+
+    def __len__(self):
+        return len(self.ports)
+
+    def __repr__(self):
+        return "AppPorts(%r)" % self.ports
+
+
+app_ports = AppPorts()
+
 
 if __name__ == '__main__':
     script_name = os.path.basename(sys.argv[0])
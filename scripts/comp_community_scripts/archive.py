@@ -0,0 +1,380 @@
+from __future__ import absolute_import
+
+import fcntl
+import json
+import mmap
+import os
+import re
+import time
+import zlib
+from contextlib import contextmanager
+
+from .utils.cache import write_atomic
+from .utils.logging import get_logger
+
+
+__all__ = ('LogArchive', 'ArchiveWriter', 'archive_logs', 'parse_time', )
+
+
+logger = get_logger()
+
+
+# Lines are compressed in blocks of about this many bytes, which is the most
+# that has to be decompressed to find a line the index points to.
+BLOCK_BYTES = 256 * 1024
+
+# A segment is closed and a new one started once it holds this many
+# compressed bytes.
+SEGMENT_BYTES = 32 * 1024 * 1024
+
+# The oldest segments are removed once there are more than this many, which
+# can be changed with COMP_LOG_ARCHIVE_SEGMENTS.
+MAX_SEGMENTS = 64
+
+RELATIVE_TIME = re.compile(r'^(\d+(?:\.\d+)?)([smhdw])$')
+RELATIVE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_time(value, now=None):
+    """
+    Parses the times given to `comp logs --since/--until`, either relative to
+    now or absolute (UTC, unless they have an offset).
+
+    >>> parse_time('90m')
+    >>> parse_time('2018-06-02T17:41')
+    >>> parse_time('2018-06-02 17:41:09+02:00')
+    """
+    from .logs import parse_timestamp
+
+    value = value.strip()
+    match = RELATIVE_TIME.match(value)
+    if match:
+        amount = float(match.group(1)) * RELATIVE_UNITS[match.group(2)]
+        return (now or time.time()) - amount
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    value = value.replace(' ', 'T', 1)
+    if re.match(r'^\d{4}-\d\d-\d\d$', value):
+        value += 'T00:00:00'
+    elif re.match(r'^\d{4}-\d\d-\d\dT\d\d:\d\d(?:Z|[+-]\d\d:\d\d)?$', value):
+        value = value[:16] + ':00' + value[16:]
+    try:
+        return parse_timestamp(value)
+    except (ValueError, AttributeError):
+        raise ValueError("Invalid time %r, expected e.g. 30m, 2h, 1d or "
+            "2018-06-02T17:41:09" % value)
+
+
+class Block(object):
+    """
+    An entry of a segment's sparse index: where a compressed block of lines
+    is in the segment, the range of their timestamps and their services.
+    """
+    def __init__(self, offset, length, start, end, services):
+        self.offset = offset
+        self.length = length
+        self.start = start
+        self.end = end
+        self.services = services
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(*data)
+
+    def to_json(self):
+        return [self.offset, self.length, self.start, self.end, self.services]
+
+    def matches(self, since=None, until=None, services=None):
+        if since is not None and self.end < since:
+            return False
+        if until is not None and self.start > until:
+            return False
+        if services and not set(services) & set(self.services):
+            return False
+        return True
+
+
+class Segment(object):
+    """
+    A file of zlib compressed blocks of lines, one JSON array of
+    [timestamp, service, stream, text] per line.  The blocks are indexed in
+    the archive's index, and read through a memory map, so that a query
+    only decompresses the blocks that can contain what it is looking for.
+    """
+    def __init__(self, path, blocks=None):
+        self.path = path
+        self.blocks = blocks or []
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    @property
+    def size(self):
+        return sum(b.length for b in self.blocks)
+
+    @property
+    def start(self):
+        return min(b.start for b in self.blocks) if self.blocks else None
+
+    @property
+    def end(self):
+        return max(b.end for b in self.blocks) if self.blocks else None
+
+    @property
+    def services(self):
+        return sorted(set(s for b in self.blocks for s in b.services))
+
+    def matches(self, since=None, until=None, services=None):
+        return any(b.matches(since, until, services) for b in self.blocks)
+
+    def read_block(self, block, since=None, until=None, services=None):
+        """
+        Yields the lines of one of the segment's blocks that match, which
+        are in timestamp order, since blocks are sorted when they are
+        written.  Only that block is read and decompressed.
+        """
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                data = zlib.decompress(
+                    mapped[block.offset:block.offset + block.length])
+            finally:
+                mapped.close()
+        for line in data.splitlines():
+            timestamp, service, stream, text = json.loads(line.decode('utf-8'))
+            if since is not None and timestamp < since:
+                continue
+            if until is not None and timestamp > until:
+                continue
+            if services and service not in services:
+                continue
+            yield timestamp, service, stream, text
+
+
+def merge_blocks(blocks, since=None, until=None, services=None):
+    """
+    Yields the matching lines of (segment, block) pairs in timestamp order,
+    merging the blocks, which are each sorted but can overlap one another.
+
+    A block is only read once the merge reaches its first timestamp, so that
+    a query over many blocks only holds the ones that overlap in memory.
+    """
+    import heapq
+
+    blocks = sorted(blocks, key=lambda pair: pair[1].start)
+    heap = []
+    opened = 0
+
+    def push(lines, order):
+        line = next(lines, None)
+        if line is not None:
+            heapq.heappush(heap, (line[0], order, line, lines))
+
+    while heap or opened < len(blocks):
+        # Any block that starts before the earliest line read so far can
+        # hold the next line.
+        while opened < len(blocks) and (not heap
+                or blocks[opened][1].start <= heap[0][0]):
+            segment, block = blocks[opened]
+            push(segment.read_block(block, since, until, services), opened)
+            opened += 1
+        if heap:
+            _, order, line, lines = heapq.heappop(heap)
+            yield line
+            push(lines, order)
+
+
+class LogArchive(object):
+    """
+    An archive of the services' logs in rotating, compressed segments, with a
+    sparse index of each segment's blocks by time and service.
+
+    >>> archive = LogArchive(state_dir / 'logs')
+    >>> with archive.writer() as writer:
+    >>>     writer.append(line)
+    >>> archive.query(since=parse_time('2h'), services=['api'])
+
+    The index is a single JSON file that is replaced atomically whenever a
+    block is written, so that queries never see a block that is not fully
+    written.  Writers are serialized with a lock on the archive.
+    """
+    def __init__(self, path, max_segments=None):
+        self.path = str(path)
+        self.max_segments = max_segments or int(os.environ.get(
+            'COMP_LOG_ARCHIVE_SEGMENTS', MAX_SEGMENTS))
+        self.index_path = os.path.join(self.path, 'index.json')
+
+    def load_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            index = {}
+        segments = [Segment(os.path.join(self.path, s['name']),
+            [Block.from_json(b) for b in s['blocks']])
+            for s in index.get('segments', [])]
+        return segments, index.get('containers', {})
+
+    def save_index(self, segments, containers):
+        write_atomic(self.index_path, json.dumps({
+            'segments': [{
+                'name': s.name,
+                'start': s.start,
+                'end': s.end,
+                'services': s.services,
+                'blocks': [b.to_json() for b in s.blocks],
+            } for s in segments],
+            'containers': containers,
+        }))
+
+    @contextmanager
+    def lock(self):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        with open(os.path.join(self.path, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextmanager
+    def writer(self):
+        with self.lock():
+            writer = ArchiveWriter(self)
+            try:
+                yield writer
+            finally:
+                writer.close()
+
+    def services(self, since=None, until=None, services=None):
+        """
+        The services with archived lines in the time range, from the index.
+        """
+        segments, _ = self.load_index()
+        return sorted(set(s for segment in segments for b in segment.blocks
+            if b.matches(since, until, services) for s in b.services
+            if not services or s in services))
+
+    def query(self, since=None, until=None, services=None):
+        """
+        Yields the archived (timestamp, service, stream, text) lines between
+        `since` and `until`, of the given services, in timestamp order.
+
+        Segments and blocks whose time range or services rule them out are
+        never read.  The lines of a block are sorted, but blocks, even
+        within a segment, can overlap (e.g. when a container's earlier logs
+        are archived after another's), so matching blocks are merged by
+        timestamp.  See merge_blocks.
+        """
+        segments, _ = self.load_index()
+        services = set(services) if services else None
+        return merge_blocks([(segment, block) for segment in segments
+            for block in segment.blocks
+            if block.matches(since, until, services)], since, until, services)
+
+
+class ArchiveWriter(object):
+
+    def __init__(self, archive, block_bytes=BLOCK_BYTES,
+            segment_bytes=SEGMENT_BYTES):
+        self.archive = archive
+        self.block_bytes = block_bytes
+        self.segment_bytes = segment_bytes
+        self.segments, self.containers = archive.load_index()
+        self.pending = []
+        self.pending_bytes = 0
+        self.written = 0
+
+    def last_timestamp(self, container_id):
+        """
+        The timestamp of the last archived line of the container, so that
+        archiving it again only adds what it logged since.
+        """
+        return self.containers.get(container_id)
+
+    def append(self, timestamp, service, stream, text, container_id=None):
+        line = json.dumps([timestamp, service, stream, text]).encode('utf-8')
+        self.pending.append((timestamp, service, line))
+        self.pending_bytes += len(line) + 1
+        if container_id is not None:
+            self.containers[container_id] = max(timestamp,
+                self.containers.get(container_id) or timestamp)
+        if self.pending_bytes >= self.block_bytes:
+            self.flush()
+
+    def _segment(self):
+        if not self.segments or self.segments[-1].size >= self.segment_bytes:
+            number = 1
+            if self.segments:
+                number = int(self.segments[-1].name.split('-')[1].split('.')[0]) + 1
+            self.segments.append(Segment(os.path.join(self.archive.path,
+                'segment-%06d.log' % number)))
+            self._prune()
+        return self.segments[-1]
+
+    def _prune(self):
+        while len(self.segments) > self.archive.max_segments:
+            segment = self.segments.pop(0)
+            logger.debug("Removing the log archive's oldest segment %s"
+                % segment.name)
+            try:
+                os.unlink(segment.path)
+            except OSError:
+                pass
+
+    def flush(self):
+        if not self.pending:
+            return
+        # Blocks are kept sorted so that reading a block yields its lines in
+        # order, even when several services were archived at once.
+        self.pending.sort(key=lambda line: line[0])
+        data = zlib.compress(b'\n'.join(line for _, _, line in self.pending), 6)
+
+        segment = self._segment()
+        with open(segment.path, 'ab') as f:
+            offset = f.tell()
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        segment.blocks.append(Block(offset, len(data), self.pending[0][0],
+            self.pending[-1][0], sorted(set(s for _, s, _ in self.pending))))
+        self.archive.save_index(self.segments, self.containers)
+
+        self.written += len(self.pending)
+        self.pending = []
+        self.pending_bytes = 0
+
+    def close(self):
+        self.flush()
+
+
+def archive_logs(backend, archive):
+    """
+    Appends everything the project's containers logged since they were last
+    archived to the archive, and returns how many lines were added.
+    """
+    from .logs import LogMultiplexer
+
+    with archive.writer() as writer:
+        sources = {}
+        containers = {}
+        for container in backend.container_states(all=True):
+            name = container.name or container.id[:12]
+            since = writer.last_timestamp(container.id)
+            sources[name] = backend.log_source(container, since=since)
+            containers[name] = (container, since)
+
+        def append(line):
+            container, since = containers[line.service]
+            if since is not None and line.timestamp <= since:
+                return
+            writer.append(line.timestamp, container.service or line.service,
+                line.stream, line.text, container_id=container.id)
+
+        LogMultiplexer(sources, sink=append, window=0).run()
+    return writer.written
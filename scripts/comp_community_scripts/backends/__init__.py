@@ -0,0 +1,79 @@
+from __future__ import absolute_import
+
+import os
+
+from ..utils.logging import get_logger
+from .base import Backend
+from .compose import ComposeBackend
+
+
+__all__ = ('Backend', 'ComposeBackend', 'get_backend', 'get_engine_client',
+    'engine_available', )
+
+
+logger = get_logger()
+
+
+# Which backend to use: "engine" talks to the Docker daemon's socket directly,
+# "compose" shells out to docker-compose and "auto" uses the engine whenever
+# the daemon answers a ping.
+BACKEND_SETTING = 'COMP_DOCKER_BACKEND'
+
+_engine_client = None
+_engine_available = None
+
+
+def get_engine_client():
+    """
+    The Engine API client is shared between backends so that its pooled
+    connections are reused for the lifetime of the process.
+    """
+    global _engine_client
+
+    if _engine_client is None:
+        from .engine import EngineClient
+        _engine_client = EngineClient()
+    return _engine_client
+
+
+def engine_available():
+    """
+    Whether the Docker daemon answers on its socket, which is only checked
+    once per process.
+    """
+    global _engine_available
+
+    if _engine_available is None:
+        _engine_available = get_engine_client().ping()
+    return _engine_available
+
+
+def _reset_after_fork():
+    """
+    A process forked by `comp daemon` must not share the daemon's pooled
+    connections, whose responses could otherwise be read by either process.
+    Whether the Docker daemon is available is still known after the fork.
+    """
+    if _engine_client is not None:
+        _engine_client.reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_backend(root, files=None, name=None):
+    name = name or os.environ.get(BACKEND_SETTING, 'auto')
+    fallback = ComposeBackend(root, files=files)
+    if name == 'compose':
+        return fallback
+
+    client = get_engine_client()
+    if name == 'engine' or engine_available():
+        from .engine import EngineBackend
+        return EngineBackend(root, files=files, client=client,
+            fallback=fallback)
+
+    logger.debug("Docker daemon not reachable at %s, using docker-compose."
+        % client.socket_path)
+    return fallback
@@ -0,0 +1,108 @@
+from __future__ import absolute_import
+
+from ..compose import DEFAULT_COMPOSE_FILES, project_name
+
+
+__all__ = ('Backend', )
+
+
+class Backend(object):
+    """
+    Abstract interface for performing operations against the composition's
+    containers.
+
+    Backends are constructed for a project root and a set of compose files,
+    mirroring the `-f` flags that would be given to docker-compose.
+    """
+    name = None
+
+    def __init__(self, root, files=None):
+        self.root = root
+        self.files = list(files or DEFAULT_COMPOSE_FILES)
+
+    @property
+    def project(self):
+        return project_name(self.root)
+
+    @property
+    def project_label(self):
+        """
+        The label docker-compose puts on every container of the project.
+        """
+        return 'com.docker.compose.project=%s' % self.project
+
+    @property
+    def flags(self):
+        flags = []
+        for f in self.files:
+            flags += ['-f', f]
+        return flags
+
+    def running_containers(self):
+        raise NotImplementedError()
+
+    def container_states(self, all=False):
+        """
+        Returns a containers.ContainerState for each of the project's running
+        containers, or every one of them with `all`.
+        """
+        raise NotImplementedError()
+
+    def published_ports(self):
+        """
+        Returns the host ports the project's running containers publish.
+        """
+        raise NotImplementedError()
+
+    def log_source(self, container, follow=False, tail=None, since=None):
+        """
+        Returns where a container's log is read from, with timestamps, for
+        logs.LogMultiplexer.  `since` skips what was logged before that UNIX
+        time (to the second).
+        """
+        raise NotImplementedError()
+
+    def stop(self, timeout=10):
+        """
+        Stops the running containers in parallel, killing the ones that are
+        still running `timeout` seconds later, and returns them once they
+        exited.  See containers.stop_containers.
+        """
+        raise NotImplementedError()
+
+    def pull(self, services=None):
+        raise NotImplementedError()
+
+    def pull_service(self, service):
+        """
+        Pulls a single service's image without writing to the terminal, so
+        that several services can be pulled at once.
+        """
+        raise NotImplementedError()
+
+    def image_digests(self, image):
+        """
+        Returns the registry digests of the image as it is present locally, or
+        None if the image has not been pulled.
+        """
+        raise NotImplementedError()
+
+    def image_labels(self, image):
+        """
+        Returns the labels of the image as it is present locally, or None if
+        there is no such image.
+        """
+        raise NotImplementedError()
+
+    def build(self, context, labels=None, log=None):
+        """
+        Builds a build.BuildContext into its tag, with the given labels,
+        passing the build's output to `log` line by line.
+        """
+        raise NotImplementedError()
+
+    def up(self, *args):
+        raise NotImplementedError()
+
+    def down(self):
+        raise NotImplementedError()
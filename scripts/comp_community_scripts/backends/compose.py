@@ -0,0 +1,155 @@
+from __future__ import absolute_import
+
+import json
+import re
+
+from plumbum import local
+
+from ..utils.exceptions import CompCommandError, CommandFailed
+from ..utils.logging import get_logger
+from ..utils.plumbum import LazyCommand
+from ..utils.runner import run
+from .base import Backend
+
+
+__all__ = ('ComposeBackend', )
+
+
+logger = get_logger()
+
+
+docker = LazyCommand('docker')
+docker_compose = LazyCommand('docker-compose')
+
+PUBLISHED_PORTS = re.compile(r':(\d+)(?:-(\d+))?->')
+
+
+class ComposeBackend(Backend):
+    """
+    Performs every operation by shelling out to docker-compose.  This is the
+    fallback for when the Docker daemon's socket cannot be reached directly.
+    """
+    name = 'compose'
+
+    # Seconds each docker-compose command is given before it is killed, so
+    # that a hung docker-compose cannot block comp forever.
+    TIMEOUTS = {
+        'ps': 60,
+        'stop': 300,
+        'pull': 1800,
+        'up': None,
+        'down': 300,
+        'inspect': 60,
+        'build': 3600,
+    }
+
+    def running_containers(self):
+        result = run(docker['ps', '--no-trunc', '--filter',
+            'label=%s' % self.project_label, '--format', '{{json .}}'],
+            log=logger.debug, timeout=self.TIMEOUTS['ps'], capture=True)
+        return [json.loads(line) for line in result.stdout_tail if line.strip()]
+
+    def container_states(self, all=False):
+        from ..containers import ContainerState
+
+        if not all:
+            return [ContainerState.from_cli(c) for c in self.running_containers()]
+        result = run(docker['ps', '--all', '--no-trunc', '--filter',
+            'label=%s' % self.project_label, '--format', '{{json .}}'],
+            log=logger.debug, timeout=self.TIMEOUTS['ps'], capture=True)
+        return [ContainerState.from_cli(json.loads(line))
+            for line in result.stdout_tail if line.strip()]
+
+    def published_ports(self):
+        # The CLI lists them as e.g. "0.0.0.0:8000->8000/tcp, :::8000->8000/tcp".
+        ports = set()
+        for container in self.running_containers():
+            for first, last in PUBLISHED_PORTS.findall(
+                    container.get('Ports') or ''):
+                ports.update(range(int(first), int(last or first) + 1))
+        return ports
+
+    def log_source(self, container, follow=False, tail=None, since=None):
+        from ..logs import CommandLogSource
+
+        argv = [str(docker.command), 'logs', '--timestamps', '--tail',
+            str(tail) if tail is not None else 'all']
+        if follow:
+            argv.append('--follow')
+        if since is not None:
+            argv += ['--since', str(int(since))]
+        return CommandLogSource(argv + [container.id])
+
+    def tracker(self):
+        from ..containers import (CommandEvents, ContainerTracker,
+            events_source_override)
+
+        events = events_source_override() or CommandEvents.docker(
+            binary=str(docker.command), labels=[self.project_label])
+        return ContainerTracker(events, snapshot=self.container_states)
+
+    def stop(self, timeout=10):
+        from ..containers import stop_containers
+
+        with self.tracker() as tracker:
+            return stop_containers(tracker,
+                stop=lambda c, t: run(docker['stop', '-t', str(t), c.id],
+                    log=logger.debug, timeout=t + self.TIMEOUTS['stop']),
+                kill=lambda c: run(docker['kill', c.id], retcode=None,
+                    log=logger.debug, timeout=self.TIMEOUTS['inspect']),
+                timeout=timeout)
+
+    def pull(self, services=None):
+        with local.cwd(self.root):
+            run(docker_compose[self.flags + ['pull'] + list(services or [])],
+                timeout=self.TIMEOUTS['pull'])
+
+    def pull_service(self, service):
+        try:
+            with local.cwd(self.root):
+                run(docker_compose[self.flags + ['pull', service]],
+                    log=logger.debug, timeout=self.TIMEOUTS['pull'])
+        except CommandFailed as e:
+            raise CompCommandError(e.tail[-1] if e.tail else str(e))
+
+    def image_digests(self, image):
+        result = run(docker[
+            'image', 'inspect', '--format', '{{json .RepoDigests}}', image
+        ], retcode=None, log=logger.debug, timeout=self.TIMEOUTS['inspect'],
+            capture=True)
+        if result.retcode != 0:
+            return None
+        return [d.split('@', 1)[1] for d in json.loads(result.stdout) or []]
+
+    def image_labels(self, image):
+        result = run(docker[
+            'image', 'inspect', '--format', '{{json .Config.Labels}}', image
+        ], retcode=None, log=logger.debug, timeout=self.TIMEOUTS['inspect'],
+            capture=True)
+        if result.retcode != 0:
+            return None
+        return json.loads(result.stdout) or {}
+
+    def build(self, context, labels=None, log=None):
+        # The CLI reads the context's .dockerignore and streams it itself.
+        args = ['build', '--tag', context.tag, '--file', context.dockerfile]
+        for key, value in sorted((labels or {}).items()):
+            args += ['--label', '%s=%s' % (key, value)]
+        for key, value in sorted(context.args.items()):
+            args += ['--build-arg', '%s=%s' % (key, value)]
+        if context.target:
+            args += ['--target', context.target]
+        run(docker[args + [context.path]], log=log or logger.debug,
+            timeout=self.TIMEOUTS['build'])
+
+    def up(self, *args):
+        # Attached `up`s take over the terminal until the containers exit.
+        detached = '-d' in args or '--detach' in args
+        with local.cwd(self.root):
+            run(docker_compose[self.flags + ['up'] + list(args)],
+                interactive=not detached, timeout=self.TIMEOUTS['up'])
+
+    def down(self):
+        with local.cwd(self.root):
+            run(docker_compose[self.flags + ['down']],
+                timeout=self.TIMEOUTS['down'])
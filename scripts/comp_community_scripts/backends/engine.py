@@ -0,0 +1,485 @@
+from __future__ import absolute_import
+
+import json
+import os
+import socket
+
+import http.client as http_client
+import queue
+from urllib.parse import quote, urlencode
+
+from ..compose import ComposeModel, load_services
+from ..utils.exceptions import DockerEngineError
+from ..utils.logging import get_logger
+from ..utils.tracing import tracer
+from .base import Backend
+
+
+__all__ = ('EngineClient', 'EngineEvents', 'EngineBackend',
+    'default_socket_path', )
+
+
+logger = get_logger()
+
+
+DEFAULT_SOCKET_PATH = '/var/run/docker.sock'
+API_VERSION = os.environ.get('DOCKER_API_VERSION', '1.30')
+
+# Errors that mean a pooled keep-alive connection was closed by the daemon
+# while it was sitting idle, in which case the request is retried once on a
+# fresh connection.
+STALE_CONNECTION_ERRORS = (
+    http_client.RemoteDisconnected,
+    http_client.CannotSendRequest,
+    BrokenPipeError,
+    ConnectionResetError,
+)
+
+
+def default_socket_path():
+    """
+    Returns the path of the Docker daemon socket, honoring DOCKER_HOST when it
+    points at a unix socket.
+    """
+    host = os.environ.get('DOCKER_HOST', '')
+    if host.startswith('unix://'):
+        return host[len('unix://'):]
+    return DEFAULT_SOCKET_PATH
+
+
+class UnixHTTPConnection(http_client.HTTPConnection):
+
+    def __init__(self, socket_path, timeout=None):
+        http_client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class EngineResponse(object):
+    """
+    The status, headers and decoded body of a request to the Engine API.
+    """
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 300
+
+    def json(self):
+        if not self.body:
+            return None
+        return json.loads(self.body.decode('utf-8'))
+
+    def json_lines(self):
+        """
+        Endpoints like /images/create stream one JSON object per line.
+        """
+        for line in self.body.decode('utf-8').splitlines():
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class EngineEvents(object):
+    """
+    The daemon's /events stream, which never ends on its own, read on a
+    connection of its own as one JSON event per line.  `close` can be called
+    from another thread to stop a blocked read.
+    """
+    def __init__(self, socket_path, url):
+        self.conn = UnixHTTPConnection(socket_path, timeout=None)
+        self.conn.request('GET', url)
+        self.response = self.conn.getresponse()
+        if self.response.status >= 400:
+            body = self.response.read()
+            self.conn.close()
+            raise DockerEngineError(EngineClient._error_message(
+                EngineResponse(self.response.status, self.response.msg, body)),
+                status=self.response.status)
+
+    def __iter__(self):
+        buffered = b''
+        while True:
+            chunk = self.response.read1(65536)
+            if not chunk:
+                return
+            buffered += chunk
+            while b'\n' in buffered:
+                line, buffered = buffered.split(b'\n', 1)
+                if line.strip():
+                    yield json.loads(line.decode('utf-8'))
+
+    def close(self):
+        sock = self.conn.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except (OSError, socket.error):
+                pass
+        self.conn.close()
+
+
+class EngineClient(object):
+    """
+    A small client for the Docker Engine API that talks HTTP directly over the
+    daemon's unix socket.
+
+    Connections are kept alive and pooled, so that consecutive requests do not
+    pay for a new connection (let alone a new docker-compose process) each
+    time:
+
+    >>> client = EngineClient()
+    >>> client.get('/containers/json', all=1).json()
+    """
+    def __init__(self, socket_path=None, timeout=60, pool_size=4,
+            version=API_VERSION):
+        self.socket_path = socket_path or default_socket_path()
+        self.timeout = timeout
+        self.version = version
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def url(self, path, **params):
+        url = '/v%s%s' % (self.version, path) if self.version else path
+        params = dict((k, v) for k, v in params.items() if v is not None)
+        if params:
+            url += '?' + urlencode(sorted(params.items()))
+        return url
+
+    def _get_connection(self):
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            return UnixHTTPConnection(self.socket_path, timeout=self.timeout), False
+
+    def _release_connection(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def reset(self):
+        """
+        Forgets the pooled connections without closing them, for a forked
+        child whose parent is still using the same sockets.
+        """
+        self._pool = queue.LifoQueue(maxsize=self._pool.maxsize)
+
+    def close(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def request(self, method, path, body=None, headers=None, timeout=None,
+            **params):
+        with tracer.span('%s %s' % (method, path), category='engine') as span:
+            response = self._request(method, path, body=body, headers=headers,
+                timeout=timeout, **params)
+            if span is not None:
+                span.args.update(status=response.status,
+                    output_bytes=len(response.body))
+            return response
+
+    def _request(self, method, path, body=None, headers=None, timeout=None,
+            **params):
+        url = self.url(path, **params)
+        headers = dict(headers or {})
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+            headers.setdefault('Content-Type', 'application/json')
+
+        conn, reused = self._get_connection()
+        try:
+            try:
+                response, will_close = self._send(
+                    conn, method, url, body, headers, timeout)
+            except STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                conn.close()
+                conn = UnixHTTPConnection(self.socket_path, timeout=self.timeout)
+                response, will_close = self._send(
+                    conn, method, url, body, headers, timeout)
+        except (socket.error, http_client.HTTPException) as e:
+            conn.close()
+            raise DockerEngineError(
+                "Could not reach the Docker daemon at %s: %s"
+                % (self.socket_path, e))
+
+        if will_close:
+            conn.close()
+        else:
+            self._release_connection(conn)
+
+        if response.status >= 400:
+            raise DockerEngineError(self._error_message(response),
+                status=response.status)
+        return response
+
+    def _send(self, conn, method, url, body, headers, timeout):
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout or self.timeout)
+        else:
+            conn.timeout = timeout or self.timeout
+        conn.request(method, url, body=body, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        return (EngineResponse(response.status, response.msg, body),
+            response.will_close)
+
+    @classmethod
+    def _error_message(cls, response):
+        try:
+            return response.json()['message']
+        except (ValueError, KeyError, TypeError):
+            return "Docker daemon responded with %s" % response.status
+
+    def get(self, path, **params):
+        return self.request('GET', path, **params)
+
+    def post(self, path, body=None, **params):
+        return self.request('POST', path, body=body, **params)
+
+    def delete(self, path, **params):
+        return self.request('DELETE', path, **params)
+
+    def ping(self, timeout=1):
+        try:
+            response = self.request('GET', '/_ping', timeout=timeout)
+        except DockerEngineError:
+            return False
+        return response.body.strip() == b'OK'
+
+    def containers(self, all=False, labels=None):
+        filters = {'label': list(labels)} if labels else None
+        return self.get('/containers/json', all=1 if all else None,
+            filters=json.dumps(filters) if filters else None).json()
+
+    def stop_container(self, container_id, timeout=10):
+        # The daemon waits up to `timeout` for the container to exit before
+        # killing it, so the socket has to wait a little longer than that.
+        return self.post('/containers/%s/stop' % quote(container_id),
+            t=timeout, timeout=timeout + self.timeout)
+
+    def kill_container(self, container_id, signal='SIGKILL'):
+        return self.post('/containers/%s/kill' % quote(container_id),
+            signal=signal)
+
+    def events(self, labels=None):
+        """
+        Subscribes to the daemon's container events, see EngineEvents.
+        """
+        filters = {'type': ['container']}
+        if labels:
+            filters['label'] = list(labels)
+        return EngineEvents(self.socket_path,
+            self.url('/events', filters=json.dumps(filters)))
+
+    def logs_url(self, container_id, follow=False, tail=None, since=None):
+        """
+        The URL of a container's log, which is streamed rather than requested
+        through the pool, see logs.EngineLogSource.
+        """
+        return self.url('/containers/%s/logs' % quote(container_id),
+            stdout=1, stderr=1, timestamps=1, follow=1 if follow else None,
+            tail=tail if tail is not None else 'all',
+            since=int(since) if since is not None else None)
+
+    def inspect_image(self, image):
+        """
+        Returns the image's details, or None if it is not present locally.
+        """
+        try:
+            return self.get('/images/%s/json' % quote(image, safe='/:@')).json()
+        except DockerEngineError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def build_image(self, body, tag, dockerfile=None, labels=None,
+            buildargs=None, target=None, log=None):
+        """
+        Builds an image from a tar stream of its context (see
+        build.context_tarball), which is sent to the daemon as it is read,
+        and returns the image's ID.  The build's output is passed to `log`
+        line by line.
+
+        Builds can take much longer than other requests, so they get a
+        connection of their own, without a timeout, rather than one from the
+        pool.
+        """
+        url = self.url('/build', t=tag, dockerfile=dockerfile,
+            labels=json.dumps(labels) if labels else None,
+            buildargs=json.dumps(buildargs) if buildargs else None,
+            target=target, rm=1, forcerm=1)
+        log = log or logger.debug
+        image_id = None
+        conn = UnixHTTPConnection(self.socket_path)
+        with tracer.span('POST /build', category='engine', tag=tag):
+            try:
+                # Without a length, the body is sent with chunked encoding.
+                conn.request('POST', url, body=body,
+                    headers={'Content-Type': 'application/x-tar'})
+                response = conn.getresponse()
+                if response.status >= 400:
+                    raise DockerEngineError(self._error_message(EngineResponse(
+                        response.status, response.msg, response.read())),
+                        status=response.status)
+                for line in response:
+                    if not line.strip():
+                        continue
+                    status = json.loads(line.decode('utf-8'))
+                    if 'error' in status:
+                        raise DockerEngineError("Error building %s: %s"
+                            % (tag, status['error'].strip()))
+                    if 'aux' in status:
+                        image_id = status['aux'].get('ID') or image_id
+                    for text in (status.get('stream') or '').splitlines():
+                        if text.strip():
+                            log(text)
+            except (socket.error, http_client.HTTPException) as e:
+                raise DockerEngineError(
+                    "Could not reach the Docker daemon at %s: %s"
+                    % (self.socket_path, e))
+            finally:
+                conn.close()
+        return image_id
+
+    def pull_image(self, image):
+        """
+        Pulls the image with the credentials the Docker CLI has for its
+        registry, see registry.docker_credentials.
+        """
+        from ..registry import registry_auth_header
+
+        name, tag = split_image_tag(image)
+        auth = registry_auth_header(image)
+        response = self.request('POST', '/images/create',
+            headers={'X-Registry-Auth': auth} if auth else None,
+            fromImage=name, tag=tag, timeout=None)
+        for status in response.json_lines():
+            if 'error' in status:
+                raise DockerEngineError(
+                    "Error pulling %s: %s" % (image, status['error']))
+        return response
+
+
+def split_image_tag(image):
+    """
+    >>> split_image_tag('localhost:5000/mysql')
+    >>> ('localhost:5000/mysql', 'latest')
+    """
+    if '@' in image:
+        return image, None
+    name, _, tag = image.rpartition(':')
+    if not name or '/' in tag:
+        return image, 'latest'
+    return name, tag
+
+
+class EngineBackend(Backend):
+    """
+    Performs the operations that map directly onto the Engine API (listing,
+    stopping and pulling the project's containers) without forking a
+    docker-compose process.
+
+    Anything that needs docker-compose's full project model, like bringing
+    the project up (networks, volumes, builds) or down, is delegated to the
+    fallback backend.
+    """
+    name = 'engine'
+
+    def __init__(self, root, files=None, client=None, fallback=None):
+        super(EngineBackend, self).__init__(root, files=files)
+        self.client = client or EngineClient()
+        self.fallback = fallback
+
+    def running_containers(self):
+        return self.client.containers(labels=[self.project_label])
+
+    def container_states(self, all=False):
+        from ..containers import ContainerState
+
+        return [ContainerState.from_api(c) for c in self.client.containers(
+            all=all, labels=[self.project_label])]
+
+    def published_ports(self):
+        return set(port['PublicPort'] for container in self.running_containers()
+            for port in container.get('Ports') or [] if port.get('PublicPort'))
+
+    def log_source(self, container, follow=False, tail=None, since=None):
+        from ..logs import EngineLogSource
+
+        return EngineLogSource(self.client.socket_path, self.client.logs_url(
+            container.id, follow=follow, tail=tail, since=since))
+
+    def tracker(self):
+        from ..containers import ContainerTracker, events_source_override
+
+        events = events_source_override() or self.client.events(
+            labels=[self.project_label])
+        return ContainerTracker(events, snapshot=self.container_states)
+
+    def stop(self, timeout=10):
+        from ..containers import stop_containers
+
+        with self.tracker() as tracker:
+            return stop_containers(tracker,
+                stop=lambda c, t: self.client.stop_container(c.id, timeout=t),
+                kill=lambda c: self.client.kill_container(c.id),
+                timeout=timeout)
+
+    def pull(self, services=None):
+        services_config = load_services(self.root, files=self.files)
+        for name, service in sorted(services_config.items()):
+            if services and name not in services:
+                continue
+            if not service.get('image'):
+                # Services that are only built locally have nothing to pull,
+                # docker-compose skips them as well.
+                continue
+            logger.info("Pulling %s (%s)" % (name, service['image']))
+            self.client.pull_image(service['image'])
+
+    def pull_service(self, service):
+        image = ComposeModel.load(self.root, files=self.files).images.get(service)
+        if image:
+            self.client.pull_image(image)
+
+    def image_digests(self, image):
+        info = self.client.inspect_image(image)
+        if info is None:
+            return None
+        return [d.split('@', 1)[1] for d in info.get('RepoDigests') or []]
+
+    def image_labels(self, image):
+        info = self.client.inspect_image(image)
+        if info is None:
+            return None
+        return (info.get('Config') or {}).get('Labels') or {}
+
+    def build(self, context, labels=None, log=None):
+        from ..build import context_tarball
+
+        self.client.build_image(context_tarball(context), context.tag,
+            dockerfile=context.dockerfile_name, labels=labels,
+            buildargs=context.args, target=context.target, log=log)
+
+    def up(self, *args):
+        return self.fallback.up(*args)
+
+    def down(self):
+        return self.fallback.down()
@@ -1,24 +1,34 @@
 from __future__ import absolute_import
 
+import os
 from os.path import join, dirname, realpath
 
 from plumbum import cli, local
-from plumbum.cmd import docker_compose, egrep
 
+from .backends import get_backend
+from .backends.compose import docker_compose
+from .compose import files_from_flags
 from .utils.choices import get_choice_options
 from .utils.exceptions import CompCommandError
 from .utils.logging import get_logger
-from .utils.plumbum import FG
 from .utils.prompts import UserPrompt, ChoicePrompt, BooleanPrompt
+from .utils.runner import run
 from .utils.terminal import StdoutMixin
+from .utils.tracing import traced
 
 
-__all__ = ('CompositionApplication', )
+__all__ = ('CompositionApplication', 'root_dir', 'docker_compose', )
 
 
+# TODO: See if we can tie these in with export SCRIPTS_ROOT="${COMP_ROOT}/scripts"
+# in env.sh.
 scripts_dir = local.path(realpath(join(dirname(__file__), "..")))
 root_dir = scripts_dir / '..'
 
+# Where comp keeps state about the checkout, like which setup steps are up to
+# date.  Ignored by git, and can be moved with COMP_STATE_DIR.
+state_dir = local.path(os.environ.get('COMP_STATE_DIR') or root_dir / '.comp')
+
 logger = get_logger()
 
 
@@ -31,6 +41,41 @@ class CompositionApplication(StdoutMixin, cli.Application):
     >>> with_sentry = cli.Flag("--with-sentry", default=False)
     >>> with_celery = cli.Flag("--with-celery", default=False)
     """
+    @cli.switch("--instance", int, excludes=["--project"],
+        help="Operate on a numbered instance of the stack, which runs as a "
+            "compose project of its own on ports leased to it.  Instances "
+            "share the checkout's database, so only one can run at a time")
+    def instance(self, instance):
+        from .instances import instance_project
+
+        self.use_project(instance_project(root_dir, instance=instance))
+
+    @cli.switch("--project", str, excludes=["--instance"],
+        help="Operate on the stack running as this compose project, on ports "
+            "leased to it")
+    def project(self, project):
+        from .instances import instance_project
+
+        self.use_project(instance_project(root_dir, project=project))
+
+    def use_project(self, project):
+        """
+        Makes the command (and the docker-compose processes it runs) operate
+        on an isolated instance of the stack.  See instances.activate.
+        """
+        from .app_ports import DEFAULT_APP_PORTS
+        from .instances import activate
+        from .utils.exceptions import InstanceConflictError, PortAllocationError
+
+        try:
+            ports = activate(root_dir, project, sorted(DEFAULT_APP_PORTS))
+        except (InstanceConflictError, PortAllocationError) as e:
+            # Switches are handled before main, so nothing else would.
+            self.error(str(e))
+            raise SystemExit(1)
+        logger.info("Using project %s on ports %s" % (project, ", ".join(
+            "%s: %d" % item for item in sorted(ports.items()))))
+
     @property
     def compose_files(self):
         return ['docker-compose.yml']
@@ -115,75 +160,243 @@ class CompositionApplication(StdoutMixin, cli.Application):
         return self._ask(prompt, prompter, continual=continual)
 
     @classmethod
-    def pull_from_docker_hub(cls, files=None, flags=None):
-        with local.cwd(root_dir):
-            if not flags:
-                flags = cls.create_compose_flags(files=files)
-            logger.info("Attempting to pull from docker hub")
-            try:
-                docker_compose[flags + ['pull']] & FG
-            except Exception as e:
-                print(e)
-                raise CompCommandError(
-                    "There was an error using 'docker-compose pull'.\n"
-                    "Are you logged into docker hub?")
+    def get_backend(cls, files=None, flags=None):
+        """
+        Returns the backend used to operate on the containers, which talks to
+        the Docker daemon directly when possible and otherwise falls back to
+        docker-compose.  See COMP_DOCKER_BACKEND in backends/__init__.py.
+        """
+        if not files and flags:
+            files = files_from_flags(flags)
+        return get_backend(root_dir, files=files)
 
     @classmethod
-    def stop_docker(cls, flags=None, files=None):
-        if not flags:
-            flags = cls.create_compose_flags(files=files)
+    @traced()
+    def pull_from_docker_hub(cls, files=None, flags=None, concurrency=None):
+        """
+        Pulls the services' images in parallel, skipping the ones that are
+        already up to date.  See pull.PullEngine.
+        """
+        from .pull import PullEngine
 
-        compose_containers = (
-            docker_compose[flags + ['ps']] | egrep['Up'])(retcode=None)
-        if compose_containers:
-            docker_compose[flags + ['stop']] & FG
+        backend = cls.get_backend(files=files, flags=flags)
+        logger.info("Attempting to pull from docker hub")
+        PullEngine(backend, concurrency=concurrency).pull()
 
     @classmethod
-    def start_database_server(cls):
-        # TODO: When we figure out what we are doing with the database.
-        docker_compose['run', '--rm', 'mysqld', 'initialize'] & FG
+    @traced()
+    def stop_docker(cls, flags=None, files=None):
+        cls.get_backend(files=files, flags=flags).stop()
 
     @classmethod
+    @traced()
+    def start_database_server(cls, flags=None, files=None):
+        """
+        Starts mysqld on the project's data directory in .comp/mysql, which
+        is seeded (when it does not exist yet) with a clone of a data
+        directory initialized for the current schema, rather than
+        initializing mysqld from scratch.  See datadirs.DataDirSnapshots.
+        """
+        from .compose import ComposeModel, project_name
+        from .datadirs import (DATA_SETTING, DataDirSnapshots,
+            initialize_data_dir, schema_fingerprint)
+
+        files = files or files_from_flags(flags) or None
+        compose_flags = cls.create_compose_flags(files=files)
+        image = ComposeModel.load(root_dir, files=files).images.get('mysqld')
+        data_dir = str(state_dir / 'mysql' / project_name(root_dir))
+        if DataDirSnapshots(image=image).seed(schema_fingerprint(root_dir),
+                data_dir,
+                lambda path: initialize_data_dir(root_dir, path,
+                    flags=compose_flags)):
+            logger.info("Seeded %s" % data_dir)
+        with local.cwd(root_dir), local.env(**{DATA_SETTING: data_dir}):
+            run(docker_compose[compose_flags + ['up', '-d', 'mysqld']])
+
+    @classmethod
+    @traced()
     def start_api_server(cls, flags=None, files=None):
-        if not flags:
-            flags = cls.create_compose_flags(files=files)
-        docker_compose[flags + ['up']] & FG
+        cls.get_backend(files=files, flags=flags).up()
+
+    @classmethod
+    def build_graph(cls, files=None, flags=None, services=None, force=False,
+            jobs=None):
+        """
+        Returns the builds of the services' images as a StepGraph, in which
+        only the images whose build context changed since they were built
+        run.  See build.ImageBuilder.
+        """
+        from .build import ImageBuilder, build_contexts
+        from .compose import ComposeModel
+        from .steps import StepState
+
+        files = files or files_from_flags(flags) or None
+        contexts = [c for c in build_contexts(ComposeModel.load(root_dir,
+            files=files)) if not services or c.service in services]
+        builder = ImageBuilder(cls.get_backend(files=files), contexts,
+            force=force)
+        return builder.graph(StepState(state_dir / 'build.json'),
+            max_workers=jobs)
+
+    @classmethod
+    def setup_graph(cls, files=None, flags=None, concurrency=None):
+        """
+        Returns the steps of `setup` as a StepGraph.  Stopping the running
+        containers and pulling the images do not depend on each other, so
+        they run concurrently.  Images are only built when their build
+        context changed, and `up` only runs again when they were, or when
+        the compose files, the images or the commits checked out in the
+        build contexts change.
+        """
+        from .compose import ComposeModel
+        from .steps import Step, StepGraph, StepState
+        from .updates import UpdateChecker
+        from .utils.git import git_head
+
+        files = files or files_from_flags(flags) or None
+        backend = cls.get_backend(files=files)
+        model = ComposeModel.load(root_dir, files=files)
+
+        def containers_running():
+            running = backend.running_containers()
+            if running:
+                return "%d container(s) running" % len(running)
+
+        def images_outdated():
+            outdated = UpdateChecker(backend).services_needing_update()
+            if outdated:
+                return "images out of date: %s" % ", ".join(outdated)
+
+        def up_inputs():
+            # A tag that was pulled again points at other digests, which
+            # `up` has to recreate the containers for.
+            return {
+                'compose files': model.digest,
+                'images': dict((service, image and sorted(
+                    backend.image_digests(image) or []))
+                    for service, image in model.images.items()),
+                'build contexts': dict((service, git_head(context))
+                    for service, context in model.build_contexts.items()),
+            }
+
+        builds = {}
+
+        def images_unbuilt():
+            try:
+                builds['graph'] = cls.build_graph(files=files)
+                builds['plans'] = builds['graph'].plan()
+            except CompCommandError as e:
+                builds.clear()
+                return "could not check the images: %s" % e
+            unbuilt = [p.step.name for p in builds['plans'] if p.run]
+            if unbuilt:
+                return "images to build: %s" % ", ".join(unbuilt)
+
+        def build():
+            graph = builds.get('graph') or cls.build_graph(files=files)
+            graph.run(plans=builds.get('plans'))
+
+        def down():
+            # The containers' logs are removed with them.
+            try:
+                cls.archive_logs(files=files)
+            except Exception as e:
+                logger.warning("Could not archive the logs: %s" % e)
+            cls.shutdown(files=files)
+
+        steps = [
+            Step('stop', lambda: cls.stop_docker(files=files),
+                check=containers_running,
+                description="Stopping the running containers"),
+            Step('pull', lambda: cls.pull_from_docker_hub(files=files,
+                concurrency=concurrency), check=images_outdated,
+                description="Pulling images"),
+            Step('build', build, check=images_unbuilt,
+                description="Building the images whose context changed"),
+            Step('up', lambda: cls.start_api_server(files=files),
+                requires=['pull', 'build'], after=['stop'], inputs=up_inputs,
+                description="Building and starting the containers"),
+            Step('down', down, requires=['up'],
+                description="Archiving the logs and shutting down the "
+                    "containers"),
+        ]
+        return StepGraph(steps, StepState(state_dir / 'setup.json'))
 
     @classmethod
-    def setup(cls, files=None, flags=None):
+    @traced()
+    def setup(cls, files=None, flags=None, concurrency=None, force=False):
+        """
+        Sets up the containers, skipping the steps that are already up to
+        date unless `force` is set.  See setup_graph.
+        """
+        graph = cls.setup_graph(files=files, flags=flags,
+            concurrency=concurrency)
 
-        if not flags:
-            flags = cls.create_compose_flags(files=files)
+        # We will eventually want to secure things with SSH
+        # init_ssh_agent_forward()
+        # cls.start_database_server(files=files, flags=flags)
 
         with local.cwd(root_dir):
-            cls.stop_docker(flags=flags)
-            cls.pull_from_docker_hub(flags=flags)
+            ran = graph.run(force=force)
 
-            # We will eventually want to secure things with SSH
-            # init_ssh_agent_forward()
-            # cls.start_database_server()
+        if not ran:
+            print("\ncomp-community is already set up, nothing to do.")
+        else:
+            print("\nSuccessfully setup comp-community!")
 
-            cls.start_api_server()
+    @classmethod
+    @traced()
+    def archive_logs(cls, flags=None, files=None):
+        """
+        Appends the containers' logs to the archive in .comp/logs, so that
+        they can still be read with `comp logs --since` after the containers
+        are removed.  See archive.LogArchive.
+        """
+        from .archive import LogArchive, archive_logs
+
+        count = archive_logs(cls.get_backend(files=files, flags=flags),
+            LogArchive(state_dir / 'logs'))
+        logger.debug("Archived %d log line(s)" % count)
+        return count
 
-        docker_compose[flags + ['down']] & FG
-        print("\nSuccessfully setup comp-community!")
+    @classmethod
+    @traced()
+    def shutdown(cls, flags=None, files=None):
+        cls.get_backend(files=files, flags=flags).down()
 
     @classmethod
+    @traced()
     def start(cls, files=None, flags=None):
 
         if not flags:
             flags = cls.create_compose_flags(files=files)
 
         with local.cwd(root_dir):
-            cls.stop_docker(flag=flags)
+            cls.stop_docker(flags=flags)
 
             # We will eventually want to secure things with SSH
             # init_ssh_agent_forward()
 
     @classmethod
     def comp_community_check_for_updates(cls, files=None, flags=None):
-        return
+        """
+        Warns about any services whose images are out of date with the
+        registry, and returns them.
+        """
+        outdated = cls.containers_needing_update(files=files, flags=flags)
+        if outdated:
+            logger.warning("Updates available for: %s" % ", ".join(outdated))
+        return outdated
 
     @classmethod
+    @traced()
     def containers_needing_update(cls, files=None, flags=None):
-        return None
+        """
+        Returns the services whose local images are missing or whose digest
+        differs from the one the registry serves for their tag.  Registry
+        lookups are cached, see updates.UpdateChecker.
+        """
+        from .updates import UpdateChecker
+
+        checker = UpdateChecker(cls.get_backend(files=files, flags=flags))
+        return checker.services_needing_update()
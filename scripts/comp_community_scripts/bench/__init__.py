@@ -0,0 +1,8 @@
+"""
+End-to-end benchmarks of the comp subcommands, run against a docker-compose
+stand-in (see shim.py) so that the time spent in comp itself can be measured
+separately from the time spent in Docker.
+
+>>> python -m comp_community_scripts.bench --runs 20
+>>> python -m comp_community_scripts.bench --runs 20 --save-baseline
+"""
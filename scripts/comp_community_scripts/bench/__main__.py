@@ -0,0 +1,85 @@
+from __future__ import absolute_import, print_function
+
+import argparse
+import shutil
+import sys
+
+from .harness import (BENCHMARKS, DEFAULT_TOLERANCE, Harness,
+    compare_to_baseline, default_baseline_path, load_baseline, save_baseline)
+
+
+def report(name, result, stream=sys.stdout):
+    wall, overhead = result['wall'], result['overhead']
+    print("%-8s %3d calls  wall p50 %7.1f ms  overhead p50 %6.1f ms  "
+        "p90 %6.1f ms  p99 %6.1f ms" % (name, result['calls'],
+        wall['p50'] * 1000, overhead['p50'] * 1000, overhead['p90'] * 1000,
+        overhead['p99'] * 1000), file=stream)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m comp_community_scripts.bench',
+        description="Benchmarks comp's own overhead per subcommand against a "
+                    "docker-compose stand-in.")
+    parser.add_argument('benchmarks', nargs='*',
+        help="Benchmarks to run, out of %s (default: all)"
+             % ", ".join(sorted(BENCHMARKS)))
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--scenario',
+        help="JSON file of delays and outputs for each docker-compose subcommand")
+    parser.add_argument('--record', metavar='DOCKER_COMPOSE',
+        help="Forward to this real docker-compose and record its behavior "
+             "into --scenario, instead of replaying it")
+    parser.add_argument('--record-docker', metavar='DOCKER',
+        default=shutil.which('docker'),
+        help="The real docker that --record forwards docker commands to "
+             "(default: docker on the PATH)")
+    parser.add_argument('--baseline', default=default_baseline_path())
+    parser.add_argument('--save-baseline', action='store_true',
+        help="Store the results as the new baseline instead of comparing")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    options = parser.parse_args(argv)
+
+    if options.record and not options.scenario:
+        parser.error("--record requires --scenario to record into")
+    unknown = set(options.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error("unknown benchmarks: %s" % ", ".join(sorted(unknown)))
+
+    names = options.benchmarks or sorted(BENCHMARKS)
+    mode = 'record' if options.record else 'replay'
+    results = {}
+    with Harness(scenario=options.scenario, mode=mode,
+            real_compose=options.record,
+            real_docker=options.record_docker) as harness:
+        print("Shim startup: %.1f ms per call" % (harness.shim_startup * 1000))
+        for name in names:
+            runs = 1 if options.record else options.runs
+            results[name] = harness.benchmark(BENCHMARKS[name], runs=runs,
+                warmup=0 if options.record else 1)
+            report(name, results[name])
+
+    if options.record:
+        print("Recorded scenario to %s" % options.scenario)
+        return 0
+
+    if options.save_baseline:
+        save_baseline(options.baseline, results)
+        print("Saved baseline to %s" % options.baseline)
+        return 0
+
+    baseline = load_baseline(options.baseline)
+    if baseline is None:
+        print("No baseline at %s, run with --save-baseline to create one."
+            % options.baseline)
+        return 0
+
+    regressions = compare_to_baseline(results, baseline,
+        tolerance=options.tolerance)
+    for name, before, after in regressions:
+        print("REGRESSION %s: overhead p50 %.1f ms -> %.1f ms" % (
+            name, before * 1000, after * 1000))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
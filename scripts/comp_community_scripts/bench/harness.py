@@ -0,0 +1,218 @@
+from __future__ import absolute_import, print_function
+
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+
+from ..utils.cache import cache_dir, write_atomic
+
+
+__all__ = ('BENCHMARKS', 'Harness', 'percentile', 'compare_to_baseline', )
+
+
+# The comp invocations that are benchmarked, by name.
+BENCHMARKS = {
+    'help': ['--help'],
+    'setup': ['setup'],
+    'start': ['start'],
+    'migrate': ['migrate'],
+    'shell': ['shell'],
+}
+
+# A benchmark regresses when its median overhead grows by more than this
+# fraction of the baseline, plus a fixed slack to absorb noise on very fast
+# commands.
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_SLACK = 0.02
+
+SHIM_TEMPLATE = """#!/bin/sh
+export COMP_BENCH_BINARY=%(binary)s
+exec "%(python)s" -m comp_community_scripts.bench.shim "$@"
+"""
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a list of values.
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(int(round(pct / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(values):
+    return {
+        'runs': len(values),
+        'min': min(values),
+        'p50': percentile(values, 50),
+        'p90': percentile(values, 90),
+        'p99': percentile(values, 99),
+        'max': max(values),
+    }
+
+
+def default_baseline_path():
+    return os.environ.get('COMP_BENCH_BASELINE') or os.path.join(
+        cache_dir('bench'), 'baseline.json')
+
+
+class Harness(object):
+    """
+    Runs comp subcommands with the docker-compose shim first on the PATH.
+
+    The overhead of a run is its wall time minus the time the shim spent
+    "doing Docker work" (its simulated delays) and minus the shim's own
+    interpreter startup, which is calibrated once up front.  What is left is
+    the time spent in comp's orchestration layer.
+    """
+    def __init__(self, scenario=None, mode='replay', real_compose=None,
+            real_docker=None):
+        self.scenario = scenario
+        self.mode = mode
+        self.real_compose = real_compose
+        self.real_docker = real_docker
+        self.workdir = None
+        self.shim_startup = 0.0
+
+    def __enter__(self):
+        self.workdir = tempfile.mkdtemp(prefix='comp-bench-')
+        bin_dir = os.path.join(self.workdir, 'bin')
+        os.makedirs(bin_dir)
+        for binary in ('docker-compose', 'docker'):
+            path = os.path.join(bin_dir, binary)
+            with open(path, 'w') as f:
+                f.write(SHIM_TEMPLATE % {'binary': binary,
+                    'python': sys.executable})
+            os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        self.bin_dir = bin_dir
+        self.shim_startup = self.calibrate()
+        return self
+
+    def __exit__(self, *exc):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    @property
+    def record_path(self):
+        return os.path.join(self.workdir, 'calls.jsonl')
+
+    def env(self):
+        from ..base import root_dir
+        from ..compose import project_name
+
+        scripts_dir = os.path.realpath(
+            os.path.join(os.path.dirname(__file__), '..', '..'))
+        env = dict(os.environ)
+        env.update({
+            'PATH': os.pathsep.join([self.bin_dir, env.get('PATH', '')]),
+            'PYTHONPATH': os.pathsep.join(
+                [scripts_dir] + [p for p in [env.get('PYTHONPATH')] if p]),
+            'COMP_BENCH_RECORD': self.record_path,
+            'COMP_BENCH_MODE': self.mode,
+            'COMP_BENCH_PROJECT': project_name(root_dir),
+            # Never talk to a real daemon or registry while benchmarking.
+            'COMP_DOCKER_BACKEND': 'compose',
+            'DOCKER_HOST': 'unix://%s' % os.path.join(self.workdir, 'none.sock'),
+            'COMP_CACHE_DIR': os.path.join(self.workdir, 'cache'),
+            # Nor change what a real `comp` would find up to date.
+            'COMP_STATE_DIR': os.path.join(self.workdir, 'state'),
+        })
+        if self.scenario:
+            env['COMP_BENCH_SCENARIO'] = os.path.abspath(self.scenario)
+        if self.real_compose:
+            env['COMP_BENCH_REAL_COMPOSE'] = self.real_compose
+        if self.real_docker:
+            env['COMP_BENCH_REAL_DOCKER'] = self.real_docker
+        return env
+
+    def _calls(self):
+        if not os.path.exists(self.record_path):
+            return []
+        with open(self.record_path) as f:
+            calls = [json.loads(line) for line in f if line.strip()]
+        os.unlink(self.record_path)
+        return calls
+
+    def calibrate(self, runs=5):
+        """
+        Measures how long the shim takes to start up and exit when it has
+        nothing to do, outside of the time it records for itself.
+        """
+        env = self.env()
+        env['COMP_BENCH_SCENARIO'] = os.path.join(self.workdir, 'noop.json')
+        with open(env['COMP_BENCH_SCENARIO'], 'w') as f:
+            json.dump({'noop': {'delay': 0}}, f)
+
+        overheads = []
+        for _ in range(runs):
+            started = time.time()
+            subprocess.call([os.path.join(self.bin_dir, 'docker-compose'),
+                'noop'], env=env)
+            wall = time.time() - started
+            calls = self._calls()
+            overheads.append(wall - sum(c['end'] - c['start'] for c in calls))
+        return percentile(overheads, 50)
+
+    def run_once(self, args):
+        with open(os.devnull, 'w') as devnull:
+            started = time.time()
+            exit_code = subprocess.call(
+                [sys.executable, '-m', 'comp_community_scripts'] + args,
+                stdin=subprocess.DEVNULL, stdout=devnull, stderr=devnull,
+                env=self.env())
+            wall = time.time() - started
+
+        calls = self._calls()
+        docker_time = sum(c['end'] - c['start'] for c in calls)
+        overhead = wall - docker_time - len(calls) * self.shim_startup
+        return {'wall': wall, 'docker': docker_time, 'overhead': overhead,
+            'calls': len(calls), 'exit': exit_code}
+
+    def benchmark(self, args, runs=10, warmup=1):
+        for _ in range(warmup):
+            self.run_once(args)
+        samples = [self.run_once(args) for _ in range(runs)]
+        return {
+            'args': args,
+            'calls': samples[-1]['calls'],
+            'exit': samples[-1]['exit'],
+            'wall': summarize([s['wall'] for s in samples]),
+            'overhead': summarize([s['overhead'] for s in samples]),
+        }
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE,
+        slack=DEFAULT_SLACK):
+    """
+    Returns a list of (name, baseline p50, current p50) for every benchmark
+    whose median overhead regressed past the tolerance.
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        before = baseline[name]['overhead']['p50']
+        after = result['overhead']['p50']
+        if after > before * (1 + tolerance) + slack:
+            regressions.append((name, before, after))
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    write_atomic(path, json.dumps(results, indent=2, sort_keys=True))
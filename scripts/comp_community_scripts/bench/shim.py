@@ -0,0 +1,151 @@
+"""
+A stand-in for docker-compose (and docker) used by the benchmarks.
+
+The harness puts an executable named docker-compose on the PATH that runs
+this module.  Every invocation is appended to the JSON lines file in
+COMP_BENCH_RECORD, along with how long it took from the shim's point of view.
+
+In "replay" mode (the default), the output, exit code and delay of each
+subcommand come from the scenario in COMP_BENCH_SCENARIO, e.g.
+
+>>> {"pull": {"delay": 1.5, "stdout": "Pulling api ... done\\n", "exit": 0}}
+
+In "record" mode (COMP_BENCH_MODE=record), the command is forwarded to the
+real binary, in COMP_BENCH_REAL_COMPOSE or COMP_BENCH_REAL_DOCKER, and its
+output, exit code and duration are saved into the scenario, so that it can
+be replayed later.
+
+This module deliberately imports as little as possible, since its own
+startup time is part of what the harness has to subtract.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+# Used for subcommands that are not in the scenario.  The containers are
+# named and labeled after the project in COMP_BENCH_PROJECT, which the
+# harness sets to the benchmarked root's compose project name.
+DEFAULT_SCENARIO = {
+    'ps': {'delay': 0.05, 'stdout': "    Name     Command   State   Ports\n"
+        "-----------------------------------\n"
+        "%(project)s_api_1   ./run   Up   0.0.0.0:8000->8000/tcp\n"},
+    'stop': {'delay': 0.1, 'stdout': "Stopping %(project)s_api_1 ... done\n"},
+    'pull': {'delay': 0.2, 'stdout': "Pulling api ... done\n"},
+    'up': {'delay': 0.2, 'stdout': "Creating %(project)s_api_1 ... done\n"},
+    'down': {'delay': 0.1, 'stdout': "Removing %(project)s_api_1 ... done\n"},
+    'exec': {'delay': 0.1, 'stdout': "No migrations to apply.\n"},
+    'run': {'delay': 0.1},
+    'logs': {'delay': 0.05},
+    'docker ps': {'delay': 0.05, 'stdout': json.dumps({
+        'ID': 'c0ffee', 'Names': '%(project)s_api_1', 'State': 'running',
+        'Labels': 'com.docker.compose.project=%(project)s,'
+            'com.docker.compose.service=api'}) + "\n"},
+    'docker stop': {'delay': 0.1, 'stdout': "c0ffee\n"},
+    'docker events': {'delay': 0.15, 'stdout': json.dumps({
+        'Type': 'container', 'Action': 'die', 'Actor': {'ID': 'c0ffee',
+        'Attributes': {'name': '%(project)s_api_1', 'exitCode': '0'}}}) + "\n"},
+}
+
+DEFAULT_PROJECT = 'comp'
+
+FLAGS_WITH_VALUES = ('-f', '--file', '-p', '--project-name', '--format')
+
+
+def subcommand(argv):
+    """
+    >>> subcommand(['-f', 'docker-compose.yml', 'pull', 'api'])
+    >>> 'pull'
+    """
+    args = iter(argv)
+    for arg in args:
+        if arg in FLAGS_WITH_VALUES:
+            next(args, None)
+        elif not arg.startswith('-'):
+            return arg
+    return ''
+
+
+def default_scenario(project):
+    """
+    DEFAULT_SCENARIO, for the containers of the given compose project.
+    """
+    return dict((name, dict(step, stdout=step['stdout'] % {'project': project})
+        if 'stdout' in step else step)
+        for name, step in DEFAULT_SCENARIO.items())
+
+
+def load_scenario(path, project=DEFAULT_PROJECT):
+    scenario = default_scenario(project)
+    if path and os.path.exists(path):
+        with open(path) as f:
+            scenario.update(json.load(f))
+    return scenario
+
+
+def record(path, entry):
+    if path:
+        with open(path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def replay(step):
+    time.sleep(step.get('delay', 0))
+    sys.stdout.write(step.get('stdout', ''))
+    sys.stderr.write(step.get('stderr', ''))
+    sys.stdout.flush()
+    return step.get('exit', 0)
+
+
+def forward(real, argv, scenario_path, name):
+    import fcntl
+
+    started = time.time()
+    proc = subprocess.Popen([real] + argv, stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE, universal_newlines=True)
+    stdout, stderr = proc.communicate()
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+
+    step = {'delay': round(time.time() - started, 4), 'stdout': stdout,
+        'stderr': stderr, 'exit': proc.returncode}
+    # comp runs commands concurrently (e.g. pulls), whose shims would
+    # otherwise overwrite each other's updates of the scenario.
+    with open(scenario_path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        scenario = {}
+        if os.path.exists(scenario_path):
+            with open(scenario_path) as f:
+                scenario = json.load(f)
+        scenario[name] = step
+        with open(scenario_path, 'w') as f:
+            json.dump(scenario, f, indent=2, sort_keys=True)
+    return proc.returncode
+
+
+def main(argv=None):
+    started = time.time()
+    argv = list(sys.argv[1:] if argv is None else argv)
+    binary = os.environ.get('COMP_BENCH_BINARY', 'docker-compose')
+    name = subcommand(argv)
+    key = name if binary == 'docker-compose' else '%s %s' % (binary, name)
+    scenario_path = os.environ.get('COMP_BENCH_SCENARIO')
+
+    if os.environ.get('COMP_BENCH_MODE') == 'record':
+        real = os.environ['COMP_BENCH_REAL_DOCKER' if binary == 'docker'
+            else 'COMP_BENCH_REAL_COMPOSE']
+        exit_code = forward(real, argv, scenario_path, key)
+    else:
+        project = os.environ.get('COMP_BENCH_PROJECT') or DEFAULT_PROJECT
+        exit_code = replay(load_scenario(scenario_path, project).get(key, {}))
+
+    record(os.environ.get('COMP_BENCH_RECORD'), {
+        'binary': binary, 'subcommand': key, 'argv': argv,
+        'start': started, 'end': time.time(), 'exit': exit_code})
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
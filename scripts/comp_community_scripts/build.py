@@ -0,0 +1,521 @@
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+import re
+import stat
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .compose import _as_mapping
+from .utils.cache import cache_dir, write_atomic
+from .utils.exceptions import CompCommandError
+from .utils.logging import get_logger
+
+
+__all__ = ('DockerIgnore', 'BuildContext', 'ContextHasher', 'ImageBuilder',
+    'build_contexts', 'context_tarball', 'CONTEXT_LABEL', )
+
+
+logger = get_logger()
+
+
+# The label images built by comp carry the hash of their build context in,
+# which is how an unchanged context is recognized without sending it.
+CONTEXT_LABEL = 'com.comp-community.context-hash'
+
+# Files are hashed in batches of about this many bytes, so that a context of
+# many small files is not hashed one thread hop per file.
+HASH_BATCH_BYTES = 8 * 1024 * 1024
+
+# Files modified this recently (in nanoseconds) are not added to the stat
+# cache, since a change made within the same timestamp granularity would not
+# change their mtime.
+RACY_NANOSECONDS = 2 * 10 ** 9
+
+CHUNK_BYTES = 64 * 1024
+
+OUTSIDE_DOCKERFILE = '.comp.Dockerfile'
+
+
+def _translate(pattern):
+    """
+    Translates a .dockerignore pattern into a regular expression, following
+    Docker's rules: `*` and `?` do not match separators, `**` matches any
+    number of directories, and a pattern that matches a directory matches
+    everything in it.
+    """
+    regex, i = '', 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '*':
+            if pattern[i:i + 2] == '**':
+                i += 1
+                if pattern[i + 1:i + 2] == '/':
+                    i += 1
+                    regex += '(?:.*/)?'
+                else:
+                    regex += '.*'
+            else:
+                regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif c == '\\' and i + 1 < len(pattern):
+            i += 1
+            regex += re.escape(pattern[i])
+        elif c == '[':
+            end = pattern.find(']', i + 1)
+            if end == -1:
+                regex += re.escape(c)
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                regex += '[%s]' % body.replace('\\', '\\\\')
+                i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+    return re.compile(r'^%s(?:/.*)?$' % regex)
+
+
+class DockerIgnore(object):
+    """
+    The patterns of a build context's .dockerignore.
+
+    >>> ignore = DockerIgnore(['**/*.py[co]', '.git', '!keep.pyc'])
+    >>> ignore.excluded('api/views.pyc')
+    >>> True
+    >>> ignore.excluded('keep.pyc')
+    >>> False
+
+    A pattern without `**` only matches from the context's root, as with
+    Docker, e.g. `*.pyc` does not exclude api/views.pyc.
+
+    As with Docker, the last pattern that matches a path decides, and a `!`
+    pattern brings back what an earlier pattern excluded.
+    """
+    def __init__(self, patterns=()):
+        self.patterns = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            exception = pattern.startswith('!')
+            if exception:
+                pattern = pattern[1:].strip()
+            pattern = os.path.normpath(pattern).lstrip('/')
+            if pattern in ('', '.'):
+                continue
+            self.patterns.append((_translate(pattern), exception))
+        self.has_exceptions = any(e for _, e in self.patterns)
+
+    @classmethod
+    def load(cls, context, dockerfile=None):
+        """
+        Reads the context's .dockerignore, or the Dockerfile's own
+        (<Dockerfile>.dockerignore) when there is one, as BuildKit does.
+        """
+        paths = [os.path.join(context, '.dockerignore')]
+        if dockerfile:
+            paths.insert(0, dockerfile + '.dockerignore')
+        for path in paths:
+            try:
+                with open(path) as f:
+                    return cls(f.read().splitlines())
+            except (IOError, OSError):
+                continue
+        return cls()
+
+    def excluded(self, path):
+        excluded = False
+        for regex, exception in self.patterns:
+            if excluded == exception and regex.match(path):
+                excluded = not exception
+        return excluded
+
+
+class BuildContext(object):
+    """
+    What a service's image is built from: the context directory, the
+    Dockerfile, and the build options of its compose file that change the
+    image.
+    """
+    def __init__(self, service, path, dockerfile='Dockerfile', tag=None,
+            args=None, target=None, labels=None):
+        self.service = service
+        self.path = os.path.normpath(str(path))
+        self.dockerfile = os.path.normpath(os.path.join(self.path, dockerfile))
+        self.tag = tag or service
+        self.args = args or {}
+        self.target = target
+        self.labels = labels or {}
+
+    @property
+    def dockerfile_inside(self):
+        return self.dockerfile.startswith(self.path + os.sep)
+
+    @property
+    def dockerfile_name(self):
+        """
+        The Dockerfile relative to the context, as the daemon expects it.  A
+        Dockerfile from outside the context is sent along with it under a
+        name of its own, as the Docker CLI does.
+        """
+        if not self.dockerfile_inside:
+            return OUTSIDE_DOCKERFILE
+        return os.path.relpath(self.dockerfile, self.path).replace(os.sep, '/')
+
+    @property
+    def base_images(self):
+        """
+        The images the Dockerfile's stages are built FROM, except for the
+        stages it builds itself.
+        """
+        images, stages = [], set()
+        try:
+            with open(self.dockerfile) as f:
+                lines = f.read().splitlines()
+        except (IOError, OSError):
+            return images
+        for line in lines:
+            match = re.match(r'^\s*FROM\s+(?:--\S+\s+)*(\S+)(?:\s+AS\s+(\S+))?',
+                line, re.IGNORECASE)
+            if match:
+                if match.group(1).lower() not in stages:
+                    images.append(match.group(1))
+                if match.group(2):
+                    stages.add(match.group(2).lower())
+        return images
+
+    def files(self):
+        """
+        The paths in the context that are sent to the daemon, relative to the
+        context, in a stable order, with their lstat.  The Dockerfile and the
+        .dockerignore are always sent, as the Docker CLI does.
+        """
+        ignore = DockerIgnore.load(self.path, self.dockerfile)
+        always = set(['.dockerignore', self.dockerfile_name])
+        entries = []
+
+        def walk(directory, prefix):
+            try:
+                children = sorted(os.scandir(directory), key=lambda e: e.name)
+            except OSError as e:
+                raise CompCommandError("Could not read the build context of "
+                    "%s: %s" % (self.service, e))
+            for child in children:
+                relative = prefix + child.name
+                st = child.stat(follow_symlinks=False)
+                excluded = relative not in always and ignore.excluded(relative)
+                if stat.S_ISDIR(st.st_mode):
+                    # Excluded directories are only walked when an exception
+                    # could bring back something inside them.
+                    if excluded and not ignore.has_exceptions:
+                        continue
+                    if not excluded:
+                        entries.append((relative, st))
+                    walk(child.path, relative + '/')
+                elif not excluded:
+                    entries.append((relative, st))
+
+        walk(self.path, '')
+        return entries
+
+    def __repr__(self):
+        return "BuildContext(%r, %r)" % (self.service, self.path)
+
+
+class StatCache(object):
+    """
+    The content hashes of a context's files by path, with the mtime, inode
+    and size they had when they were hashed, so that only the files that
+    changed since are read again.
+    """
+    def __init__(self, context):
+        key = hashlib.sha1(context.encode('utf-8')).hexdigest()[:16]
+        self.path = os.path.join(cache_dir('build'), '%s.json' % key)
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.entries = {}
+        self.dirty = False
+
+    @staticmethod
+    def _signature(st):
+        return [st.st_mtime_ns, st.st_ino, st.st_size]
+
+    def get(self, path, st):
+        entry = self.entries.get(path)
+        if entry and entry[:3] == self._signature(st):
+            return entry[3]
+        return None
+
+    def set(self, path, st, digest, now_ns):
+        if now_ns - st.st_mtime_ns < RACY_NANOSECONDS:
+            return
+        self.entries[path] = self._signature(st) + [digest]
+        self.dirty = True
+
+    def save(self, paths):
+        # Files no longer in the context are forgotten.
+        stale = set(self.entries) - set(paths)
+        for path in stale:
+            del self.entries[path]
+        if self.dirty or stale:
+            write_atomic(self.path, json.dumps(self.entries))
+
+
+def _hash_files(paths):
+    digests = []
+    for path in paths:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        digests.append(digest.hexdigest())
+    return digests
+
+
+class ContextHasher(object):
+    """
+    Hashes build contexts the way the daemon would see them: only the files
+    .dockerignore lets through, by path, content, type and mode, along with
+    the build options.
+
+    >>> ContextHasher().hash(context)
+    >>> 'c0ffee...'
+
+    Files whose mtime, inode and size did not change since they were last
+    hashed are not read again (see StatCache), and the rest are read by a
+    pool of threads, which hashlib lets run in parallel.
+    """
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) * 2)
+        self.hashed = 0
+
+    def hash(self, context, executor=None):
+        now_ns = int(time.time() * 1e9)
+        cache = StatCache(context.path)
+        entries = context.files()
+        digests = {}
+        batches, batch, batch_bytes = [], [], 0
+        for relative, st in entries:
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            digest = cache.get(relative, st)
+            if digest is not None:
+                digests[relative] = digest
+                continue
+            batch.append(relative)
+            batch_bytes += st.st_size
+            if batch_bytes >= HASH_BATCH_BYTES:
+                batches.append(batch)
+                batch, batch_bytes = [], 0
+        if batch:
+            batches.append(batch)
+
+        if batches:
+            own = executor is None
+            executor = executor or ThreadPoolExecutor(
+                max_workers=self.max_workers)
+            try:
+                futures = [(b, executor.submit(_hash_files,
+                    [os.path.join(context.path, p) for p in b]))
+                    for b in batches]
+                for batch, future in futures:
+                    for relative, digest in zip(batch, future.result()):
+                        digests[relative] = digest
+            except (IOError, OSError) as e:
+                raise CompCommandError("Could not hash the build context of "
+                    "%s: %s" % (context.service, e))
+            finally:
+                if own:
+                    executor.shutdown(wait=True)
+            stats = dict(entries)
+            for batch in batches:
+                for relative in batch:
+                    cache.set(relative, stats[relative], digests[relative],
+                        now_ns)
+                self.hashed += len(batch)
+        cache.save([relative for relative, _ in entries])
+
+        digest = hashlib.sha256()
+        digest.update(json.dumps([context.dockerfile_name, context.args,
+            context.target, context.labels], sort_keys=True).encode('utf-8'))
+        if not context.dockerfile_inside:
+            digest.update(_hash_files([context.dockerfile])[0].encode('ascii'))
+        for relative, st in entries:
+            if stat.S_ISREG(st.st_mode):
+                content = digests[relative]
+            elif stat.S_ISLNK(st.st_mode):
+                content = os.readlink(os.path.join(context.path, relative))
+            else:
+                content = ''
+            digest.update(('%s\0%o\0%s\n' % (relative, st.st_mode,
+                content)).encode('utf-8', 'surrogateescape'))
+        return digest.hexdigest()
+
+    def hash_all(self, contexts):
+        """
+        Hashes the contexts at once, with one pool of threads shared by all
+        of them, and returns their hashes by service.
+        """
+        hashes = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as files:
+            with ThreadPoolExecutor(max_workers=len(contexts) or 1) as walkers:
+                futures = dict((c.service, walkers.submit(self.hash, c, files))
+                    for c in contexts)
+                for service, future in futures.items():
+                    hashes[service] = future.result()
+        return hashes
+
+
+def context_tarball(context):
+    """
+    Yields the context as an uncompressed tar stream, in chunks, for the
+    body of a build request.  The tar is written by a thread into a pipe as
+    it is read, so the context is never held in memory.
+    """
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def write():
+        try:
+            with os.fdopen(write_fd, 'wb') as pipe:
+                with tarfile.open(fileobj=pipe, mode='w|') as tar:
+                    for relative, _ in context.files():
+                        tar.add(os.path.join(context.path, relative),
+                            arcname=relative, recursive=False)
+                    if not context.dockerfile_inside:
+                        tar.add(context.dockerfile, arcname=OUTSIDE_DOCKERFILE)
+        except Exception as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=write, name='tar %s' % context.service)
+    writer.daemon = True
+    writer.start()
+    with os.fdopen(read_fd, 'rb') as pipe:
+        for chunk in iter(lambda: pipe.read(CHUNK_BYTES), b''):
+            yield chunk
+    writer.join()
+    if errors:
+        raise CompCommandError("Could not send the build context of %s: %s"
+            % (context.service, errors[0]))
+
+
+def _build_args(args):
+    """
+    A service's build args, where those without a value are taken from the
+    environment, or left out if it does not have them.
+    """
+    args = _as_mapping(args)
+    for key, value in list(args.items()):
+        if value is None:
+            value = os.environ.get(key)
+        if value is None:
+            del args[key]
+        else:
+            args[key] = str(value)
+    return args
+
+
+def build_contexts(model):
+    """
+    The BuildContext of every service of a compose.ComposeModel that is
+    built locally.  Images are tagged the way docker-compose names them, so
+    that `up` uses them rather than building again.
+    """
+    from .compose import project_name
+
+    contexts = []
+    for name, config in sorted(model.services.items()):
+        build = config.get('build')
+        if not build:
+            continue
+        if not isinstance(build, dict):
+            build = {'context': build}
+        contexts.append(BuildContext(name,
+            os.path.join(model.root, build.get('context', '.')),
+            dockerfile=build.get('dockerfile', 'Dockerfile'),
+            # docker-compose 1.16 names built images <project>_<service>,
+            # with the project normalized as project_name does.
+            tag=config.get('image') or '%s_%s' % (project_name(model.root),
+                name),
+            args=_build_args(build.get('args')),
+            target=build.get('target'),
+            labels=_as_mapping(build.get('labels'))))
+    return contexts
+
+
+class ImageBuilder(object):
+    """
+    Builds the images of the services whose build context changed since
+    their image was built, concurrently, except for images built FROM
+    another service's image, which wait for it.
+
+    >>> builder = ImageBuilder(backend, build_contexts(model))
+    >>> graph = builder.graph(StepState(state_dir / 'build.json'))
+    >>> graph.run()
+
+    Whether an image is up to date is decided by the context hash it is
+    labeled with (see CONTEXT_LABEL), so unchanged contexts are never sent
+    to the daemon, however the image was removed or rebuilt in between.
+    """
+    def __init__(self, backend, contexts, hasher=None, force=False):
+        self.backend = backend
+        self.contexts = contexts
+        self.hasher = hasher or ContextHasher()
+        self.force = force
+        self._hashes = None
+        self._lock = threading.Lock()
+
+    def context_hash(self, context):
+        with self._lock:
+            if self._hashes is None:
+                self._hashes = self.hasher.hash_all(self.contexts)
+            return self._hashes[context.service]
+
+    def outdated(self, context):
+        """
+        Returns why the service's image has to be built, if it does.
+        """
+        if self.force:
+            return "forced"
+        labels = self.backend.image_labels(context.tag)
+        if labels is None:
+            return "%s does not exist" % context.tag
+        built = labels.get(CONTEXT_LABEL)
+        if built is None:
+            return "%s was not built by comp" % context.tag
+        if built != self.context_hash(context):
+            return "build context changed"
+        return None
+
+    def build(self, context):
+        labels = dict(context.labels)
+        labels[CONTEXT_LABEL] = self.context_hash(context)
+        prefix = '%s | ' % context.service
+        self.backend.build(context, labels=labels,
+            log=lambda line: logger.debug(prefix + line))
+        logger.info("Built %s" % context.tag)
+
+    def dependencies(self, context):
+        tags = dict((c.tag, c.service) for c in self.contexts)
+        return [tags[image] for image in context.base_images
+            if tags.get(image) not in (None, context.service)]
+
+    def graph(self, state, max_workers=None):
+        from .steps import Step, StepGraph
+
+        steps = [Step(context.service, lambda c=context: self.build(c),
+            requires=self.dependencies(context),
+            check=lambda c=context: self.outdated(c),
+            description="Building %s" % context.tag)
+            for context in self.contexts]
+        return StepGraph(steps, state,
+            max_workers=max_workers or max(1, len(steps)))
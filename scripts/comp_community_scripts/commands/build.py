@@ -0,0 +1,61 @@
+from __future__ import absolute_import
+
+import time
+
+from plumbum import cli
+
+from ..base import CompositionApplication
+from ..utils.exceptions import CompCommandError
+
+
+__all__ = ('CompositionBuild', )
+
+
+class CompositionBuild(CompositionApplication):
+    """
+    Builds the images of the services (or the ones given) whose build
+    context changed since they were last built, concurrently.
+
+    >>> comp build
+    >>> comp build --dry-run api
+
+    A context is hashed from the files its .dockerignore lets through, and
+    the hash is kept as a label on the image, so that an unchanged context
+    is not even sent to the daemon.
+    """
+    force = cli.Flag("--force", default=False,
+        help="Build every image, even the ones that are up to date")
+    dry_run = cli.Flag(["-n", "--dry-run"], default=False,
+        help="Only show which images would be built, and why")
+    jobs = cli.SwitchAttr(["-j", "--jobs"], int, default=None,
+        help="How many images to build at once, all of them by default")
+
+    def main(self, *services):
+        started = time.time()
+        try:
+            graph = self.build_graph(services=services, force=self.force,
+                jobs=self.jobs)
+            plans = graph.plan()
+        except CompCommandError as e:
+            self.error(str(e))
+            return 1
+
+        unknown = set(services) - set(p.step.name for p in plans)
+        if unknown:
+            self.error("No images are built for %s" % ", ".join(sorted(unknown)))
+            return 1
+        for plan in plans:
+            self.write(str(plan), color=self.NOTICE if plan.run
+                else self.DARKGRAY)
+        if self.dry_run:
+            return 0
+
+        try:
+            ran = graph.run(plans=plans)
+        except CompCommandError as e:
+            self.error(str(e))
+            return 1
+        self.divide()
+        self.success("%d image(s) built, %d up to date, in %.1fs" % (len(ran),
+            len(plans) - len(ran), time.time() - started))
+        return 0
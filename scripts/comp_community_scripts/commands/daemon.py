@@ -0,0 +1,47 @@
+from __future__ import absolute_import
+
+from plumbum import cli
+
+from ..utils.terminal import StdoutMixin
+
+
+__all__ = ('CompositionDaemon', )
+
+
+class CompositionDaemon(StdoutMixin, cli.Application):
+    """
+    Runs a resident comp process that later `comp` invocations hand their
+    commands to, so that they start without re-importing and re-checking
+    everything.
+
+    The daemon runs in the foreground until it is stopped with Ctrl-C or
+    `comp daemon --stop`.  Set COMP_NO_DAEMON to bypass it.
+    """
+    stop = cli.Flag("--stop", default=False, help="Stop the running daemon")
+    status = cli.Flag("--status", default=False,
+        help="Report whether a daemon is running")
+
+    def main(self):
+        from ..daemon import daemon_status, serve, socket_path, stop_daemon
+
+        if self.stop:
+            if not stop_daemon():
+                self.warn("No comp daemon is running.")
+                return 1
+            self.success("Stopped the comp daemon.")
+            return 0
+
+        if self.status:
+            pid = daemon_status()
+            if pid is None:
+                self.write("No comp daemon is running.")
+                return 1
+            self.write("comp daemon is running on %s (pid %s)."
+                % (socket_path(), pid))
+            return 0
+
+        try:
+            serve()
+        except RuntimeError as e:
+            self.error(str(e))
+            return 1
@@ -0,0 +1,145 @@
+from __future__ import absolute_import
+
+import datetime
+import time
+
+from plumbum import cli
+
+from ..base import CompositionApplication, root_dir, state_dir
+from ..utils.exceptions import CompCommandError
+from ..utils.logging import get_logger
+
+
+__all__ = ('CompositionDatabase', 'CompositionDatabaseSnapshot',
+    'CompositionDatabaseRestore', 'CompositionDatabaseDelete', )
+
+
+logger = get_logger()
+
+
+class DatabaseCommand(CompositionApplication):
+
+    database = cli.SwitchAttr("--database", str, default=None,
+        help="The api's SQLite database, www/api/apps/db.sqlite3 by default "
+            "(or COMP_API_DATABASE)")
+
+    @property
+    def database_path(self):
+        from ..snapshots import database_path
+
+        return self.database or database_path(root_dir)
+
+    @property
+    def store(self):
+        from ..snapshots import SnapshotStore
+
+        return SnapshotStore(state_dir / 'db')
+
+
+class CompositionDatabase(DatabaseCommand):
+    """
+    Snapshots and restores the api's SQLite database, so that it can be
+    reset between test runs without migrating and seeding it again.
+
+    >>> comp db snapshot seeded
+    >>> comp db restore seeded
+
+    Without a command, lists the snapshots.
+    """
+    def main(self, *args):
+        if args:
+            self.error("Unknown command %r, see `comp db --help`" % args[0])
+            return 1
+        if self.nested_command:
+            return
+
+        snapshots = self.store.all()
+        if not snapshots:
+            self.notice("There are no snapshots, see `comp db snapshot`.")
+            return 0
+        width = max(len(s.name) for s in snapshots)
+        for snapshot in snapshots:
+            created = datetime.datetime.fromtimestamp(snapshot.created)
+            self.write("%s  %s  %8.1f MB  %s" % (snapshot.name.ljust(width),
+                created.strftime('%Y-%m-%d %H:%M'), snapshot.size / 1e6,
+                snapshot.digest[:12]))
+
+
+class CompositionDatabaseSnapshot(DatabaseCommand):
+    """
+    Takes a snapshot of the api's database, which can be done while the api
+    is running.  A snapshot of the same name is replaced.
+    """
+    def main(self, name):
+        from ..migrations import migration_fingerprints
+
+        started = time.time()
+        try:
+            snapshot = self.store.snapshot(name, self.database_path,
+                migrations=migration_fingerprints(root_dir / 'www' / 'api'))
+        except CompCommandError as e:
+            self.error(str(e))
+            return 1
+        self.success("Took snapshot %s of %s (%.1f MB) in %.2fs" % (name,
+            self.database_path, snapshot.size / 1e6, time.time() - started))
+        return 0
+
+
+class CompositionDatabaseRestore(DatabaseCommand):
+    """
+    Replaces the api's database with a snapshot.
+
+    The api must be stopped first (e.g. `docker-compose stop api`): it keeps
+    the database open, and would go on using the one that was replaced.
+    """
+    def api_running(self):
+        try:
+            containers = self.get_backend().container_states()
+        except CompCommandError as e:
+            # Without a daemon to ask, nothing is running.
+            logger.debug("Could not list the containers: %s" % e)
+            return False
+        return any(c.service == 'api' for c in containers)
+
+    def main(self, name):
+        from ..migrations import forget_migrations, migration_fingerprints
+
+        if self.api_running():
+            self.error("The api is running with the database open, stop it "
+                "first with `docker-compose stop api`.")
+            return 1
+
+        started = time.time()
+        try:
+            snapshot = self.store.restore(name, self.database_path)
+        except CompCommandError as e:
+            self.error(str(e))
+            return 1
+        # The restored database has the migrations of the snapshot, not the
+        # ones `comp migrate` last applied.
+        forget_migrations(state_dir / 'migrate.json', self.database_path)
+        self.success("Restored %s into %s in %.2fs" % (name,
+            self.database_path, time.time() - started))
+
+        migrations = migration_fingerprints(root_dir / 'www' / 'api')
+        if snapshot.migrations is not None and snapshot.migrations != migrations:
+            self.warn("The migrations changed since the snapshot was taken, "
+                "run `comp migrate`.")
+        return 0
+
+
+class CompositionDatabaseDelete(DatabaseCommand):
+    """
+    Deletes a snapshot.
+    """
+    def main(self, name):
+        if not self.store.delete(name):
+            self.error("There is no snapshot named %r" % name)
+            return 1
+        self.success("Deleted snapshot %s" % name)
+        return 0
+
+
+CompositionDatabase.subcommand("snapshot", CompositionDatabaseSnapshot)
+CompositionDatabase.subcommand("restore", CompositionDatabaseRestore)
+CompositionDatabase.subcommand("delete", CompositionDatabaseDelete)
@@ -0,0 +1,60 @@
+from __future__ import absolute_import
+
+import time
+
+from plumbum import cli
+
+from ..base import root_dir
+from ..utils.terminal import StdoutMixin
+
+
+__all__ = ('CompositionDoctor', )
+
+
+class CompositionDoctor(StdoutMixin, cli.Application):
+    """
+    Checks that everything comp-community needs is installed and set up,
+    and shows what to do about anything that is not.
+
+    The checks run concurrently, and the ones that passed before are not run
+    again until the binaries or files they looked at change, see
+    `comp doctor --no-cache`.
+    """
+    no_cache = cli.Flag("--no-cache", default=False,
+        help="Run every check, even the ones whose results are cached")
+    verbose = cli.Flag(["-v", "--verbose"], default=False,
+        help="Show how long each check took")
+
+    def main(self):
+        from ..doctor import CheckResult, Doctor, default_checks
+
+        started = time.time()
+        results = Doctor(default_checks(root_dir),
+            use_cache=not self.no_cache).run()
+
+        width = max(len(r.check.name) for r in results)
+        colors = {
+            CheckResult.OK: self.SUCCESS,
+            CheckResult.FAILED: self.ERROR,
+            CheckResult.TIMEOUT: self.WARNING,
+        }
+        for result in results:
+            status = 'cached' if result.cached else result.status
+            line = "%s  %-7s %s" % (result.check.name.ljust(width), status,
+                result.detail or '')
+            if self.verbose and not result.cached:
+                line += "  (%.0f ms)" % ((result.elapsed or 0) * 1000)
+            self.write(line, color=colors[result.status])
+            if result.hint:
+                self.write("%s  %-7s %s" % (''.ljust(width), '', result.hint),
+                    color=self.DARKGRAY)
+
+        failed = [r for r in results if not r.ok]
+        self.divide()
+        summary = "%d check(s), %d failed, in %.0f ms" % (len(results),
+            len(failed), (time.time() - started) * 1000)
+        if failed:
+            self.error(summary)
+            return 1
+        self.success(summary)
+        return 0
@@ -0,0 +1,122 @@
+from __future__ import absolute_import
+
+import os
+import time
+
+from plumbum import cli
+
+from ..app_ports import app_ports
+from ..base import CompositionApplication, state_dir
+
+
+__all__ = ('CompositionLoadTest', )
+
+
+class CompositionLoadTest(CompositionApplication):
+    """
+    Load tests the API with a mix of requests, and reports the latency
+    percentiles and throughput.  Results are saved as JSON (in
+    .comp/loadtest by default), so that runs can be compared.
+
+    >>> comp loadtest -r 'GET /api/v1/health/ 3' -r 'GET /api/v1/songs/' \\
+    >>>     --concurrency 64 --duration 30
+    >>> comp loadtest --rate 200 --compare .comp/loadtest/1528000000.json
+
+    Without --rate, each connection sends its next request as soon as the
+    previous one is answered (closed-loop).  With it, requests are sent at
+    that rate regardless of the responses (open-loop), and latencies count
+    from when each request was due.
+    """
+    url = cli.SwitchAttr("--url", str, default=None,
+        help="The API's base URL (by default, the API on localhost)")
+    requests = cli.SwitchAttr(["-r", "--request"], str, list=True,
+        help="A request of the mix, as '[METHOD] PATH [WEIGHT]' (can be given "
+            "several times)")
+    mix = cli.SwitchAttr("--mix", cli.ExistingFile, default=None,
+        help="A JSON file with the mix of requests, as a list of objects "
+            "with a method, path, and optionally weight, body and headers")
+    concurrency = cli.SwitchAttr(["-c", "--concurrency"], int, default=16,
+        help="How many connections to use at once")
+    duration = cli.SwitchAttr(["-d", "--duration"], float, default=10,
+        help="How many seconds to send requests for")
+    rate = cli.SwitchAttr("--rate", float, default=None,
+        help="Send this many requests per second (open-loop)")
+    timeout = cli.SwitchAttr("--timeout", float, default=30,
+        help="Seconds before a request is given up on")
+    output = cli.SwitchAttr(["-o", "--output"], str, default=None,
+        help="Where to save the results")
+    compare = cli.SwitchAttr("--compare", cli.ExistingFile, default=None,
+        help="The results of a previous run to compare against")
+    stand_in = cli.SwitchAttr("--stand-in", float, default=None,
+        help="Test against a local stand-in server that answers after this "
+            "many milliseconds, instead of the API")
+
+    def report(self, result, previous=None):
+        latencies = result.latencies()
+        before = previous.latencies() if previous else {}
+
+        def line(label, value, old, unit, lower_is_better=True, fmt='%10.2f'):
+            text = ("%-12s " + fmt + " %s") % (label, value or 0, unit)
+            if old:
+                change = ((value or 0) - old) / old * 100
+                better = change < 0 if lower_is_better else change > 0
+                text += "   (%+.1f%% vs %.2f)" % (change, old)
+                self.write(text, color=self.SUCCESS if better else self.ERROR)
+            else:
+                self.write(text)
+
+        self.heading("%s, %s-loop, %d connection(s)%s" % (
+            result.config['url'], result.config['mode'],
+            result.config['concurrency'],
+            ", %g req/s" % result.config['rate'] if result.config['rate'] else ''),
+            divider=True)
+        line('requests', result.requests,
+            previous.requests if previous else None, '', False, fmt='%10d')
+        line('throughput', result.throughput,
+            previous.throughput if previous else None, 'req/s', False)
+        for key in ('mean', 'p50', 'p90', 'p99', 'p999', 'max'):
+            line(key, latencies[key], before.get(key), 'ms')
+        self.write("statuses     %s" % (", ".join("%s: %d" % item
+            for item in sorted(result.statuses.items())) or '-'))
+        if result.errors:
+            self.error("errors       %s" % ", ".join("%s: %d" % item
+                for item in sorted(result.errors.items())))
+
+    def main(self):
+        from ..loadtest import LoadTest, LoadTestResult, RequestSpec, StandInServer
+
+        try:
+            mix = [RequestSpec.parse(r) for r in self.requests or []]
+            if self.mix:
+                mix += RequestSpec.load(self.mix)
+        except (ValueError, TypeError) as e:
+            self.error("Invalid request mix: %s" % e)
+            return 1
+        mix = mix or [RequestSpec('GET', '/')]
+
+        previous = LoadTestResult.load(self.compare) if self.compare else None
+        server = None
+        if self.stand_in is not None:
+            server = StandInServer(delay=self.stand_in / 1000.0).start()
+        url = server.url if server else (
+            self.url or 'http://localhost:%d' % app_ports['api'])
+
+        self.notice("Load testing %s for %gs..." % (url, self.duration))
+        try:
+            result = LoadTest(url, mix, concurrency=self.concurrency,
+                duration=self.duration, rate=self.rate,
+                timeout=self.timeout).run()
+        except KeyboardInterrupt:
+            return 1
+        finally:
+            if server is not None:
+                server.stop()
+
+        self.report(result, previous)
+        output = self.output or str(state_dir / 'loadtest' / (
+            '%d.json' % time.time()))
+        if not os.path.isdir(os.path.dirname(os.path.abspath(output))):
+            os.makedirs(os.path.dirname(os.path.abspath(output)))
+        result.save(output)
+        self.success("Saved the results to %s" % output)
+        return 1 if result.errors else 0
@@ -0,0 +1,127 @@
+from __future__ import absolute_import
+
+import re
+import sys
+
+from plumbum import cli
+
+from ..base import CompositionApplication, state_dir
+from ..utils.exceptions import CompCommandError
+from ..utils.logging import get_logger
+
+
+__all__ = ('CompositionLogs', )
+
+
+logger = get_logger()
+
+
+class CompositionLogs(CompositionApplication):
+    """
+    Shows the logs of the composition's services (or the ones given), merged
+    in the order they were written.
+
+    >>> comp logs --follow --level warning api celery
+    >>> comp logs --grep 'Traceback|Exception' --tail 1000
+
+    With --since or --until, the logs are read from the archive instead (in
+    .comp/logs, written before `comp setup` takes the containers down, or
+    with --archive), which keeps them after the containers are removed.
+
+    >>> comp logs --since 2h --until 90m --service api
+    """
+    follow = cli.Flag(["-f", "--follow"], default=False,
+        help="Keep following the logs as they are written")
+    tail = cli.SwitchAttr("--tail", int, default=100,
+        help="How many lines to show from the end of each service's log")
+    grep = cli.SwitchAttr("--grep", str, default=None,
+        help="Only show lines matching the regular expression")
+    level = cli.SwitchAttr("--level", str, default=None,
+        help="Only show lines of at least this level (debug, info, warning, "
+            "error or critical)")
+    timestamps = cli.Flag(["-t", "--timestamps"], default=False,
+        help="Show when each line was written")
+    no_color = cli.Flag("--no-color", default=False,
+        help="Do not color the services' names")
+    buffer = cli.SwitchAttr("--buffer", int, default=None,
+        help="How many lines of each service to buffer before waiting for "
+            "them to be written")
+    since = cli.SwitchAttr("--since", str, default=None,
+        help="Show the archived logs since a time, either relative (30m, 2h, "
+            "1d) or absolute (2018-06-02T17:41:09, in UTC)")
+    until = cli.SwitchAttr("--until", str, default=None,
+        help="Show the archived logs until a time, like --since")
+    service = cli.SwitchAttr("--service", str, list=True,
+        help="Only show the logs of this service (can be given several times)")
+    archive = cli.Flag("--archive", default=False,
+        help="Archive the containers' logs, without showing them")
+
+    def log_archive(self):
+        from ..archive import LogArchive
+
+        return LogArchive(state_dir / 'logs')
+
+    def show_archived(self, services, log_filter, color):
+        from ..archive import parse_time
+        from ..logs import LogFormatter, LogLine
+
+        since = parse_time(self.since) if self.since else None
+        until = parse_time(self.until) if self.until else None
+        archive = self.log_archive()
+        formatter = LogFormatter(archive.services(since, until, services),
+            color=color, timestamps=self.timestamps)
+        for timestamp, service, stream, text in archive.query(since=since,
+                until=until, services=services):
+            line = LogLine(service, timestamp, text, stream=stream)
+            if log_filter(line):
+                sys.stdout.write(formatter(line))
+
+    def sources(self, backend, services):
+        sources = {}
+        for container in backend.container_states(all=True):
+            service = container.service or container.name or container.id[:12]
+            if services and service not in services:
+                continue
+            # Scaled services have one log per container.
+            name = service if service not in sources else container.name
+            sources[name] = backend.log_source(container,
+                follow=self.follow, tail=self.tail)
+        return sources
+
+    def main(self, *services):
+        from ..logs import DEFAULT_BUFFER, LogFilter, LogMultiplexer
+
+        services = list(services) + list(self.service or [])
+        color = sys.stdout.isatty() and not self.no_color
+
+        try:
+            log_filter = LogFilter(pattern=self.grep, level=self.level)
+        except (ValueError, re.error) as e:
+            self.error("Invalid filter: %s" % e)
+            return 1
+
+        try:
+            if self.archive:
+                count = self.archive_logs()
+                self.success("Archived %d line(s)" % count)
+                return 0
+            if self.since or self.until:
+                self.show_archived(services, log_filter, color)
+                return 0
+
+            backend = self.get_backend()
+            sources = self.sources(backend, services)
+            if not sources:
+                self.warn("No containers to show the logs of")
+                return 0
+            LogMultiplexer(sources, log_filter=log_filter,
+                buffer=self.buffer or DEFAULT_BUFFER, color=color,
+                timestamps=self.timestamps).run()
+        except KeyboardInterrupt:
+            pass
+        except ValueError as e:
+            self.error("%s" % e)
+            return 1
+        except (CompCommandError, IOError) as e:
+            logger.error("Could not read the logs: %s" % e)
+            return 1
@@ -0,0 +1,63 @@
+from __future__ import absolute_import
+
+from plumbum import cli, local
+
+from ..app_ports import app_ports
+from ..base import root_dir, state_dir, docker_compose
+from ..utils.plumbum import FG
+from ..utils.terminal import StdoutMixin
+
+
+__all__ = ('CompositionMigrate', )
+
+
+class CompositionMigrate(StdoutMixin, cli.Application):
+    """
+    Runs the Django migrations inside of the api container.
+
+    The migrations are only run when the migration files of an app in www/api
+    changed since they were last applied, see `comp migrate --plan`.
+    """
+    port = app_ports['api']
+    api_dir = root_dir / 'www' / 'api'
+
+    force = cli.Flag("--force", default=False,
+        help="Run the migrations even if none of them changed")
+    plan = cli.Flag("--plan", default=False,
+        help="List the apps with migrations to apply, without applying them")
+
+    def main(sel, *args):
+        from ..compose import project_name
+        from ..migrations import MigrationState
+        from ..snapshots import database_path
+
+        state = MigrationState(sel.api_dir, state_dir / 'migrate.json',
+            project_name(root_dir), database_path(root_dir))
+        pending = state.pending_apps()
+
+        if sel.plan:
+            for app in pending:
+                sel.write(app)
+            return 0
+
+        # Without any migrations to look at (e.g. www/api is not checked out
+        # here), whether they are up to date cannot be known.
+        if state.fingerprints and not pending and not sel.force:
+            sel.success("Migrations are up to date, nothing to do.")
+            return 0
+
+        with local.cwd(root_dir):
+            """
+            TODO:
+            -----
+            We have to add a --user flag here, that we should register
+            somewhere before this point (probably in DockerFile).
+
+            Then, we would want to run the binary in /api/bin/manage
+            >>> docker_compose['exec', 'api', '--user', 'xxx',
+            >>>     '/api/bin/manage', 'migrate']
+            """
+            docker_compose[
+                'exec', 'api', '/api/apps/manage.py', 'migrate',
+            ] & FG
+        state.record()
@@ -0,0 +1,61 @@
+from __future__ import absolute_import
+
+from plumbum import cli
+
+from ..app_ports import app_ports
+from ..base import root_dir
+from ..utils.terminal import StdoutMixin
+
+
+__all__ = ('CompositionPorts', )
+
+
+class CompositionPorts(StdoutMixin, cli.Application):
+    """
+    Checks whether anything is already listening on the ports comp-community
+    needs, other than comp-community's own containers.
+    """
+    leases = cli.Flag("--leases", default=False,
+        help="List the ports leased to the instances of the stack, and "
+            "reclaim the ones of instances that are gone")
+
+    def show_leases(self):
+        from ..instances import PortLeases
+
+        registry = PortLeases()
+        for project in registry.reclaim():
+            self.write("Reclaimed the ports of %s" % project, color=self.DARKGRAY)
+        leases = registry.all()
+        if not leases:
+            self.write("No ports are leased.")
+        for project, lease in sorted(leases.items()):
+            self.write("%-32s %s" % (project, ", ".join("%s: %d" % item
+                for item in sorted(lease.ports.items()))))
+
+    def main(self, *ports):
+        from ..ports import find_conflicts, published_ports
+
+        if self.leases:
+            self.show_leases()
+            return 0
+
+        invalid = [p for p in ports if not p.isdigit() or not 0 < int(p) < 65536]
+        if invalid:
+            self.error("Invalid port(s): %s, see `comp ports --help`"
+                % ", ".join(invalid))
+            return 2
+        ports = [int(p) for p in ports]
+
+        ports = ports or sorted(app_ports.values())
+        # The stack's own ports are not conflicts, e.g. when setup runs again
+        # while it is up.
+        conflicts = find_conflicts(ports, exclude=published_ports(root_dir))
+        if not conflicts:
+            self.success("No conflicting ports (checked %s)."
+                % ", ".join(str(p) for p in ports))
+            return 0
+
+        self.error("Found %d conflicting port(s):" % len(conflicts))
+        for conflict in conflicts:
+            self.write(str(conflict))
+        return 1
@@ -0,0 +1,87 @@
+from __future__ import absolute_import
+
+import time
+
+from plumbum import cli
+
+from ..base import root_dir
+from ..utils.terminal import StdoutMixin
+
+
+__all__ = ('CompositionRepos', 'CompositionReposSync', )
+
+
+class CompositionRepos(StdoutMixin, cli.Application):
+    """
+    Shows the sub-repositories checked out inside comp-community (like
+    comp-community-api in www/api), see `comp repos sync`.
+    """
+    def main(self, *args):
+        if args:
+            self.error("Unknown command %r, see `comp repos --help`" % args[0])
+            return 1
+        if self.nested_command:
+            return
+
+        from ..repos import default_repositories
+        from ..utils.git import git_head
+
+        repos = default_repositories(root_dir)
+        width = max(len(r.name) for r in repos)
+        for repo in repos:
+            head = git_head(repo.path)
+            self.write("%s  %s  %s" % (repo.name.ljust(width),
+                head[:10] if head else 'not cloned', repo.url),
+                color=self.SUCCESS if head else self.WARNING)
+
+
+class CompositionReposSync(StdoutMixin, cli.Application):
+    """
+    Clones the sub-repositories that are not checked out yet, and fetches
+    the ones that are, all at once.
+
+    New checkouts borrow their objects from mirrors of the remotes kept in
+    comp's cache, so that cloning again (e.g. in another worktree) only
+    downloads what changed since.  With --no-cache they are partial clones
+    instead, which download file contents as they are checked out.
+    """
+    depth = cli.SwitchAttr("--depth", int, default=None,
+        help="Make shallow clones (and fetches) of the given number of commits")
+    jobs = cli.SwitchAttr(["-j", "--jobs"], int, default=None,
+        help="How many repositories to sync at once, all of them by default")
+    no_cache = cli.Flag("--no-cache", default=False,
+        help="Clone without the cached mirrors of the remotes")
+
+    def main(self):
+        from ..repos import SyncResult, default_repositories, sync_repositories
+
+        started = time.time()
+        results = sync_repositories(default_repositories(root_dir),
+            jobs=self.jobs, depth=self.depth, use_cache=not self.no_cache)
+
+        width = max(len(r.repo.name) for r in results)
+        for result in results:
+            if not result.ok:
+                self.write("%s  %-7s %s" % (result.repo.name.ljust(width),
+                    result.status, result.detail), color=self.ERROR)
+                continue
+            line = "%s  %-7s %s" % (result.repo.name.ljust(width),
+                result.status, (result.head or '')[:10])
+            if result.behind:
+                line += ", %d commit(s) behind upstream" % result.behind
+            line += "  (%.1fs)" % result.elapsed
+            self.write(line, color=self.SUCCESS
+                if result.status == SyncResult.CLONED else self.NOTICE)
+
+        failed = [r for r in results if not r.ok]
+        self.divide()
+        summary = "%d repositories synced, %d failed, in %.1fs" % (
+            len(results) - len(failed), len(failed), time.time() - started)
+        if failed:
+            self.error(summary)
+            return 1
+        self.success(summary)
+        return 0
+
+
+CompositionRepos.subcommand("sync", CompositionReposSync)
@@ -0,0 +1,55 @@
+from __future__ import absolute_import
+
+from plumbum import cli
+
+from ..app_ports import app_ports
+from ..base import CompositionApplication
+from ..utils.exceptions import CompCommandError
+from ..utils.logging import get_logger
+
+
+__all__ = ('CompositionSetup', )
+
+
+logger = get_logger()
+
+
+class CompositionSetup(CompositionApplication):
+    """
+    Pulls the latest images and sets up the comp-community containers.
+
+    Steps that are already up to date since the last setup are skipped, see
+    `comp setup --explain`.
+    """
+    port = app_ports['api']
+    host = "0.0.0.0"
+    env_vars = {}
+
+    pull_concurrency = cli.SwitchAttr("--pull-concurrency", int, default=None,
+        help="How many services to pull at once")
+    explain = cli.Flag("--explain", default=False,
+        help="Show which steps would run and why, without running them")
+    force = cli.Flag("--force", default=False,
+        help="Run every step, even the ones that are up to date")
+
+    def explain_steps(self):
+        graph = self.setup_graph(concurrency=self.pull_concurrency)
+        for plan in graph.plan(force=self.force):
+            color = self.NOTICE if plan.run else self.DARKGRAY
+            self.write("%s %-5s %s" % ('run ' if plan.run else 'skip',
+                plan.step.name, "; ".join(plan.reasons)), color=color)
+            for name in plan.step.requires:
+                self.write("           requires %s" % name, color=self.DARKGRAY)
+            for name in plan.step.after:
+                self.write("           after %s" % name, color=self.DARKGRAY)
+
+    def main(self, *args):
+        try:
+            if self.explain:
+                self.explain_steps()
+                return
+            self.setup(concurrency=self.pull_concurrency, force=self.force)
+        except KeyboardInterrupt:
+            pass
+        except CompCommandError as e:
+            logger.error("Error during setup: %s" % e)
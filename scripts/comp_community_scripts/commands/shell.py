@@ -0,0 +1,42 @@
+from __future__ import absolute_import
+
+from plumbum import cli, local
+
+from ..base import root_dir, docker_compose
+from ..utils.plumbum import FG
+
+
+__all__ = ('CompositionShell', )
+
+
+class CompositionShell(cli.Application):
+    """
+    Opens a bash shell.
+    """
+    root = cli.Flag("--root", default=False)
+
+    def _get_user(self, service='api'):
+        user = 'root'
+        if self.root:
+            return user
+        if service == 'api':
+            return 'apiuser'
+        return user
+
+    def _get_bash_cmd(self, service='api'):
+        # Here is where we could add a custom config file for BASH.
+        # bash_cmd = 'bash --init-file ~/.ollierc -i'
+        service_cmds = {
+            'default': 'bash -i',
+            # 'api': 'bash --init-file ~/.apirc -i'
+            'api': 'bash --init-file /api/.apirc -i'
+        }
+        return service_cmds[service]
+
+    def main(self, service='api'):
+        user = self._get_user(service=service)
+        bash_cmd = self._get_bash_cmd(service=service)
+
+        with local.cwd(root_dir):
+            docker_compose['-f', 'docker-compose.yml', 'exec', '--user', user,
+                'api', 'script', '-q', '/dev/null', '-c', bash_cmd] & FG(retcode=None)
@@ -0,0 +1,68 @@
+from __future__ import absolute_import
+
+from plumbum import cli, local
+
+from ..app_ports import app_ports
+from ..base import CompositionApplication, root_dir, docker_compose
+from ..compose import load_services
+from ..utils.exceptions import CompCommandError
+from ..utils.logging import get_logger
+from ..utils.plumbum import FG
+
+
+__all__ = ('CompositionStart', )
+
+
+logger = get_logger()
+
+
+class CompositionStart(CompositionApplication):
+    """
+    Starts the comp-community containers.
+    """
+    port = app_ports['api']
+    host = "0.0.0.0"
+    env_vars = {}
+
+    detach = cli.Flag(["-d", "--detach"], default=False,
+        help="Start the containers in the background and return once every "
+             "service in app_ports is accepting requests")
+    ready_timeout = cli.SwitchAttr("--ready-timeout", float, default=None,
+        help="Seconds to wait for each service to become ready when detached")
+
+    def wait_until_ready(self):
+        """
+        Probes the ports of the services in app_ports concurrently, reporting
+        how long each one took to become ready.
+        """
+        from ..readiness import default_probes, wait_until_ready
+
+        services = load_services(root_dir, files=self.compose_files)
+        probes = default_probes(services=services, timeout=self.ready_timeout)
+        results = wait_until_ready(probes)
+        for result in results:
+            if result.ready:
+                self.success(str(result))
+            else:
+                self.error(str(result))
+        return all(result.ready for result in results)
+
+    def main(self, *args):
+        try:
+            to_update = self.comp_community_check_for_updates(
+                files=self.compose_files)
+            if to_update:
+                response = self.bool_ask("Containers out of date; download updates?")
+                if response:
+                    self.pull_from_docker_hub(files=self.compose_files)
+
+            with local.cwd(root_dir):
+                with local.env(**self.env_vars):
+                    if self.detach:
+                        self.get_backend(files=self.compose_files).up('-d')
+                        return 0 if self.wait_until_ready() else 1
+                    docker_compose['up', '--abort-on-container-exit'] & FG
+        except KeyboardInterrupt:
+            pass
+        except CompCommandError as e:
+            logger.error("Error starting Composition Community: %s" % e)
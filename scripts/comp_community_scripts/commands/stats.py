@@ -0,0 +1,139 @@
+from __future__ import absolute_import
+
+import sys
+import time
+
+from plumbum import cli
+
+from ..base import CompositionApplication
+from ..utils.exceptions import CompCommandError
+from ..utils.logging import get_logger
+
+
+__all__ = ('CompositionStats', )
+
+
+logger = get_logger()
+
+
+class Positive(object):
+    """
+    A switch's type, like cli.Range, for a number of seconds greater than 0.
+    """
+    def __repr__(self):
+        return "a number of seconds > 0"
+
+    def __call__(self, value):
+        value = float(value)
+        if value <= 0:
+            raise ValueError("Not greater than 0")
+        return value
+
+
+class CompositionStats(CompositionApplication):
+    """
+    Samples the host's and the containers' CPU, memory and IO usage, and
+    shows the min, mean and 95th percentile of each over a rolling window.
+
+    >>> comp stats --duration 60 --csv stats.csv
+    >>> comp stats --prometheus /var/lib/node_exporter/comp.prom
+
+    Sampling runs on a background thread that reads psutil and the
+    containers' cgroups directly, so it barely adds to the load it measures
+    (see sampler_milliseconds).
+    """
+    interval = cli.SwitchAttr("--interval", Positive(), default=1.0,
+        help="Seconds between samples")
+    window = cli.SwitchAttr("--window", cli.Range(1, 10 ** 6), default=60,
+        help="How many of the last samples the summary is over")
+    duration = cli.SwitchAttr("--duration", Positive(), default=None,
+        help="Stop after this many seconds, instead of on Ctrl-C")
+    refresh = cli.SwitchAttr("--refresh", Positive(), default=5.0,
+        help="Seconds between updates of the summary")
+    csv = cli.SwitchAttr("--csv", str, default=None,
+        help="Write every sample to this CSV file when done")
+    prometheus = cli.SwitchAttr("--prometheus", str, default=None,
+        help="Write the summary to this file in Prometheus' text format, "
+            "updating it as it goes")
+    host_only = cli.Flag("--host-only", default=False,
+        help="Do not sample the containers")
+
+    def probes(self):
+        from ..stats import ContainerProbes, HostProbe
+
+        probes = [HostProbe()]
+        if not self.host_only:
+            containers = ContainerProbes(self.get_backend())
+            containers.sample(time.time())
+            if containers.unavailable and not containers.probes:
+                self.warn("The containers' cgroups are not visible from here "
+                    "(e.g. under Docker Desktop), only sampling the host.")
+            else:
+                probes.append(containers)
+        return probes
+
+    def show(self, buffer):
+        from ..stats import summarize
+
+        lines = ["%-52s %12s %12s %12s %12s" % ('', 'min', 'mean', 'p95', 'last')]
+        for name in buffer.names:
+            summary = summarize(buffer.values(name, self.window))
+            if summary is not None:
+                lines.append("%-52s %12.1f %12.1f %12.1f %12.1f"
+                    % ((name,) + summary))
+        if sys.stdout.isatty():
+            # Redraws the summary in place.
+            sys.stdout.write('\033[H\033[2J')
+        sys.stdout.write('\n'.join(lines) + '\n')
+        sys.stdout.flush()
+
+    def export(self, buffer):
+        from io import StringIO
+
+        from ..stats import to_prometheus
+        from ..utils.cache import write_atomic
+
+        if self.prometheus:
+            output = StringIO()
+            to_prometheus(buffer, output, last=self.window)
+            # The textfile collector must never read a partial file.
+            write_atomic(self.prometheus, output.getvalue())
+
+    def main(self):
+        from ..stats import Sampler, SampleLog
+
+        # The summary only needs the last --window samples, but the CSV gets
+        # all of them.
+        log = SampleLog() if self.csv else None
+        try:
+            sampler = Sampler(self.probes(), interval=self.interval,
+                capacity=self.window, log=log)
+        except CompCommandError as e:
+            logger.error("Could not sample the containers: %s" % e)
+            return 1
+
+        started = time.time()
+        try:
+            with sampler:
+                while self.duration is None or \
+                        time.time() - started < self.duration:
+                    remaining = self.refresh
+                    if self.duration is not None:
+                        remaining = min(remaining,
+                            self.duration - (time.time() - started))
+                    time.sleep(max(0, remaining))
+                    self.show(sampler.buffer)
+                    self.export(sampler.buffer)
+        except KeyboardInterrupt:
+            pass
+
+        self.export(sampler.buffer)
+        if log is not None:
+            self.write_csv(log)
+
+    def write_csv(self, log):
+        from ..stats import to_csv
+
+        with log, open(self.csv, 'w') as f:
+            to_csv(log, f)
+        self.success("Wrote %d sample(s) to %s" % (log.count, self.csv))
@@ -0,0 +1,381 @@
+from __future__ import absolute_import
+
+import collections
+import hashlib
+import json
+import os
+import re
+
+from .utils.cache import cache_dir, write_atomic
+from .utils.exceptions import ComposeFileError
+
+
+__all__ = ('DEFAULT_COMPOSE_FILES', 'files_from_flags', 'project_name',
+    'normalize_project_name',
+    'interpolate', 'merge_service', 'PortMapping', 'ComposeModel',
+    'load_services', )
+
+
+DEFAULT_COMPOSE_FILES = ['docker-compose.yml']
+
+
+def files_from_flags(flags):
+    """
+    Reverses CompositionApplication.create_compose_flags.
+
+    >>> files_from_flags(['-f', 'docker-compose.yml', '-f', 'dev.yml'])
+    >>> ['docker-compose.yml', 'dev.yml']
+    """
+    files = []
+    flags = list(flags or [])
+    for i, flag in enumerate(flags):
+        if flag in ('-f', '--file') and i + 1 < len(flags):
+            files.append(flags[i + 1])
+    return files
+
+
+def project_name(root):
+    """
+    Returns the project name docker-compose will use for the given project
+    directory, which is how the containers it creates are labeled.
+    """
+    name = os.environ.get('COMPOSE_PROJECT_NAME')
+    if not name:
+        name = os.path.basename(os.path.realpath(str(root)))
+    return normalize_project_name(name)
+
+
+def normalize_project_name(name):
+    """
+    A project name as docker-compose 1.16 (the one setup.py pins) uses it,
+    which drops dashes and underscores too.
+
+    >>> normalize_project_name('comp-community')
+    >>> 'compcommunity'
+    """
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+# The override file docker-compose merges in when no files are given.
+OVERRIDE_FILE = 'docker-compose.override.yml'
+
+# How many parsed models are kept in the cache directory.
+MAX_CACHED_MODELS = 20
+
+# Service options whose lists are concatenated, rather than replaced, when a
+# later file overrides them.
+_CONCATENATED = ('ports', 'expose', 'external_links', 'dns', 'dns_search',
+    'tmpfs', 'cap_add', 'cap_drop')
+
+# Service options that are merged by key, even when written as "KEY=value"
+# lists.
+_MAPPINGS = ('environment', 'labels', 'extra_hosts', 'build_args')
+
+_VARIABLE = re.compile(r"""
+    \$(?:
+        (?P<escaped>\$) |
+        \{(?P<braced>[_a-zA-Z][_a-zA-Z0-9]*)
+            (?:(?P<separator>:?[-?])(?P<default>[^}]*))?\} |
+        (?P<named>[_a-zA-Z][_a-zA-Z0-9]*)
+    )""", re.VERBOSE)
+
+
+def interpolate(value, environ):
+    """
+    Substitutes variables in a compose file value the way docker-compose does,
+    including ${VAR:-default} and ${VAR-default}.
+
+    >>> interpolate("${API_PORT:-8000}:8000", {})
+    >>> '8000:8000'
+    """
+    if isinstance(value, dict):
+        return dict((k, interpolate(v, environ)) for k, v in value.items())
+    if isinstance(value, list):
+        return [interpolate(v, environ) for v in value]
+    if not isinstance(value, str) or '$' not in value:
+        return value
+
+    def substitute(match):
+        if match.group('escaped'):
+            return '$'
+        name = match.group('braced') or match.group('named')
+        separator = match.group('separator') or ''
+        current = environ.get(name)
+        missing = current is None or (separator.startswith(':') and not current)
+        if missing and separator.endswith('-'):
+            return match.group('default')
+        if missing and separator.endswith('?'):
+            raise ComposeFileError("Required variable %s is not set: %s"
+                % (name, match.group('default')))
+        return current or ''
+    return _VARIABLE.sub(substitute, value)
+
+
+def _as_mapping(value):
+    if isinstance(value, dict):
+        return dict(value)
+    mapping = {}
+    for item in value or []:
+        key, _, val = str(item).partition('=')
+        mapping[key] = val if _ else None
+    return mapping
+
+
+def _volume_target(volume):
+    if isinstance(volume, dict):
+        return volume.get('target')
+    parts = str(volume).split(':')
+    return parts[1] if len(parts) > 1 else parts[0]
+
+
+def merge_service(base, override):
+    """
+    Merges a service's options from a later compose file into those from an
+    earlier one, following docker-compose's rules for multiple files.
+    """
+    merged = dict(base)
+    for key, value in override.items():
+        if key not in merged or value is None:
+            merged[key] = value
+        elif key in _CONCATENATED:
+            merged[key] = list(merged[key] or []) + [
+                v for v in value if v not in (merged[key] or [])]
+        elif key in _MAPPINGS:
+            mapping = _as_mapping(merged[key])
+            mapping.update(_as_mapping(value))
+            merged[key] = mapping
+        elif key in ('volumes', 'devices'):
+            volumes = dict((_volume_target(v), v) for v in merged[key] or [])
+            volumes.update((_volume_target(v), v) for v in value)
+            merged[key] = list(volumes.values())
+        elif key == 'build' and isinstance(value, dict):
+            build = merged[key]
+            if not isinstance(build, dict):
+                build = {'context': build}
+            merged[key] = merge_service(build, value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class PortMapping(collections.namedtuple('PortMapping',
+        ('service', 'published', 'target', 'host_ip', 'protocol'))):
+    """
+    A port a service publishes on the host, from its `ports` option.
+    """
+    @classmethod
+    def parse(cls, service, spec):
+        """
+        Parses both the short and long forms of a `ports` entry, expanding
+        ranges into one mapping per port.
+
+        >>> PortMapping.parse('api', '127.0.0.1:8000:8000/tcp')
+        >>> [PortMapping(service='api', published=8000, target=8000, ...)]
+        """
+        if isinstance(spec, dict):
+            published = spec.get('published')
+            return [cls(service, int(published) if published else None,
+                int(spec['target']), None, spec.get('protocol', 'tcp'))]
+
+        spec, _, protocol = str(spec).partition('/')
+        parts = spec.rsplit(':', 2)
+        target = parts[-1]
+        published = parts[-2] if len(parts) > 1 else None
+        host_ip = parts[0] if len(parts) > 2 else None
+
+        targets = _port_range(target)
+        publisheds = _port_range(published) if published else [None] * len(targets)
+        if len(publisheds) == 1 and len(targets) > 1:
+            publisheds = publisheds * len(targets)
+        return [cls(service, p, t, host_ip, protocol or 'tcp')
+            for p, t in zip(publisheds, targets)]
+
+
+def _port_range(value):
+    start, _, end = value.partition('-')
+    return list(range(int(start), int(end or start) + 1))
+
+
+class ComposeModel(object):
+    """
+    The merged configuration of a set of compose files, for answering
+    questions about the stack without asking docker-compose.
+
+    >>> model = ComposeModel.load(root_dir)
+    >>> model.images
+    >>> {'api': None}
+    >>> model.published_ports
+    >>> {'api': 8000}
+
+    Parsing YAML is slow, so the merged configuration is cached on disk under
+    the sha256 of the files' contents, and reused by every later invocation
+    until one of the files changes.  Within a process, models are also kept
+    by the files' mtime and size, so that loading one again does not even
+    read the files.
+
+    Variables are substituted when the configuration is accessed, rather
+    than before caching it, from the environment and the project's .env file.
+    """
+    def __init__(self, root, files, config, digest=None):
+        self.root = str(root)
+        self.files = list(files)
+        self.config = config
+        self.digest = digest
+        self._dotenv = None
+
+    @classmethod
+    def paths(cls, root, files=None):
+        if files:
+            return [os.path.join(str(root), f) for f in files]
+        paths = [os.path.join(str(root), f) for f in DEFAULT_COMPOSE_FILES]
+        override = os.path.join(str(root), OVERRIDE_FILE)
+        if os.path.exists(override):
+            paths.append(override)
+        return paths
+
+    @classmethod
+    def load(cls, root, files=None):
+        paths = cls.paths(root, files=files)
+        try:
+            stats = tuple((p, os.stat(p).st_mtime, os.stat(p).st_size)
+                for p in paths)
+        except OSError as e:
+            raise ComposeFileError("Could not read compose file: %s" % e)
+        if stats not in _models:
+            _models[stats] = cls._load(root, paths)
+        return _models[stats]
+
+    @classmethod
+    def _load(cls, root, paths):
+        contents = []
+        digest = hashlib.sha256()
+        for path in paths:
+            with open(path, 'rb') as f:
+                data = f.read()
+            contents.append(data)
+            digest.update(os.path.basename(path).encode('utf-8') + b'\0')
+            digest.update(hashlib.sha256(data).digest())
+        digest = digest.hexdigest()
+
+        cache_path = os.path.join(cache_dir('compose'), '%s.json' % digest)
+        try:
+            with open(cache_path) as f:
+                config = json.load(f)
+        except (IOError, OSError, ValueError):
+            config = cls.parse(paths, contents)
+            write_atomic(cache_path, json.dumps(config))
+            _prune(os.path.dirname(cache_path))
+        return cls(root, paths, config, digest=digest)
+
+    @classmethod
+    def parse(cls, paths, contents):
+        import yaml
+
+        config = {'services': {}}
+        for path, data in zip(paths, contents):
+            try:
+                parsed = yaml.safe_load(data) or {}
+            except yaml.YAMLError as e:
+                raise ComposeFileError("Could not parse %s: %s" % (path, e))
+            for key, value in parsed.items():
+                if key != 'services':
+                    config[key] = value
+            for name, service in (parsed.get('services') or {}).items():
+                config['services'][name] = merge_service(
+                    config['services'].get(name, {}), service or {})
+        return config
+
+    @property
+    def environ(self):
+        """
+        The variables substituted into the configuration: the project's .env
+        file, overridden by the environment.
+        """
+        if self._dotenv is None:
+            self._dotenv = {}
+            try:
+                with open(os.path.join(self.root, '.env')) as f:
+                    for line in f:
+                        line = line.strip()
+                        if line and not line.startswith('#') and '=' in line:
+                            key, value = line.split('=', 1)
+                            self._dotenv[key.strip()] = value.strip()
+            except (IOError, OSError):
+                pass
+        environ = dict(self._dotenv)
+        environ.update(os.environ)
+        return environ
+
+    @property
+    def services(self):
+        return interpolate(self.config.get('services') or {}, self.environ)
+
+    @property
+    def service_names(self):
+        return sorted(self.config.get('services') or {})
+
+    def service(self, name):
+        return interpolate(self.config['services'][name], self.environ)
+
+    def ports(self, service=None):
+        mappings = []
+        for name, config in sorted(self.services.items()):
+            if service is None or name == service:
+                for spec in config.get('ports') or []:
+                    mappings += PortMapping.parse(name, spec)
+        return mappings
+
+    @property
+    def published_ports(self):
+        """
+        The first port each service publishes on the host.
+        """
+        ports = {}
+        for mapping in self.ports():
+            if mapping.published is not None:
+                ports.setdefault(mapping.service, mapping.published)
+        return ports
+
+    @property
+    def images(self):
+        return dict((name, config.get('image'))
+            for name, config in self.services.items())
+
+    @property
+    def build_contexts(self):
+        """
+        The absolute build context of every service that is built locally.
+        """
+        contexts = {}
+        for name, config in self.services.items():
+            build = config.get('build')
+            if build:
+                context = build.get('context', '.') if isinstance(build, dict) \
+                    else build
+                contexts[name] = os.path.normpath(
+                    os.path.join(self.root, context))
+        return contexts
+
+
+# The models loaded in this process, by the paths, mtimes and sizes of their
+# files, so that a long running process (i.e. `comp daemon`) only loads them
+# again when they change.
+_models = {}
+
+
+def _prune(directory, keep=MAX_CACHED_MODELS):
+    entries = sorted((os.path.join(directory, f) for f in os.listdir(directory)
+        if f.endswith('.json')), key=os.path.getmtime, reverse=True)
+    for path in entries[keep:]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def load_services(root, files=None):
+    """
+    Returns the merged `services` section of the given compose files, which
+    are relative to the project root.
+    """
+    return ComposeModel.load(root, files=files).services
@@ -0,0 +1,218 @@
+from __future__ import absolute_import
+
+import asyncio
+import os
+import socket
+import time
+from urllib.parse import urlsplit
+
+from .utils.cache import JSONCache
+from .utils.logging import get_logger
+
+
+__all__ = ('Endpoint', 'ConnectivityChecker', 'is_online', 'reachable',
+    'endpoint_from_url', 'DEFAULT_ENDPOINTS', )
+
+
+logger = get_logger()
+
+
+# The endpoints checked by `is_online`, which can be replaced with a comma
+# separated list of host:port in COMP_CONNECTIVITY_ENDPOINTS.
+DEFAULT_ENDPOINTS = ('github.com:22', 'registry-1.docker.io:443')
+
+# How long (in seconds) a probe's result is trusted, across invocations, can
+# be overridden with COMP_CONNECTIVITY_TTL.
+CONNECTIVITY_TTL = 30
+
+# The hard deadline (in seconds) for probing all of the endpoints, including
+# resolving their names, can be overridden with COMP_CONNECTIVITY_TIMEOUT.
+DEFAULT_TIMEOUT = 2.0
+
+# How long an attempt on one address gets before the next address is tried
+# alongside it, as recommended by RFC 8305 (Happy Eyeballs v2).
+ATTEMPT_DELAY = 0.25
+
+
+class Endpoint(object):
+    """
+    A host and port that is reachable when a TCP connection to it succeeds.
+
+    >>> Endpoint.parse('github.com:22')
+    >>> Endpoint('github.com', 22)
+    """
+    def __init__(self, host, port):
+        self.host = host
+        self.port = int(port)
+
+    @classmethod
+    def parse(cls, value):
+        if isinstance(value, Endpoint):
+            return value
+        if isinstance(value, (tuple, list)):
+            return cls(*value)
+        host, _, port = value.strip().rpartition(':')
+        return cls(host.strip('[]'), port)
+
+    @property
+    def key(self):
+        return '%s:%s' % (self.host, self.port)
+
+    def __eq__(self, other):
+        return isinstance(other, Endpoint) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return "Endpoint(%r, %r)" % (self.host, self.port)
+
+
+def endpoint_from_url(url):
+    """
+    >>> endpoint_from_url('https://registry-1.docker.io')
+    >>> Endpoint('registry-1.docker.io', 443)
+    """
+    parts = urlsplit(url)
+    port = parts.port or {'http': 80, 'https': 443}.get(parts.scheme, 443)
+    return Endpoint(parts.hostname, port)
+
+
+def _interleave(addresses):
+    """
+    Orders the addresses so that the families alternate, starting with the
+    first family the resolver returned (usually IPv6).
+    """
+    by_family = {}
+    families = []
+    for address in addresses:
+        if address[0] not in by_family:
+            families.append(address[0])
+        by_family.setdefault(address[0], []).append(address)
+    ordered = []
+    while any(by_family.values()):
+        for family in families:
+            if by_family[family]:
+                ordered.append(by_family[family].pop(0))
+    return ordered
+
+
+async def _connect(loop, address):
+    family, type_, proto, _, sockaddr = address
+    sock = socket.socket(family, type_, proto)
+    sock.setblocking(False)
+    try:
+        await loop.sock_connect(sock, sockaddr)
+    finally:
+        sock.close()
+    return True
+
+
+async def _probe(loop, endpoint):
+    """
+    Races connections to the endpoint's addresses, starting one more every
+    ATTEMPT_DELAY seconds while none has succeeded, and returns as soon as
+    one of them does.
+    """
+    addresses = _interleave(await loop.getaddrinfo(endpoint.host,
+        endpoint.port, type=socket.SOCK_STREAM))
+    pending = set()
+    try:
+        while addresses or pending:
+            if addresses:
+                pending.add(loop.create_task(_connect(loop, addresses.pop(0))))
+            done, pending = await asyncio.wait(pending,
+                timeout=ATTEMPT_DELAY if addresses else None,
+                return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return True
+        return False
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+class ConnectivityChecker(object):
+    """
+    Probes endpoints concurrently, with a hard deadline for all of them, and
+    caches the results on disk for `ttl` seconds so that every command run in
+    the meantime gets its answer immediately.
+
+    >>> checker = ConnectivityChecker()
+    >>> checker.check(['github.com:22'])
+    >>> {Endpoint('github.com', 22): True}
+    """
+    def __init__(self, timeout=None, ttl=None, cache=None):
+        self.timeout = timeout or float(os.environ.get(
+            'COMP_CONNECTIVITY_TIMEOUT', DEFAULT_TIMEOUT))
+        ttl = ttl if ttl is not None else float(os.environ.get(
+            'COMP_CONNECTIVITY_TTL', CONNECTIVITY_TTL))
+        self.cache = cache or JSONCache('connectivity', ttl=ttl)
+
+    def check(self, endpoints):
+        endpoints = [Endpoint.parse(e) for e in endpoints]
+        results = {}
+        missing = []
+        for endpoint in endpoints:
+            if endpoint.key in self.cache:
+                results[endpoint] = self.cache.get(endpoint.key)
+            else:
+                missing.append(endpoint)
+
+        if missing:
+            started = time.time()
+            for endpoint, reachable in zip(missing, self.probe(missing)):
+                results[endpoint] = reachable
+                self.cache.set(endpoint.key, reachable)
+            self.cache.save()
+            logger.debug("Probed %s in %.0f ms" % (", ".join(
+                "%s (%s)" % (e.key, 'up' if results[e] else 'down')
+                for e in missing), (time.time() - started) * 1000))
+        return results
+
+    def probe(self, endpoints):
+        """
+        Probes the endpoints without the cache, and returns whether each of
+        them is reachable.  Anything not reached within the timeout counts as
+        unreachable.
+        """
+        async def run():
+            tasks = [asyncio.ensure_future(_probe(loop, e)) for e in endpoints]
+            await asyncio.wait(tasks, timeout=self.timeout)
+            results = []
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                    results.append(False)
+                else:
+                    results.append(task.exception() is None and task.result())
+            await asyncio.gather(*tasks, return_exceptions=True)
+            return results
+
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(run())
+        finally:
+            loop.close()
+
+
+def reachable(endpoints, checker=None):
+    """
+    Returns the endpoints that are reachable, out of the ones given.
+    """
+    results = (checker or ConnectivityChecker()).check(endpoints)
+    return set(e for e, ok in results.items() if ok)
+
+
+def is_online(endpoints=None, checker=None):
+    """
+    Whether any of the endpoints (by default DEFAULT_ENDPOINTS, or those in
+    COMP_CONNECTIVITY_ENDPOINTS) is reachable.
+    """
+    if endpoints is None:
+        setting = os.environ.get('COMP_CONNECTIVITY_ENDPOINTS')
+        endpoints = setting.split(',') if setting else DEFAULT_ENDPOINTS
+    return bool(reachable(endpoints, checker=checker))
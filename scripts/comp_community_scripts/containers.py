@@ -0,0 +1,311 @@
+from __future__ import absolute_import
+
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils.exceptions import CompCommandError
+from .utils.logging import get_logger
+
+
+__all__ = ('ContainerState', 'ContainerTracker', 'JSONLinesEvents',
+    'CommandEvents', 'stop_containers', 'events_source_override',
+    'SERVICE_LABEL', )
+
+
+logger = get_logger()
+
+
+SERVICE_LABEL = 'com.docker.compose.service'
+
+# Setting COMP_EVENTS_SOURCE to the path of a file or FIFO that emits Docker's
+# JSON events, one per line, makes the tracker follow it instead of the
+# daemon's event stream.
+EVENTS_SOURCE_SETTING = 'COMP_EVENTS_SOURCE'
+
+# The state a container is in after each event, see
+# https://docs.docker.com/engine/reference/commandline/events/
+EVENT_STATES = {
+    'create': 'created',
+    'start': 'running',
+    'restart': 'running',
+    'unpause': 'running',
+    'pause': 'paused',
+    'die': 'exited',
+    'destroy': 'removed',
+}
+
+STOPPED_STATES = ('exited', 'dead', 'removed')
+
+
+class ContainerState(object):
+
+    def __init__(self, id, name=None, service=None, state=None,
+            exit_code=None):
+        self.id = id
+        self.name = name
+        self.service = service
+        self.state = state
+        self.exit_code = exit_code
+
+    @classmethod
+    def from_api(cls, container):
+        """
+        From an entry of the Engine API's /containers/json.
+        """
+        labels = container.get('Labels') or {}
+        names = container.get('Names') or []
+        return cls(container['Id'], name=names[0].lstrip('/') if names else None,
+            service=labels.get(SERVICE_LABEL), state=container.get('State'))
+
+    @classmethod
+    def from_cli(cls, container):
+        """
+        From a line of `docker ps --no-trunc --format '{{json .}}'`, where the
+        labels are a comma separated string and older versions have no State.
+        """
+        labels = dict(label.split('=', 1) for label in
+            (container.get('Labels') or '').split(',') if '=' in label)
+        state = container.get('State') or (
+            'running' if container.get('Status', '').startswith('Up') else None)
+        return cls(container['ID'], name=container.get('Names'),
+            service=labels.get(SERVICE_LABEL), state=state)
+
+    @property
+    def running(self):
+        return self.state in ('running', 'paused', 'restarting')
+
+    @property
+    def stopped(self):
+        return self.state in STOPPED_STATES
+
+    def __repr__(self):
+        return "ContainerState(%r, service=%r, state=%r)" % (
+            self.name or self.id[:12], self.service, self.state)
+
+
+class JSONLinesEvents(object):
+    """
+    Events read from a stream of JSON objects, one per line, like the output
+    of `docker events --format '{{json .}}'` or a file standing in for it.
+    """
+    def __init__(self, stream):
+        self.stream = stream
+        self.closed = False
+
+    @classmethod
+    def from_path(cls, path):
+        """
+        The file is opened by the thread that reads it, since opening a FIFO
+        blocks until something opens it for writing.
+        """
+        return cls(path)
+
+    def __iter__(self):
+        if isinstance(self.stream, str):
+            self.stream = open(self.stream, 'rb')
+        try:
+            for line in self.stream:
+                if self.closed:
+                    return
+                line = line.strip()
+                if line:
+                    yield json.loads(line.decode('utf-8')
+                        if isinstance(line, bytes) else line)
+        finally:
+            self.stream.close()
+
+    def close(self):
+        """
+        The stream is left to the thread reading it (closing it would block
+        until that read returns), and is closed when it ends.
+        """
+        self.closed = True
+
+
+class CommandEvents(JSONLinesEvents):
+    """
+    Events from `docker events`, for when the daemon's socket cannot be
+    reached directly.
+
+    >>> CommandEvents.docker(labels=['com.docker.compose.project=comp'])
+    """
+    def __init__(self, argv):
+        self.proc = subprocess.Popen(argv, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        super(CommandEvents, self).__init__(self.proc.stdout)
+
+    @classmethod
+    def docker(cls, binary='docker', labels=None):
+        argv = [binary, 'events', '--format', '{{json .}}',
+            '--filter', 'type=container']
+        for label in labels or []:
+            argv += ['--filter', 'label=%s' % label]
+        return cls(argv)
+
+    def close(self):
+        super(CommandEvents, self).close()
+        if self.proc.poll() is None:
+            self.proc.terminate()
+            self.proc.wait()
+
+
+class ContainerTracker(object):
+    """
+    An in-memory model of the project's containers, kept up to date from the
+    Docker daemon's event stream.
+
+    >>> with ContainerTracker(client.events(labels=[label]),
+    >>>         snapshot=client.containers) as tracker:
+    >>>     tracker.running()
+    >>>     tracker.wait_until_stopped([container.id], timeout=10)
+
+    The event stream is subscribed to before the snapshot of the running
+    containers is taken, so that nothing that happens in between is missed,
+    and whatever the events say wins over the snapshot.  Waiting for a
+    container to stop is woken up by its `die` event, rather than by polling.
+    """
+    def __init__(self, events, snapshot=None):
+        self.events = events
+        self.snapshot = snapshot
+        self.containers = {}
+        self.failed = None
+        self._from_events = set()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._follow,
+            name='comp-container-events')
+        self._thread.daemon = True
+        self._thread.start()
+        if self.snapshot is not None:
+            containers = self.snapshot()
+            with self._condition:
+                for container in containers:
+                    if container.id not in self._from_events:
+                        self.containers[container.id] = container
+        return self
+
+    def close(self):
+        self.events.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _follow(self):
+        try:
+            for event in self.events:
+                self.apply(event)
+        except Exception as e:
+            self.failed = e
+        else:
+            self.failed = EOFError("The event stream ended")
+        with self._condition:
+            self._condition.notify_all()
+
+    def apply(self, event):
+        if (event.get('Type') or 'container') != 'container':
+            return
+        action = (event.get('Action') or event.get('status') or '').split(':')[0]
+        state = EVENT_STATES.get(action)
+        if state is None:
+            return
+
+        actor = event.get('Actor') or {}
+        attributes = actor.get('Attributes') or {}
+        container_id = actor.get('ID') or event.get('id')
+        with self._condition:
+            container = self.containers.get(container_id)
+            if container is None:
+                container = self.containers[container_id] = ContainerState(
+                    container_id, name=attributes.get('name'),
+                    service=attributes.get(SERVICE_LABEL))
+            container.state = state
+            if action == 'die' and attributes.get('exitCode') is not None:
+                container.exit_code = int(attributes['exitCode'])
+            self._from_events.add(container_id)
+            self._condition.notify_all()
+
+    def running(self):
+        with self._condition:
+            return [c for c in self.containers.values() if c.running]
+
+    def wait_until_stopped(self, container_ids, timeout=None):
+        """
+        Waits until the event stream reports that every one of the containers
+        stopped, and returns whether they did before the timeout.
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._condition:
+            while True:
+                if all(self.containers.get(i) is None or
+                        self.containers[i].stopped for i in container_ids):
+                    return True
+                if self.failed is not None:
+                    return False
+                remaining = deadline - time.time() if deadline else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+
+
+def stop_containers(tracker, stop, kill, timeout=10, grace=5, max_workers=8):
+    """
+    Stops the running containers the tracker knows of, in parallel, and
+    returns them once the event stream confirms that they exited.
+
+    `stop(container, timeout)` asks a container to stop, and `kill(container)`
+    kills it.  A container that has not exited `grace` seconds after its stop
+    `timeout` is killed, and if the event stream breaks down, a stop that
+    returned without an error is taken as confirmation instead.
+    """
+    def stop_one(container):
+        logger.info("Stopping %s" % (container.name or container.id[:12]))
+        stopping = threading.Thread(target=_call, args=(stop, container, timeout),
+            name='comp-stop-%s' % container.id[:12])
+        stopping.daemon = True
+        stopping.start()
+
+        if tracker.wait_until_stopped([container.id], timeout + grace):
+            return container
+        if tracker.failed is not None:
+            stopping.join(timeout + grace)
+            if not stopping.is_alive() and not getattr(stopping, 'error', None):
+                return container
+
+        logger.warning("%s did not stop within %ss, killing it"
+            % (container.name or container.id[:12], timeout + grace))
+        kill(container)
+        if not tracker.wait_until_stopped([container.id], grace) and \
+                tracker.failed is None:
+            raise CompCommandError("%s could not be stopped"
+                % (container.name or container.id[:12]))
+        return container
+
+    running = tracker.running()
+    if not running:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(running))) as executor:
+        return list(executor.map(stop_one, running))
+
+
+def _call(func, container, timeout):
+    try:
+        func(container, timeout)
+    except Exception as e:
+        threading.current_thread().error = e
+        logger.debug("Stopping %s failed: %s" % (container.id[:12], e))
+
+
+def events_source_override():
+    path = os.environ.get(EVENTS_SOURCE_SETTING)
+    if path:
+        return JSONLinesEvents.from_path(path)
+    return None
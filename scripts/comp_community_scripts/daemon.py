@@ -0,0 +1,334 @@
+"""
+A resident `comp daemon` that keeps comp warm between invocations.
+
+The daemon imports every subcommand, resolves the binaries they run, parses
+the compose files and checks for the Docker daemon once, up front.  It then
+listens on a unix socket, and every `comp` invocation that finds the socket
+hands its command line, working directory, environment and its stdin, stdout
+and stderr file descriptors over to it.  The daemon forks a child (which
+inherits all of that warm state) to run the command directly on the caller's
+terminal, and reports the exit code back.
+
+When no daemon is running, `comp` runs the command in-process as usual.
+
+This module is imported by every `comp` invocation to try the daemon first,
+so anything beyond the standard library is imported inside the functions
+that need it.
+"""
+from __future__ import print_function
+
+import array
+import json
+import os
+import signal
+import socket
+import sys
+
+
+__all__ = ('socket_path', 'run_via_daemon', 'serve', 'stop_daemon',
+    'daemon_status', )
+
+
+# Invocations that always run in-process: the daemon itself, and top-level
+# switches that report on or wrap the invocation as a whole.  Only the ones
+# before the subcommand's name count, e.g. `comp doctor -v` is not `comp -v`.
+IN_PROCESS_COMMANDS = ('daemon', )
+IN_PROCESS_ARGS = ('--profile-startup', '--trace', '-h', '--help',
+    '--help-all', '-v', '--version')
+
+# Commands that attach docker-compose to the terminal (`start` without -d,
+# `shell`, and `migrate`'s exec) run in-process when there is one, since a
+# forked child has the terminal's file descriptors but it is not its
+# controlling terminal: it is not sent the window's resizes, for one.
+TERMINAL_COMMANDS = ('shell', 'start', 'migrate')
+
+# Setting COMP_NO_DAEMON bypasses a running daemon.
+NO_DAEMON_SETTING = 'COMP_NO_DAEMON'
+
+MAX_HEADER_SIZE = 1024 * 1024
+
+
+def socket_path():
+    path = os.environ.get('COMP_DAEMON_SOCKET')
+    if path:
+        return path
+    from .utils.cache import cache_dir
+    return os.path.join(cache_dir(), 'daemon.sock')
+
+
+def _send_message(sock, message, fds=None):
+    data = (json.dumps(message) + "\n").encode('utf-8')
+    if fds:
+        sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+            array.array('i', fds))])
+    else:
+        sock.sendall(data)
+
+
+def _receive_request(sock, max_fds=3):
+    """
+    Reads the request header, and the file descriptors that were sent along
+    with its first bytes.
+    """
+    fds = array.array('i')
+    data, ancdata, _, _ = sock.recvmsg(MAX_HEADER_SIZE,
+        socket.CMSG_LEN(max_fds * fds.itemsize))
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cmsg_data[:len(cmsg_data) - (len(cmsg_data) % fds.itemsize)])
+    while not data.endswith(b"\n"):
+        chunk = sock.recv(MAX_HEADER_SIZE)
+        if not chunk:
+            break
+        data += chunk
+    return json.loads(data.decode('utf-8')), list(fds)
+
+
+def _read_messages(sock):
+    buffered = b''
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            return
+        buffered += chunk
+        while b"\n" in buffered:
+            line, buffered = buffered.split(b"\n", 1)
+            yield json.loads(line.decode('utf-8'))
+
+
+def _is_daemon_eligible(argv, tty=None):
+    """
+    >>> _is_daemon_eligible(['doctor', '-v'])
+    >>> True
+    >>> _is_daemon_eligible(['-v', 'doctor'])
+    >>> False
+    """
+    if tty is None:
+        tty = sys.stdin.isatty()
+    for arg in argv:
+        if not arg.startswith('-'):
+            if tty and arg in TERMINAL_COMMANDS:
+                return False
+            return arg not in IN_PROCESS_COMMANDS
+        if arg.split('=', 1)[0] in IN_PROCESS_ARGS:
+            return False
+    return True
+
+
+def run_via_daemon(argv):
+    """
+    Runs `comp <argv>` in the daemon, returning its exit code, or None if it
+    should run in-process instead (no daemon running, or not eligible).
+    """
+    if os.environ.get(NO_DAEMON_SETTING) or not _is_daemon_eligible(argv):
+        return None
+    path = socket_path()
+    if not os.path.exists(path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except (OSError, socket.error):
+        sock.close()
+        return None
+
+    with sock:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        _send_message(sock, {'argv': list(argv), 'cwd': os.getcwd(),
+            'env': dict(os.environ)}, fds=[0, 1, 2])
+
+        # The command runs in a process that is not in our terminal's
+        # foreground process group, so Ctrl-C has to be forwarded to it.
+        child = {}
+
+        def forward(signum, frame):
+            if child.get('pid'):
+                os.kill(child['pid'], signum)
+        previous = signal.signal(signal.SIGINT, forward)
+        try:
+            for message in _read_messages(sock):
+                if 'pid' in message:
+                    child['pid'] = message['pid']
+                if 'exit' in message:
+                    return message['exit']
+        finally:
+            signal.signal(signal.SIGINT, previous)
+    # The child died without reporting its exit code.
+    return 1
+
+
+def _warm_up():
+    """
+    Imports and initializes everything a command could need, so that forked
+    children start with it already done.
+    """
+    from plumbum.cli.application import Subcommand
+
+    from .app import Composition
+    from .backends import engine_available
+    from .backends.compose import docker, docker_compose
+    from .base import root_dir
+    from .compose import load_services
+
+    for attr in dir(Composition):
+        subcommand = getattr(Composition, attr)
+        if isinstance(subcommand, Subcommand):
+            subcommand.get()
+    for binary in (docker_compose, docker):
+        try:
+            binary.command
+        except Exception:
+            pass
+    try:
+        load_services(root_dir)
+    except Exception:
+        # Commands that need the compose files will report the problem.
+        pass
+    engine_available()
+    return Composition
+
+
+def _run_child(conn, request, fds, composition):
+    """
+    Runs in the forked child: takes over the caller's file descriptors,
+    working directory and environment, and runs the command.
+    """
+    from plumbum import local
+    from .app import ENV_DEFAULTS
+    from .utils.logging import get_logger, LogFormatter
+
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    for target, fd in zip((0, 1, 2), fds):
+        os.dup2(fd, target)
+        os.close(fd)
+
+    os.chdir(request['cwd'])
+    local.cwd.chdir(request['cwd'])
+    os.environ.clear()
+    os.environ.update(request['env'])
+    local.env.clear()
+    local.env.update(**request['env'])
+    local.env.update(**ENV_DEFAULTS)
+    sys.argv = ['comp'] + request['argv']
+    for handler in get_logger().handlers:
+        handler.setFormatter(LogFormatter())
+
+    _send_message(conn, {'pid': os.getpid()})
+    exit_code = 1
+    try:
+        _, exit_code = composition.run(sys.argv, exit=False)
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else 1
+    except KeyboardInterrupt:
+        exit_code = 130
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            _send_message(conn, {'exit': exit_code or 0})
+        finally:
+            os._exit(exit_code or 0)
+
+
+def _reap_children():
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def serve(path=None):
+    """
+    Runs the daemon in the foreground until it is stopped.
+    """
+    from .utils.logging import get_logger
+    logger = get_logger()
+
+    path = path or socket_path()
+    if daemon_status(path):
+        raise RuntimeError("A comp daemon is already running on %s" % path)
+    if os.path.exists(path):
+        os.unlink(path)
+
+    composition = _warm_up()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o177)
+    try:
+        server.bind(path)
+    finally:
+        os.umask(old_umask)
+    server.listen(16)
+    server.settimeout(1)
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda *args: stopping.append(True))
+    logger.info("comp daemon listening on %s (pid %s)" % (path, os.getpid()))
+    try:
+        while not stopping:
+            _reap_children()
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            except InterruptedError:
+                continue
+            conn.settimeout(None)
+            with conn:
+                try:
+                    request, fds = _receive_request(conn)
+                except (OSError, ValueError) as e:
+                    logger.error("Invalid request to comp daemon: %s" % e)
+                    continue
+                if request.get('command') == 'stop':
+                    stopping.append(True)
+                    _send_message(conn, {'exit': 0})
+                    continue
+                if request.get('command') == 'status':
+                    _send_message(conn, {'pid': os.getpid(), 'exit': 0})
+                    continue
+                if os.fork() == 0:
+                    server.close()
+                    _run_child(conn, request, fds, composition)
+                for fd in fds:
+                    os.close(fd)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+        logger.info("comp daemon stopped")
+
+
+def _control(command, path=None):
+    path = path or socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(2)
+    try:
+        sock.connect(path)
+    except (OSError, socket.error):
+        sock.close()
+        return None
+    with sock:
+        _send_message(sock, {'command': command})
+        for message in _read_messages(sock):
+            return message
+
+
+def daemon_status(path=None):
+    """
+    Returns the pid of the running daemon, or None.
+    """
+    message = _control('status', path=path)
+    return message.get('pid') if message else None
+
+
+def stop_daemon(path=None):
+    return _control('stop', path=path) is not None
@@ -0,0 +1,313 @@
+from __future__ import absolute_import
+
+import fcntl
+import hashlib
+import os
+import shutil
+import sys
+import time
+from contextlib import contextmanager
+
+from plumbum import local
+
+from .utils.cache import cache_dir, write_atomic
+from .utils.exceptions import CompCommandError
+from .utils.logging import get_logger
+from .utils.runner import run
+
+
+__all__ = ('DataDirSnapshots', 'DATA_SETTING', 'clone_tree', 'remove_tree',
+    'initialize_data_dir', 'schema_fingerprint', )
+
+
+logger = get_logger()
+
+
+# The variable the compose files mount mysqld's data directory from.
+DATA_SETTING = 'COMP_MYSQL_DATA'
+
+# How many initialized data directories are kept, for the schemas that were
+# used most recently.
+MAX_SNAPSHOTS = 3
+
+# How long (in seconds) copying a data directory may take when the
+# filesystem cannot clone it.
+CLONE_TIMEOUT = 600
+
+# How long (in seconds) mysqld's entrypoint is given to initialize an empty
+# data directory, the migrations to apply, and mysqld to shut down.
+INIT_TIMEOUT = 300
+MIGRATE_TIMEOUT = 600
+STOP_TIMEOUT = 60
+
+
+def schema_fingerprint(root):
+    """
+    A hash of everything an initialized data directory depends on: the
+    mysql image's Dockerfile, the scripts mysqld is initialized with, and
+    the api's migrations.
+    """
+    from .migrations import migration_fingerprints
+
+    digest = hashlib.sha256()
+    paths = [os.path.join(str(root), 'containers', 'mysql', 'Dockerfile')]
+    scripts = os.path.join(str(root), 'mysqld')
+    if os.path.isdir(scripts):
+        paths += [os.path.join(scripts, name)
+            for name in sorted(os.listdir(scripts))]
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            digest.update(os.path.basename(path).encode('utf-8') + b'\0')
+            digest.update(hashlib.sha256(f.read()).digest())
+    for app, fingerprint in sorted(migration_fingerprints(
+            os.path.join(str(root), 'www', 'api')).items()):
+        digest.update(('%s\0%s\n' % (app, fingerprint)).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def _in_container(image, argv, directories):
+    """
+    Runs `argv` as root in a container of the image, with each of the
+    directories mounted at the same path, for the files of mysqld's data
+    directories: they belong to the container's mysql user and are not
+    readable by anyone else, so on a Linux host only root can copy or
+    remove them.
+    """
+    from .backends.compose import docker
+
+    mounts = []
+    for directory in directories:
+        mounts += ['-v', '%s:%s' % (directory, directory)]
+    run(docker[['run', '--rm', '--user', 'root', '--entrypoint', argv[0]]
+        + mounts + [image] + list(argv[1:])], log=logger.debug,
+        timeout=CLONE_TIMEOUT)
+
+
+def clone_tree(source, destination, image=None):
+    """
+    Copies a directory tree, sharing the files' blocks with the source where
+    the filesystem can (reflinks on Btrfs and XFS, clones on APFS), so that
+    the copy is instant and only takes space as it diverges.  Anywhere else,
+    the files are copied.
+
+    A tree we cannot read all of (e.g. mysqld's data directory on a Linux
+    host) is copied in a container of `image`, when one is given.
+    """
+    if sys.platform == 'darwin':
+        argv = ['cp', '-c', '-R', '-p', source, destination]
+    else:
+        argv = ['cp', '-a', '--reflink=auto', source, destination]
+    try:
+        result = run(argv, retcode=None, log=logger.debug,
+            timeout=CLONE_TIMEOUT)
+        cloned = result.retcode == 0
+    except OSError:
+        cloned = False
+    if cloned:
+        return
+    shutil.rmtree(destination, ignore_errors=True)
+    if image is not None:
+        logger.debug("Could not clone %s, copying it in a container" % source)
+        _in_container(image, ['cp', '-a', source, destination],
+            [os.path.dirname(source), os.path.dirname(destination)])
+    else:
+        logger.debug("Could not clone %s, copying it" % source)
+        shutil.copytree(source, destination, symlinks=True)
+
+
+def remove_tree(path, image=None):
+    """
+    Removes a directory tree, in a container of `image` if what is left of
+    it cannot be removed otherwise (see clone_tree).
+    """
+    shutil.rmtree(path, ignore_errors=True)
+    if os.path.exists(path) and image is not None:
+        _in_container(image, ['rm', '-rf', path], [os.path.dirname(path)])
+
+
+def _mysqld_ready(container):
+    """
+    Whether mysqld is up in the container after its entrypoint initialized
+    the data directory.  The entrypoint's own mysqld, which runs the
+    initialization scripts, does not listen on TCP, so only the final one
+    answers a ping over it.  An error to connect (e.g. access denied) still
+    means it is up.
+    """
+    from .backends.compose import docker
+
+    running = run(docker['inspect', '--format', '{{.State.Running}}',
+        container], retcode=None, log=logger.debug, timeout=30)
+    if running.retcode != 0 or running.stdout.strip() != 'true':
+        run(docker['logs', '--tail', '20', container], retcode=None,
+            log=logger.warning, timeout=30)
+        raise CompCommandError("mysqld exited while initializing its data "
+            "directory, see its logs above")
+    ping = run(docker['exec', container, 'mysqladmin', '--protocol=tcp',
+        '--host=127.0.0.1', 'ping'], retcode=None, log=logger.debug,
+        timeout=30)
+    return ping.retcode == 0
+
+
+def initialize_data_dir(root, path, flags=None, timeout=INIT_TIMEOUT):
+    """
+    Initializes mysqld's data in the empty directory `path`, for seeding
+    stacks' data directories from.
+
+    >>> initialize_data_dir(root_dir, path, flags=['-f', 'docker-compose.yml'])
+
+    The mysqld service is run on the directory, where its entrypoint creates
+    the database and runs the scripts in mysqld/.  Once mysqld is up, the
+    api's migrations are applied to it from a one-off api container, and
+    mysqld is stopped, which shuts it down cleanly so that the data
+    directory can be cloned as it is.
+
+    Both run as a compose project of their own, so that the api reaches this
+    mysqld as `mysqld`, rather than the one of a stack that is running.
+    """
+    from .backends.compose import docker, docker_compose
+    from .compose import project_name
+
+    flags = list(flags or [])
+    project = '%sinit%d' % (project_name(root), os.getpid())
+    container = '%s_mysqld' % project
+    network = '%s_default' % project
+    with local.cwd(str(root)), local.env(**{DATA_SETTING: path,
+            'COMPOSE_PROJECT_NAME': project}):
+        run(docker_compose[flags + ['run', '-d', '--no-deps', '--name',
+            container, 'mysqld']], log=logger.debug, timeout=INIT_TIMEOUT)
+        try:
+            # docker-compose 1.16 does not give `run`'s containers the
+            # service's name as an alias on the network (--use-aliases came
+            # later), so it is given to it here.
+            run(docker['network', 'disconnect', network, container],
+                log=logger.debug, timeout=60)
+            run(docker['network', 'connect', '--alias', 'mysqld', network,
+                container], log=logger.debug, timeout=60)
+            started = time.time()
+            while not _mysqld_ready(container):
+                if time.time() - started > timeout:
+                    raise CompCommandError("mysqld did not come up within %ds "
+                        "of initializing %s" % (timeout, path))
+                time.sleep(1)
+            logger.info("Applying the migrations to the new data directory")
+            run(docker_compose[flags + ['run', '--rm', '--no-deps', 'api',
+                '/api/apps/manage.py', 'migrate']], timeout=MIGRATE_TIMEOUT)
+        finally:
+            # docker-compose cannot --rm a detached container.
+            run(docker['stop', '-t', str(STOP_TIMEOUT), container],
+                retcode=None, log=logger.debug, timeout=STOP_TIMEOUT + 30)
+            run(docker['rm', '-f', container], retcode=None, log=logger.debug,
+                timeout=60)
+            # Removes the project's network.
+            run(docker_compose[flags + ['down']], retcode=None,
+                log=logger.debug, timeout=INIT_TIMEOUT)
+
+
+class DataDirSnapshots(object):
+    """
+    Initialized mysqld data directories, by the schema_fingerprint they were
+    initialized for, which new stacks' data directories are cloned from
+    rather than initializing mysqld from scratch.
+
+    >>> snapshots = DataDirSnapshots()
+    >>> snapshots.seed(schema_fingerprint(root_dir), data_dir, initialize)
+
+    `initialize` is given an empty directory to initialize mysqld's data in.
+    It runs once per fingerprint, under a lock, so that stacks started at the
+    same time wait for the same initialization.
+
+    The data directories belong to mysqld's user in its container, so they
+    are copied and removed in containers of `image` (mysqld's) when they
+    cannot be otherwise, see clone_tree.
+    """
+    def __init__(self, path=None, keep=MAX_SNAPSHOTS, image=None):
+        self.path = str(path or cache_dir('mysql'))
+        self.keep = keep
+        self.image = image
+
+    @contextmanager
+    def lock(self):
+        with open(os.path.join(self.path, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def snapshot_path(self, fingerprint):
+        return os.path.join(self.path, fingerprint)
+
+    def get(self, fingerprint):
+        path = self.snapshot_path(fingerprint)
+        return path if os.path.isdir(path) else None
+
+    def ensure(self, fingerprint, initialize):
+        """
+        Returns the data directory initialized for the fingerprint,
+        initializing it first if there is none.
+        """
+        with self.lock():
+            path = self.snapshot_path(fingerprint)
+            if not os.path.isdir(path):
+                logger.info("Initializing a mysqld data directory for schema %s"
+                    % fingerprint)
+                partial = path + '.partial'
+                remove_tree(partial, self.image)
+                os.makedirs(partial)
+                try:
+                    initialize(partial)
+                except BaseException:
+                    remove_tree(partial, self.image)
+                    raise
+                # Only complete directories get their final name.
+                os.rename(partial, path)
+            # The most recently used snapshots are the ones kept.
+            os.utime(path, None)
+            self._prune()
+            return path
+
+    def _prune(self):
+        snapshots = sorted((os.path.join(self.path, name)
+            for name in os.listdir(self.path)
+            if not name.startswith('.') and not name.endswith('.partial')),
+            key=os.path.getmtime, reverse=True)
+        for path in snapshots[self.keep:]:
+            logger.debug("Removing the mysqld data directory %s" % path)
+            remove_tree(path, self.image)
+
+    def seed(self, fingerprint, destination, initialize):
+        """
+        Gives `destination` a clone of the data directory initialized for the
+        fingerprint, unless it already has one, and returns whether it did.
+        Existing data directories are never replaced, even when they were
+        seeded for another schema, since they hold the stack's data.
+        """
+        marker = destination + '.fingerprint'
+        if os.path.isdir(destination):
+            try:
+                with open(marker) as f:
+                    seeded = f.read().strip()
+            except (IOError, OSError):
+                seeded = None
+            if seeded and seeded != fingerprint:
+                logger.info("%s was seeded for schema %s rather than %s, "
+                    "remove it to seed it again" % (destination, seeded,
+                    fingerprint))
+            return False
+
+        source = self.ensure(fingerprint, initialize)
+        parent = os.path.dirname(destination)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+        partial = destination + '.partial'
+        remove_tree(partial, self.image)
+        try:
+            clone_tree(source, partial, self.image)
+        except (IOError, OSError, shutil.Error, CompCommandError) as e:
+            remove_tree(partial, self.image)
+            raise CompCommandError("Could not seed %s: %s" % (destination, e))
+        os.rename(partial, destination)
+        write_atomic(marker, fingerprint)
+        return True
@@ -0,0 +1,429 @@
+from __future__ import absolute_import
+
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .steps import fingerprint
+from .utils.cache import JSONCache
+from .utils.exceptions import CompCommandError
+from .utils.logging import get_logger
+from .utils.runner import run
+
+
+__all__ = ('Check', 'CheckResult', 'Doctor', 'default_checks', )
+
+
+logger = get_logger()
+
+
+# How long (in seconds) a passing check's result is reused for while its
+# inputs (binaries, config files) are unchanged.
+DOCTOR_TTL = 24 * 3600
+
+# How long each check is given, unless it says otherwise.
+DEFAULT_CHECK_TIMEOUT = 5
+
+
+class CheckFailed(CompCommandError):
+    """
+    Raised by a check, with what is wrong and how to fix it.
+    """
+    def __init__(self, message, hint=None):
+        super(CheckFailed, self).__init__(message)
+        self.hint = hint
+
+
+class Check(object):
+    """
+    A prerequisite of comp-community, like a binary being installed.
+
+    `func` returns a short description of what it found, and raises
+    CheckFailed when the prerequisite is not met.  `inputs` returns the
+    paths whose content decides the outcome (e.g. the binary, a config
+    file): as long as none of them changed, a check that passed is not run
+    again, unless one of the `environ` variables changed.  Checks without
+    inputs (like whether the daemon is running) always run.
+    """
+    def __init__(self, name, func, inputs=None, environ=None,
+            timeout=DEFAULT_CHECK_TIMEOUT, platforms=None):
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.environ = environ or []
+        self.timeout = timeout
+        self.platforms = platforms
+
+    @property
+    def applies(self):
+        return not self.platforms or any(
+            sys.platform.startswith(p) for p in self.platforms)
+
+    def fingerprint(self):
+        if self.inputs is None:
+            return None
+        stats = []
+        for path in self.inputs():
+            try:
+                stat = os.stat(path) if path else None
+            except OSError:
+                stat = None
+            stats.append((path, stat.st_mtime, stat.st_size) if stat else (path,))
+        return fingerprint([stats, [os.environ.get(v) for v in self.environ]])
+
+
+class CheckResult(object):
+
+    OK = 'ok'
+    FAILED = 'failed'
+    TIMEOUT = 'timeout'
+
+    def __init__(self, check, status, detail=None, hint=None, elapsed=None,
+            cached=False):
+        self.check = check
+        self.status = status
+        self.detail = detail
+        self.hint = hint
+        self.elapsed = elapsed
+        self.cached = cached
+
+    @property
+    def ok(self):
+        return self.status == self.OK
+
+    def __repr__(self):
+        return "CheckResult(%r, %r)" % (self.check.name, self.status)
+
+
+class Doctor(object):
+    """
+    Runs the checks concurrently, each with its own timeout, reusing the
+    results of the ones that passed before and whose inputs did not change.
+
+    >>> results = Doctor(default_checks(root_dir)).run()
+    """
+    def __init__(self, checks, cache=None, max_workers=None, use_cache=True):
+        self.checks = [c for c in checks if c.applies]
+        self.cache = cache or JSONCache('doctor', ttl=DOCTOR_TTL)
+        # Every check gets a thread, so that none waits for a slow one before
+        # its timeout starts.
+        self.max_workers = max_workers or max(1, len(self.checks))
+        self.use_cache = use_cache
+
+    def _run_check(self, check):
+        started = time.time()
+        try:
+            detail = check.func()
+        except CheckFailed as e:
+            return CheckResult(check, CheckResult.FAILED, str(e), hint=e.hint,
+                elapsed=time.time() - started)
+        except Exception as e:
+            return CheckResult(check, CheckResult.FAILED, "%s" % (e or
+                e.__class__.__name__), elapsed=time.time() - started)
+        return CheckResult(check, CheckResult.OK, detail,
+            elapsed=time.time() - started)
+
+    def _cached(self, check, key):
+        entry = self.cache.get(check.name) if self.use_cache else None
+        if key is None or not entry or entry.get('fingerprint') != key:
+            return None
+        return CheckResult(check, CheckResult.OK, entry.get('detail'),
+            elapsed=0, cached=True)
+
+    def run(self):
+        results = {}
+        pending = {}
+        keys = dict((c.name, c.fingerprint()) for c in self.checks)
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            started = time.time()
+            for check in self.checks:
+                cached = self._cached(check, keys[check.name])
+                if cached is not None:
+                    results[check.name] = cached
+                else:
+                    pending[executor.submit(self._run_check, check)] = check
+
+            while pending:
+                now = time.time()
+                timeout = min(started + c.timeout for c in pending.values()) - now
+                done, _ = wait(list(pending), timeout=max(0, timeout))
+                for future in done:
+                    results[pending.pop(future).name] = future.result()
+                now = time.time()
+                for future, check in list(pending.items()):
+                    if now - started >= check.timeout:
+                        # The thread is left to finish on its own, the
+                        # commands checks run have timeouts of their own.
+                        del pending[future]
+                        results[check.name] = CheckResult(check,
+                            CheckResult.TIMEOUT, "did not finish within %ss"
+                            % check.timeout, elapsed=now - started)
+        finally:
+            executor.shutdown(wait=False)
+
+        for check in self.checks:
+            result = results[check.name]
+            key = keys[check.name]
+            if result.cached or key is None:
+                continue
+            if result.ok:
+                self.cache.set(check.name, {'fingerprint': key,
+                    'detail': result.detail})
+            else:
+                self.cache.delete(check.name)
+        self.cache.save()
+        return [results[c.name] for c in self.checks]
+
+
+def _which(name):
+    return shutil.which(name)
+
+
+def _version(argv, timeout=DEFAULT_CHECK_TIMEOUT):
+    result = run(argv, retcode=None, log=logger.debug, timeout=timeout,
+        capture=True)
+    if result.retcode != 0:
+        raise CheckFailed("`%s` failed: %s" % (' '.join(argv),
+            result.tail[-1] if result.tail else result.retcode))
+    return result.stdout_tail[0].strip() if result.stdout_tail else ''
+
+
+def check_docker_environment():
+    # Leftovers from docker-machine point the CLI at a VM that is not used.
+    if os.environ.get('DOCKER_MACHINE_NAME'):
+        raise CheckFailed("docker-machine's environment is set",
+            hint="Remove the DOCKER_* variables from your .bash_profile")
+    if sys.platform == 'darwin':
+        data = os.path.expanduser(
+            '~/Library/Containers/com.docker.docker/Data')
+        if not os.path.isdir(data):
+            raise CheckFailed("Docker for Mac is not installed",
+                hint="Install it from https://www.docker.com/docker-mac")
+    return "no docker-machine environment"
+
+
+def check_binary(name, version_args=None, hint=None):
+    def check():
+        path = _which(name)
+        if not path:
+            raise CheckFailed("%s is not on the PATH" % name, hint=hint)
+        if version_args:
+            return _version([path] + list(version_args))
+        return path
+    return check
+
+
+def check_docker_daemon():
+    from .backends import get_engine_client
+
+    client = get_engine_client()
+    if client.ping(timeout=2):
+        version = client.get('/version').json().get('Version')
+        return "daemon %s" % version if version else "daemon is running"
+    # Without the socket (e.g. DOCKER_HOST points elsewhere), ask the CLI.
+    if _which('docker'):
+        return "daemon %s" % _version(['docker', 'version', '--format',
+            '{{.Server.Version}}'])
+    raise CheckFailed("The Docker daemon is not running",
+        hint="Start Docker, and run `comp doctor` again")
+
+
+def check_brew_package(package):
+    """
+    Looks for the package's keg in the Cellar, rather than forking `brew ls`.
+    """
+    def check():
+        for cellar in _brew_cellars():
+            path = os.path.join(cellar, package)
+            if os.path.isdir(path) and os.listdir(path):
+                return "%s %s" % (package, sorted(os.listdir(path))[-1])
+        raise CheckFailed("brew package %s is not installed" % package,
+            hint="brew install %s" % package)
+    return check
+
+
+def _brew_cellars():
+    return [c for c in ('/usr/local/Cellar', '/opt/homebrew/Cellar')
+        if os.path.isdir(c)]
+
+
+def check_virtualenv(root):
+    def check():
+        if not os.path.exists(os.path.join(str(root), 'pyvenv.cfg')) and \
+                not os.path.exists(os.path.join(str(root), 'bin', 'activate')):
+            raise CheckFailed("%s is not a virtualenv" % root,
+                hint="virtualenv --no-download --python=python3.7 %s" % root)
+        return "found in %s" % root
+    return check
+
+
+def _gitconfig_files():
+    """
+    The user's global git config files, in the order git reads them (later
+    values win).
+    """
+    if os.environ.get('GIT_CONFIG_GLOBAL'):
+        return [os.path.expanduser(os.environ['GIT_CONFIG_GLOBAL'])]
+    home = os.path.expanduser('~')
+    return [os.path.join(
+        os.environ.get('XDG_CONFIG_HOME') or os.path.join(home, '.config'),
+        'git', 'config'), os.path.join(home, '.gitconfig')]
+
+
+def _gitconfig_value(raw):
+    """
+    A value as git reads it: without its comment, quotes and escapes.
+
+    >>> _gitconfig_value('"Nick Florin" # me')
+    >>> 'Nick Florin'
+    """
+    value, quoted, escaped = [], False, False
+    for c in raw:
+        if escaped:
+            value.append({'n': '\n', 't': '\t', 'b': '\b'}.get(c, c))
+            escaped = False
+        elif c == '\\':
+            escaped = True
+        elif c == '"':
+            quoted = not quoted
+        elif c in '#;' and not quoted:
+            break
+        else:
+            value.append(c)
+    return ''.join(value).strip()
+
+
+def _read_gitconfig(path):
+    """
+    Returns the user.* values of a git config file, and the paths of the
+    files it includes (with include or includeIf).
+    """
+    try:
+        with open(path) as f:
+            content = f.read()
+    except (IOError, OSError):
+        return {}, []
+    found, includes = {}, []
+    section = None
+    for line in content.splitlines():
+        line = line.strip()
+        header = re.match(r'^\[([^\]\s]+)[^\]]*\]', line)
+        if header:
+            section = header.group(1).lower()
+            continue
+        match = re.match(r'^([\w-]+)\s*=\s*(.*)$', line)
+        if not match:
+            continue
+        key, value = match.group(1).lower(), _gitconfig_value(match.group(2))
+        if section == 'user':
+            found[key] = value
+        elif section in ('include', 'includeif') and key == 'path':
+            includes.append(os.path.join(os.path.dirname(path),
+                os.path.expanduser(value)))
+    return found, includes
+
+
+def _gitconfig_paths():
+    paths = _gitconfig_files()
+    for path in list(paths):
+        paths += _read_gitconfig(path)[1]
+    return paths
+
+
+def check_gitconfig():
+    """
+    Reads the user's name and email from the git config files directly,
+    rather than forking `git config` for each of them.  Files that include
+    others (possibly depending on the repository, with includeIf) are left
+    to `git config` to resolve.
+    """
+    found, includes = {}, []
+    for path in _gitconfig_files():
+        values, included = _read_gitconfig(path)
+        found.update(values)
+        includes += included
+    if includes:
+        found = {}
+        for key in ('name', 'email'):
+            # --global does not follow includes unless told to.
+            result = run(['git', 'config', '--global', '--includes',
+                '--get', 'user.%s' % key], retcode=None, log=logger.debug,
+                timeout=DEFAULT_CHECK_TIMEOUT)
+            if result.retcode == 0:
+                found[key] = result.stdout.strip()
+    missing = [k for k in ('name', 'email') if not found.get(k)]
+    if missing:
+        raise CheckFailed("git user.%s %s not set" % (" and user.".join(missing),
+            'is' if len(missing) == 1 else 'are'),
+            hint="git config --global user.name 'Your Name' && "
+                "git config --global user.email you@example.com")
+    return "%s <%s>" % (found['name'], found['email'])
+
+
+def check_api_repository(root):
+    def check():
+        api_root = os.path.join(str(root), 'www', 'api')
+        if not os.path.exists(os.path.join(api_root, '.git')):
+            raise CheckFailed("comp-community-api is not cloned into www/api",
+                hint="comp repos sync")
+        return api_root
+    return check
+
+
+def check_ports():
+    from .app_ports import app_ports
+    from .base import root_dir
+    from .ports import find_conflicts, published_ports
+
+    # The active project's own containers are not conflicts.
+    conflicts = find_conflicts(sorted(app_ports.values()),
+        exclude=published_ports(root_dir))
+    if conflicts:
+        raise CheckFailed("; ".join(str(c) for c in conflicts),
+            hint="Stop whatever is listening, or use --instance")
+    return ", ".join(str(p) for p in sorted(app_ports.values())) + " free"
+
+
+def default_checks(root):
+    """
+    The prerequisites `config/setup-docker` checks once it installed comp.
+    """
+    def binary(name):
+        return lambda: [_which(name)]
+
+    def brew_package(package):
+        return lambda: [os.path.join(c, package) for c in _brew_cellars()]
+
+    return [
+        Check('docker environment', check_docker_environment,
+            inputs=lambda: [os.path.expanduser(
+                '~/Library/Containers/com.docker.docker/Data')],
+            environ=['DOCKER_MACHINE_NAME']),
+        Check('docker', check_binary('docker', ['--version'],
+            hint="Install Docker"), inputs=binary('docker')),
+        Check('docker-compose', check_binary('docker-compose',
+            ['version', '--short'], hint="pip install docker-compose"),
+            inputs=binary('docker-compose')),
+        Check('docker daemon', check_docker_daemon, timeout=10),
+        Check('homebrew', check_binary('brew',
+            hint="See https://brew.sh"), inputs=binary('brew'),
+            platforms=['darwin']),
+        Check('brew: git', check_brew_package('git'),
+            inputs=brew_package('git'), platforms=['darwin']),
+        Check('git', check_binary('git', ['--version'],
+            hint="Install git"), inputs=binary('git')),
+        Check('virtualenv', check_binary('virtualenv', ['--version'],
+            hint="pip install virtualenv"), inputs=binary('virtualenv')),
+        Check('comp virtualenv', check_virtualenv(root),
+            inputs=lambda: [os.path.join(str(root), 'pyvenv.cfg')]),
+        Check('git config', check_gitconfig, inputs=_gitconfig_paths,
+            environ=['GIT_CONFIG_GLOBAL', 'HOME', 'XDG_CONFIG_HOME']),
+        Check('api repository', check_api_repository(root),
+            inputs=lambda: [os.path.join(str(root), 'www', 'api', '.git')]),
+        Check('ports', check_ports),
+    ]
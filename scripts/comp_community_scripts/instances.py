@@ -0,0 +1,276 @@
+from __future__ import absolute_import
+
+import errno
+import fcntl
+import json
+import os
+import socket
+import time
+from contextlib import contextmanager
+
+from plumbum import local
+
+from .utils.cache import cache_dir, write_atomic
+from .utils.exceptions import InstanceConflictError, PortAllocationError
+from .utils.logging import get_logger
+
+
+__all__ = ('PortLeases', 'Lease', 'activate', 'active_project',
+    'instance_project', 'port_setting', 'port_in_use', )
+
+
+logger = get_logger()
+
+
+# The host ports instances are given ports from, as "first-last", can be
+# changed with COMP_PORT_RANGE.
+DEFAULT_PORT_RANGE = (20000, 29999)
+
+# The project of the instance comp is operating on, set by --instance or
+# --project, which app_ports looks the instance's ports up by.
+PROJECT_SETTING = 'COMP_PROJECT'
+
+# A lease whose ports are not in use is only reclaimed once the process that
+# took it exited, or after this many seconds (in case the pid was reused).
+LEASE_TTL = 7 * 24 * 3600
+
+
+def port_setting(app):
+    """
+    The variable the compose files publish an app's port with.
+
+    >>> port_setting('api')
+    >>> 'COMP_API_PORT'
+    """
+    return 'COMP_%s_PORT' % app.upper().replace('-', '_')
+
+
+def port_range():
+    setting = os.environ.get('COMP_PORT_RANGE')
+    if not setting:
+        return DEFAULT_PORT_RANGE
+    first, _, last = setting.partition('-')
+    return int(first), int(last or first)
+
+
+def port_in_use(port, host='0.0.0.0'):
+    """
+    Whether something (like docker's proxy for a published port) is bound to
+    the port.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind((host, port))
+    except (OSError, socket.error) as e:
+        return e.errno in (errno.EADDRINUSE, errno.EACCES)
+    finally:
+        sock.close()
+    return False
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class Lease(object):
+
+    def __init__(self, project, ports, pid=None, root=None, time=None):
+        self.project = project
+        self.ports = ports
+        self.pid = pid
+        self.root = root
+        self.time = time
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(**data)
+
+    def to_json(self):
+        return {
+            'project': self.project,
+            'ports': self.ports,
+            'pid': self.pid,
+            'root': self.root,
+            'time': self.time,
+        }
+
+    @property
+    def stale(self):
+        """
+        Whether the instance is gone: the process that took the lease exited
+        (or the lease is older than LEASE_TTL), and none of its ports are
+        bound, which they are while its containers run.
+        """
+        if self.pid and _process_alive(self.pid) and \
+                time.time() - (self.time or 0) < LEASE_TTL:
+            return False
+        return not any(port_in_use(port) for port in self.ports.values())
+
+    def __repr__(self):
+        return "Lease(%r, %r)" % (self.project, self.ports)
+
+
+class PortLeases(object):
+    """
+    A registry of the host ports leased to each instance (compose project),
+    shared by every checkout on the machine, so that several stacks can run
+    side by side without their published ports colliding.
+
+    >>> leases = PortLeases()
+    >>> leases.lease('compcommunity2', ['api', 'admin'], root=root_dir)
+    >>> {'api': 20000, 'admin': 20001}
+
+    The registry is a JSON file that is only read and written under an
+    exclusive lock, so that instances started at the same time are never
+    given the same ports.  Leases of instances that are gone (see
+    Lease.stale) are reclaimed whenever a new lease is needed.
+    """
+    def __init__(self, path=None, ports=None):
+        self.path = path or os.path.join(cache_dir('ports'), 'leases.json')
+        self.ports = ports or port_range()
+
+    @contextmanager
+    def lock(self):
+        with open(self.path + '.lock', 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            data = {}
+        return dict((project, Lease.from_json(lease))
+            for project, lease in data.items())
+
+    def _save(self, leases):
+        write_atomic(self.path, json.dumps(dict(
+            (project, lease.to_json()) for project, lease in leases.items()),
+            indent=2, sort_keys=True))
+
+    def all(self):
+        with self.lock():
+            return self._load()
+
+    def get(self, project):
+        return self.all().get(project)
+
+    def _reclaim(self, leases, keep=None):
+        reclaimed = [p for p, lease in leases.items()
+            if p != keep and lease.stale]
+        for project in reclaimed:
+            logger.debug("Reclaiming the ports of %s" % project)
+            del leases[project]
+        return reclaimed
+
+    def reclaim(self):
+        """
+        Removes the leases of the instances that are gone, and returns their
+        projects.
+        """
+        with self.lock():
+            leases = self._load()
+            reclaimed = self._reclaim(leases)
+            if reclaimed:
+                self._save(leases)
+            return reclaimed
+
+    def lease(self, project, apps, root=None):
+        """
+        Returns the ports leased to the project for each of the apps, leasing
+        free ports for the ones it does not have yet.  A lease that already
+        exists is kept (and renewed), so an instance keeps its ports across
+        restarts.
+
+        Only one instance of a checkout can hold a lease at a time: they all
+        bind-mount its www/api, and with it the api's SQLite database, which
+        two instances would overwrite each other's data in.  Parallel stacks
+        need a checkout (e.g. a `git worktree`) each.
+        """
+        with self.lock():
+            leases = self._load()
+            lease = leases.get(project) or Lease(project, {})
+            self._reclaim(leases, keep=project)
+            if root:
+                sharing = sorted(other.project for other in leases.values()
+                    if other.project != project and other.root
+                    and os.path.realpath(other.root) == os.path.realpath(str(root)))
+                if sharing:
+                    raise InstanceConflictError("%s is already running from "
+                        "%s, whose database it would share, use another "
+                        "checkout (e.g. a git worktree) to run both"
+                        % (", ".join(sharing), root))
+            missing = [app for app in apps if app not in lease.ports]
+            if missing:
+                taken = set(port for other in leases.values()
+                    for port in other.ports.values())
+                taken.update(lease.ports.values())
+                for app in missing:
+                    lease.ports[app] = self._free_port(taken)
+                    taken.add(lease.ports[app])
+
+            lease.pid = os.getpid()
+            lease.root = str(root) if root else lease.root
+            lease.time = time.time()
+            leases[project] = lease
+            self._save(leases)
+            return dict(lease.ports)
+
+    def _free_port(self, taken):
+        first, last = self.ports
+        for port in range(first, last + 1):
+            if port not in taken and not port_in_use(port):
+                return port
+        raise PortAllocationError("No free ports left in %d-%d (see "
+            "COMP_PORT_RANGE)" % (first, last))
+
+    def release(self, project):
+        with self.lock():
+            leases = self._load()
+            if leases.pop(project, None) is not None:
+                self._save(leases)
+                return True
+            return False
+
+
+def instance_project(root, instance=None, project=None):
+    """
+    The compose project of an instance: either the one given, or the
+    checkout's project numbered by the instance, normalized as docker-compose
+    does, so that it is the name its containers are labeled with.
+
+    >>> instance_project(root_dir, instance=2)
+    >>> 'compcommunity2'
+    """
+    from .compose import normalize_project_name, project_name
+
+    if project:
+        return normalize_project_name(project)
+    return '%s%d' % (project_name(root), instance)
+
+
+def active_project():
+    return os.environ.get(PROJECT_SETTING) or None
+
+
+def activate(root, project, apps, leases=None):
+    """
+    Makes comp (and the docker-compose processes it runs) operate on the
+    project, with its apps published on the ports leased to it, and returns
+    those ports.
+    """
+    ports = (leases or PortLeases()).lease(project, apps, root=root)
+    settings = {'COMPOSE_PROJECT_NAME': project, PROJECT_SETTING: project}
+    for app, port in ports.items():
+        settings[port_setting(app)] = str(port)
+    os.environ.update(settings)
+    local.env.update(**settings)
+    return ports
@@ -0,0 +1,437 @@
+from __future__ import absolute_import
+
+import json
+import math
+import random
+import time
+from array import array
+
+from .utils.logging import get_logger
+
+
+__all__ = ('LatencyHistogram', 'RequestSpec', 'LoadTest', 'LoadTestResult',
+    'StandInServer', )
+
+
+logger = get_logger()
+
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram(object):
+    """
+    Latencies (in microseconds) counted in log-linear buckets, like
+    HdrHistogram: every power of two is split into the same number of linear
+    sub-buckets, so that any recorded value is within a fixed relative error
+    (under 1% with the default 2 significant figures) of the value reported
+    for it, from microseconds to minutes, in a few thousand counters.
+
+    >>> histogram = LatencyHistogram()
+    >>> histogram.record(1250)
+    >>> histogram.percentile(99)
+
+    Recording is an index computation and an increment, so it does not skew
+    the latencies it measures, and histograms from several runs can be added
+    up with `merge`.
+    """
+    def __init__(self, highest=60 * 1000 * 1000, significant_figures=2):
+        self.highest = highest
+        self.significant_figures = significant_figures
+        self.sub_bucket_bits = int(math.ceil(math.log(
+            2 * 10 ** significant_figures, 2)))
+        self.sub_bucket_count = 1 << self.sub_bucket_bits
+        self.sub_bucket_half = self.sub_bucket_count >> 1
+        self.counts = array('L', [0]) * (self._index(highest) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        bucket = max(0, value.bit_length() - self.sub_bucket_bits)
+        if bucket == 0:
+            return value
+        return (self.sub_bucket_count + (bucket - 1) * self.sub_bucket_half +
+            (value >> bucket) - self.sub_bucket_half)
+
+    def _value(self, index):
+        """
+        The highest value counted in the bucket at the index.
+        """
+        if index < self.sub_bucket_count:
+            return index
+        bucket, sub = divmod(index - self.sub_bucket_count, self.sub_bucket_half)
+        bucket += 1
+        return ((sub + self.sub_bucket_half + 1) << bucket) - 1
+
+    def record(self, value, count=1):
+        value = min(max(0, int(value)), self.highest)
+        self.counts[self._index(value)] += count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.total / float(self.count) if self.count else None
+
+    def percentile(self, percentile):
+        if not self.count:
+            return None
+        target = max(1, int(math.ceil(percentile / 100.0 * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def to_json(self):
+        return {
+            'significant_figures': self.significant_figures,
+            'highest': self.highest,
+            'counts': dict((str(i), c) for i, c in enumerate(self.counts) if c),
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        histogram = cls(highest=data['highest'],
+            significant_figures=data['significant_figures'])
+        for index, count in data['counts'].items():
+            histogram.counts[int(index)] = count
+            histogram.count += count
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+
+class RequestSpec(object):
+    """
+    A kind of request in the mix, and how often it is sent relative to the
+    others.
+
+    >>> RequestSpec.parse('POST /api/v1/auth/token/ 2')
+    >>> RequestSpec('POST', '/api/v1/auth/token/', weight=2)
+    """
+    def __init__(self, method, path, weight=1, body=None, headers=None):
+        self.method = method.upper()
+        self.path = path
+        self.weight = float(weight)
+        self.body = body
+        self.headers = headers or {}
+
+    @classmethod
+    def parse(cls, value):
+        parts = value.split()
+        if len(parts) == 1:
+            return cls('GET', parts[0])
+        if len(parts) == 2:
+            return cls(parts[0], parts[1])
+        if len(parts) == 3:
+            return cls(parts[0], parts[1], weight=parts[2])
+        raise ValueError("Invalid request %r, expected [METHOD] PATH [WEIGHT]"
+            % value)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a mix from a JSON file, as a list of objects with a method, a
+        path, and optionally a weight, body and headers.
+        """
+        with open(path) as f:
+            return [cls(**spec) for spec in json.load(f)]
+
+    def to_json(self):
+        return {'method': self.method, 'path': self.path, 'weight': self.weight}
+
+    def __repr__(self):
+        return "RequestSpec(%r, %r, weight=%r)" % (self.method, self.path,
+            self.weight)
+
+
+class LoadTestResult(object):
+
+    def __init__(self, histogram, statuses, errors, elapsed, config):
+        self.histogram = histogram
+        self.statuses = statuses
+        self.errors = errors
+        self.elapsed = elapsed
+        self.config = config
+
+    @property
+    def requests(self):
+        return self.histogram.count
+
+    @property
+    def throughput(self):
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def latencies(self):
+        """
+        The percentiles (and mean and max) of the latencies, in milliseconds.
+        """
+        latencies = dict(('p%s' % str(p).replace('.', ''),
+            _ms(self.histogram.percentile(p))) for p in PERCENTILES)
+        latencies['mean'] = _ms(self.histogram.mean)
+        latencies['max'] = _ms(self.histogram.max)
+        return latencies
+
+    def to_json(self):
+        return {
+            'config': self.config,
+            'elapsed': self.elapsed,
+            'requests': self.requests,
+            'throughput': self.throughput,
+            'statuses': dict((str(k), v) for k, v in self.statuses.items()),
+            'errors': self.errors,
+            'latency_ms': self.latencies(),
+            'histogram': self.histogram.to_json(),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(LatencyHistogram.from_json(data['histogram']),
+            data['statuses'], data['errors'], data['elapsed'], data['config'])
+
+    def save(self, path):
+        from .utils.cache import write_atomic
+
+        write_atomic(path, json.dumps(self.to_json(), indent=2, sort_keys=True))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_json(json.load(f))
+
+
+def _ms(microseconds):
+    return microseconds / 1000.0 if microseconds is not None else None
+
+
+class LoadTest(object):
+    """
+    Sends a mix of requests to `url` for `duration` seconds, over up to
+    `concurrency` connections at once, with tornado's AsyncHTTPClient.
+
+    >>> LoadTest('http://localhost:8000', [RequestSpec('GET', '/')],
+    >>>     concurrency=32, duration=30, rate=500).run()
+
+    Without a `rate`, the test is closed-loop: each connection sends its next
+    request as soon as the previous one completes, which measures the most
+    the API can serve.  With a `rate`, it is open-loop: requests are sent at
+    that fixed rate regardless of how long they take, and their latency is
+    measured from when they were due to be sent, so that a stalled server
+    shows up in the latencies rather than only in a lower request rate
+    (see "coordinated omission").
+    """
+    def __init__(self, url, mix, concurrency=16, duration=10, rate=None,
+            timeout=30, seed=None):
+        self.url = url.rstrip('/')
+        self.mix = mix
+        self.concurrency = concurrency
+        self.duration = duration
+        self.rate = rate
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.histogram = LatencyHistogram(highest=int(timeout * 1000 * 1000))
+        self.statuses = {}
+        self.errors = {}
+        self._weights = []
+        total = 0
+        for spec in mix:
+            total += spec.weight
+            self._weights.append(total)
+
+    @property
+    def mode(self):
+        return 'open' if self.rate else 'closed'
+
+    def choose(self):
+        import bisect
+
+        return self.mix[bisect.bisect_right(self._weights,
+            self.random.random() * self._weights[-1])]
+
+    def request(self, spec):
+        from tornado.httpclient import HTTPRequest
+
+        return HTTPRequest(self.url + spec.path, method=spec.method,
+            headers=spec.headers, body=spec.body if spec.body is not None else (
+                '' if spec.method in ('POST', 'PUT', 'PATCH') else None),
+            request_timeout=self.timeout, connect_timeout=self.timeout,
+            follow_redirects=False)
+
+    async def fetch(self, client, spec, due):
+        from tornado.httpclient import HTTPError
+
+        try:
+            response = await client.fetch(self.request(spec), raise_error=False)
+            code = response.code
+            error = response.error if code == 599 else None
+        except HTTPError as e:
+            code, error = e.code, e
+        except Exception as e:
+            code, error = None, e
+        self.histogram.record((time.time() - due) * 1000 * 1000)
+        if error is not None and (code is None or code == 599):
+            name = error.__class__.__name__
+            self.errors[name] = self.errors.get(name, 0) + 1
+        else:
+            self.statuses[code] = self.statuses.get(code, 0) + 1
+
+    async def _closed_loop(self, client, deadline):
+        async def worker():
+            while time.time() < deadline:
+                await self.fetch(client, self.choose(), time.time())
+
+        from tornado import gen
+        await gen.multi([worker() for _ in range(self.concurrency)])
+
+    async def _open_loop(self, client, deadline):
+        from tornado import gen
+
+        interval = 1.0 / self.rate
+        started = time.time()
+        pending = []
+        sent = 0
+        while True:
+            due = started + sent * interval
+            if due >= deadline:
+                break
+            delay = due - time.time()
+            if delay > 0:
+                await gen.sleep(delay)
+            # Requests beyond `concurrency` in flight wait in the client's
+            # queue, and that wait counts towards their latency.
+            pending.append(gen.convert_yielded(
+                self.fetch(client, self.choose(), due)))
+            sent += 1
+            if len(pending) > 1024:
+                pending = [f for f in pending if not f.done()]
+        await gen.multi(pending)
+
+    async def _run(self):
+        from tornado.httpclient import AsyncHTTPClient
+
+        client = AsyncHTTPClient(force_instance=True,
+            max_clients=self.concurrency)
+        try:
+            deadline = time.time() + self.duration
+            if self.rate:
+                await self._open_loop(client, deadline)
+            else:
+                await self._closed_loop(client, deadline)
+        finally:
+            client.close()
+
+    def run(self):
+        from tornado.ioloop import IOLoop
+
+        started = time.time()
+        loop = IOLoop()
+        try:
+            loop.run_sync(self._run)
+        finally:
+            loop.close()
+        return LoadTestResult(self.histogram, self.statuses, self.errors,
+            time.time() - started, {
+                'url': self.url,
+                'mode': self.mode,
+                'rate': self.rate,
+                'concurrency': self.concurrency,
+                'duration': self.duration,
+                'mix': [spec.to_json() for spec in self.mix],
+                'started': started,
+            })
+
+
+class StandInServer(object):
+    """
+    A local HTTP server that answers every request after `delay` seconds, to
+    stand in for the API when trying out a load test, or the load generator
+    itself.  It runs on a thread of its own, so that it does not share an
+    event loop with the load test.
+
+    >>> with StandInServer(delay=0.005) as server:
+    >>>     LoadTest(server.url, mix).run()
+    """
+    def __init__(self, delay=0.0, port=0):
+        self.delay = delay
+        self.port = port
+        self.loop = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.port
+
+    def _serve(self, ready):
+        from tornado import gen, web
+        from tornado.httpserver import HTTPServer
+        from tornado.ioloop import IOLoop
+        from tornado.netutil import bind_sockets
+
+        delay = self.delay
+
+        class Handler(web.RequestHandler):
+            async def respond(self, *args):
+                if delay:
+                    await gen.sleep(delay)
+                self.write('ok')
+
+            get = post = put = patch = delete = respond
+
+        sockets = bind_sockets(self.port, address='127.0.0.1')
+        self.port = sockets[0].getsockname()[1]
+        server = HTTPServer(web.Application([(r'.*', Handler)]))
+
+        def listen():
+            # Only once the loop runs is it the current one on this thread.
+            server.add_sockets(sockets)
+            ready.set()
+
+        self.loop = IOLoop()
+        self.loop.add_callback(listen)
+        self.loop.start()
+        server.stop()
+        self.loop.close(all_fds=True)
+
+    def start(self):
+        import threading
+
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._serve, args=(ready,),
+            name='comp-stand-in')
+        self._thread.daemon = True
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.add_callback(self.loop.stop)
+        if self._thread is not None:
+            self._thread.join(5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
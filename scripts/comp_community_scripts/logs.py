@@ -0,0 +1,394 @@
+from __future__ import absolute_import
+
+import asyncio
+import calendar
+import re
+import struct
+import sys
+import time
+
+from .utils.terminal import colors
+
+
+__all__ = ('LogLine', 'LogFilter', 'LogFormatter', 'CommandLogSource',
+    'EngineLogSource', 'LogMultiplexer', 'parse_timestamp', 'SERVICE_COLORS', )
+
+
+# The colors services are told apart by, in the order services are given
+# them.
+SERVICE_COLORS = (colors.CYAN, colors.GREEN, colors.PURPLE, colors.ORANGE,
+    colors.LIGHTBLUE, colors.LIGHTGREEN, colors.LIGHTCYAN, colors.YELLOW,
+    colors.LIGHTRED)
+
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+LEVEL_ALIASES = {'WARN': 'WARNING', 'FATAL': 'CRITICAL', 'ERR': 'ERROR'}
+LEVEL_PATTERN = re.compile(
+    r'\b(DEBUG|INFO|WARN(?:ING)?|ERR(?:OR)?|CRITICAL|FATAL)\b')
+
+# How many lines are buffered for each service before reading more of its
+# log has to wait for them to be written out.
+DEFAULT_BUFFER = 1000
+
+# How long (in seconds) a line is held back for lines with earlier timestamps
+# to arrive from the other services, so that they can be written in order.
+DEFAULT_WINDOW = 0.1
+
+
+def parse_timestamp(value):
+    """
+    Parses the RFC 3339 timestamps (with up to nanoseconds, and trailing
+    zeros trimmed) that Docker prefixes log lines with.
+
+    >>> parse_timestamp('2018-06-02T17:41:09.55123Z')
+    >>> 1527961269.55123
+    """
+    seconds, _, rest = value.partition('.')
+    fraction = re.match(r'\d*', rest).group(0)
+    zone = rest[len(fraction):] if rest else ''
+    if not rest:
+        match = re.match(r'(.*?)(Z|[+-]\d\d:\d\d)?$', seconds)
+        seconds, zone = match.group(1), match.group(2) or ''
+    timestamp = calendar.timegm(time.strptime(seconds, '%Y-%m-%dT%H:%M:%S'))
+    if fraction:
+        timestamp += float('0.' + fraction)
+    if zone and zone != 'Z':
+        sign = 1 if zone[0] == '+' else -1
+        hours, minutes = zone[1:].split(':')
+        timestamp -= sign * (int(hours) * 3600 + int(minutes) * 60)
+    return timestamp
+
+
+class LogLine(object):
+
+    def __init__(self, service, timestamp, text, level=None, stream='stdout'):
+        self.service = service
+        self.timestamp = timestamp
+        self.text = text
+        self.level = level
+        self.stream = stream
+
+    @classmethod
+    def parse(cls, service, line, stream='stdout'):
+        """
+        Splits a line written with `docker logs --timestamps` into its
+        timestamp and text.
+        """
+        stamp, _, text = line.partition(' ')
+        try:
+            timestamp = parse_timestamp(stamp)
+        except ValueError:
+            timestamp, text = time.time(), line
+        return cls(service, timestamp, text, stream=stream)
+
+    def __lt__(self, other):
+        return self.timestamp < other.timestamp
+
+    def __repr__(self):
+        return "LogLine(%r, %r)" % (self.service, self.text)
+
+
+class LogFilter(object):
+    """
+    Decides which lines are written, by a regular expression searched for in
+    them and by their minimum level.
+
+    A line's level is the first level name in it, and lines without one
+    (like the rest of a traceback) take the level of the service's previous
+    line.
+    """
+    def __init__(self, pattern=None, level=None):
+        self.pattern = re.compile(pattern) if pattern else None
+        self.level = LEVELS.index(self.normalize_level(level)) if level else None
+        self._last_levels = {}
+
+    @classmethod
+    def normalize_level(cls, level):
+        level = LEVEL_ALIASES.get(level.upper(), level.upper())
+        if level not in LEVELS:
+            raise ValueError("Invalid level %s, must be one of: %s"
+                % (level, ", ".join(LEVELS)))
+        return level
+
+    def detect_level(self, line):
+        match = LEVEL_PATTERN.search(line.text)
+        if match:
+            line.level = self.normalize_level(match.group(1))
+            self._last_levels[line.service] = line.level
+        else:
+            line.level = self._last_levels.get(line.service)
+        return line.level
+
+    def __call__(self, line):
+        level = self.detect_level(line)
+        if self.level is not None and (
+                level is None or LEVELS.index(level) < self.level):
+            return False
+        if self.pattern is not None and not self.pattern.search(line.text):
+            return False
+        return True
+
+
+class CommandLogSource(object):
+    """
+    A service's log read from a command, like
+    `docker logs --follow --timestamps <container>`.
+    """
+    def __init__(self, argv):
+        self.argv = argv
+        self.proc = None
+
+    async def lines(self):
+        self.proc = await asyncio.create_subprocess_exec(*self.argv,
+            stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT)
+        try:
+            while True:
+                line = await self.proc.stdout.readline()
+                if not line:
+                    break
+                yield line.decode('utf-8', 'replace').rstrip('\r\n'), 'stdout'
+            await self.proc.wait()
+        finally:
+            self.close()
+
+    def close(self):
+        if self.proc is not None and self.proc.returncode is None:
+            try:
+                self.proc.terminate()
+            except ProcessLookupError:
+                pass
+
+
+class EngineLogSource(object):
+    """
+    A container's log read from the Engine API's /containers/{id}/logs over
+    the daemon's socket, without a `docker logs` process per container.
+
+    Unless the container has a TTY, the daemon multiplexes stdout and stderr
+    into frames with an 8 byte header (the stream, and the frame's size).
+    """
+    STREAMS = {0: 'stdin', 1: 'stdout', 2: 'stderr'}
+
+    def __init__(self, socket_path, url):
+        self.socket_path = socket_path
+        self.url = url
+        self.writer = None
+
+    async def _body(self, reader):
+        status = await reader.readline()
+        parts = status.split(None, 2)
+        if len(parts) < 2 or not parts[1].startswith(b'2'):
+            raise IOError("Could not read logs: %s"
+                % status.decode('utf-8', 'replace').strip())
+        chunked = False
+        while True:
+            header = await reader.readline()
+            if header in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = header.decode('latin-1').partition(':')
+            if name.lower() == 'transfer-encoding' and 'chunked' in value:
+                chunked = True
+
+        if not chunked:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                yield data
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                return
+            yield await reader.readexactly(size)
+            await reader.readline()
+
+    async def lines(self):
+        reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+        self.writer.write(('GET %s HTTP/1.1\r\nHost: docker\r\n'
+            'Connection: close\r\n\r\n' % self.url).encode('ascii'))
+        try:
+            buffered, multiplexed = b'', None
+            pending = {}
+            async for data in self._body(reader):
+                buffered += data
+                if multiplexed is None and len(buffered) >= 8:
+                    multiplexed = buffered[0] in (0, 1, 2) and \
+                        buffered[1:4] == b'\0\0\0'
+                if not multiplexed:
+                    if multiplexed is None:
+                        continue
+                    frames, buffered = [('stdout', buffered)], b''
+                else:
+                    frames = []
+                    while len(buffered) >= 8:
+                        stream, size = struct.unpack('>BxxxL', buffered[:8])
+                        if len(buffered) < 8 + size:
+                            break
+                        frames.append((self.STREAMS.get(stream, 'stdout'),
+                            buffered[8:8 + size]))
+                        buffered = buffered[8 + size:]
+                for stream, frame in frames:
+                    text = pending.pop(stream, b'') + frame
+                    *complete, rest = text.split(b'\n')
+                    if rest:
+                        pending[stream] = rest
+                    for line in complete:
+                        yield line.decode('utf-8', 'replace').rstrip('\r'), stream
+            for stream, rest in list(pending.items()) + [('stdout', buffered)]:
+                if rest:
+                    yield rest.decode('utf-8', 'replace'), stream
+        finally:
+            self.close()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class LogFormatter(object):
+    """
+    Formats lines as `service | text`, with the services' names lined up and
+    each in its own color.
+    """
+    def __init__(self, services, color=True, timestamps=False):
+        self.width = max([len(s) for s in services] + [0])
+        self.colors = dict((service, SERVICE_COLORS[i % len(SERVICE_COLORS)])
+            for i, service in enumerate(sorted(services)))
+        self.color = color
+        self.timestamps = timestamps
+
+    def __call__(self, line):
+        prefix = line.service.ljust(self.width) + ' |'
+        if self.color:
+            prefix = colors.format_text(prefix, color=self.colors[line.service])
+        if self.timestamps:
+            prefix += ' ' + time.strftime('%Y-%m-%dT%H:%M:%S',
+                time.gmtime(line.timestamp)) + ('%.6f' % (line.timestamp % 1))[1:]
+        return '%s %s\n' % (prefix, line.text)
+
+
+class LogMultiplexer(object):
+    """
+    Tails the logs of several services at once, and writes them as a single
+    stream in timestamp order.
+
+    >>> LogMultiplexer({'api': source, 'db': other_source},
+    >>>     log_filter=LogFilter(level='warning')).run()
+
+    Each service's lines are filtered as they are read, and go through a
+    queue of `buffer` lines, so that a service that logs a lot only gets
+    ahead of the others by that much, instead of growing memory without
+    bound.  A line is written once every other service has either caught up
+    with its timestamp or been quiet for `window` seconds.
+
+    Lines are handed to `sink` instead of being written, if it is given.
+    """
+    def __init__(self, sources, log_filter=None, buffer=DEFAULT_BUFFER,
+            window=DEFAULT_WINDOW, color=True, timestamps=False, stream=None,
+            sink=None):
+        self.sources = sources
+        self.filter = log_filter or LogFilter()
+        self.buffer = buffer
+        self.window = window
+        self.format = LogFormatter(sources, color=color, timestamps=timestamps)
+        self.stream = stream or sys.stdout
+        self.sink = sink
+        self.written = 0
+
+    def write(self, line):
+        if self.sink is not None:
+            self.sink(line)
+        else:
+            self.stream.write(self.format(line))
+
+    async def _read(self, service, source, queue, arrived):
+        try:
+            async for text, stream in source.lines():
+                line = LogLine.parse(service, text, stream=stream)
+                if self.filter(line):
+                    await queue.put(line)
+                    arrived.set()
+        except asyncio.CancelledError:
+            # The merge is gone, and would never make room in a full queue
+            # for the end of the source.
+            raise
+        except Exception:
+            await queue.put(None)
+            arrived.set()
+            raise
+        await queue.put(None)
+        arrived.set()
+
+    async def _merge(self, queues, arrived):
+        heads = {}
+        arrived_at = {}
+        finished = set()
+
+        def take(service):
+            queue = queues[service]
+            if service in heads or service in finished or queue.empty():
+                return
+            line = queue.get_nowait()
+            if line is None:
+                finished.add(service)
+            else:
+                heads[service] = line
+                arrived_at[service] = time.time()
+
+        while len(finished) < len(queues):
+            for service in queues:
+                take(service)
+
+            written = False
+            while heads:
+                service = min(heads, key=lambda s: heads[s].timestamp)
+                waiting = any(s not in heads and s not in finished
+                    for s in queues)
+                if waiting and time.time() - arrived_at[service] < self.window:
+                    break
+                self.write(heads.pop(service))
+                self.written += 1
+                written = True
+                take(service)
+            if written and self.sink is None:
+                self.stream.flush()
+
+            if len(finished) < len(queues) or heads:
+                arrived.clear()
+                timeout = None
+                if heads:
+                    timeout = max(0, self.window - (time.time() - min(
+                        arrived_at[s] for s in heads)))
+                try:
+                    await asyncio.wait_for(arrived.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _run(self):
+        queues = dict((service, asyncio.Queue(maxsize=self.buffer))
+            for service in self.sources)
+        arrived = asyncio.Event()
+        readers = [asyncio.ensure_future(self._read(service, source,
+            queues[service], arrived)) for service, source in self.sources.items()]
+        try:
+            await self._merge(queues, arrived)
+        finally:
+            for reader in readers:
+                reader.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+        for reader in readers:
+            if not reader.cancelled() and reader.exception() is not None:
+                raise reader.exception()
+
+    def run(self):
+        if not self.sources:
+            return 0
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self._run())
+        finally:
+            for source in self.sources.values():
+                source.close()
+            loop.close()
+        return self.written
+
@@ -0,0 +1,115 @@
+from __future__ import absolute_import
+
+import hashlib
+import os
+
+from .steps import StepState
+
+
+__all__ = ('find_migration_dirs', 'migration_fingerprints', 'MigrationState',
+    'forget_migrations', )
+
+
+# Directories that never contain an app's migrations, and are not walked.
+IGNORED_DIRS = ('.git', '__pycache__', 'node_modules', 'site-packages',
+    'static', 'media', '.tox', 'venv', '.venv')
+
+
+def find_migration_dirs(root):
+    """
+    Returns the `migrations` package of every Django app under `root`, by the
+    name of its app.
+
+    >>> find_migration_dirs(root_dir / 'www' / 'api')
+    >>> {'accounts': '.../www/api/apps/accounts/migrations'}
+    """
+    found = {}
+    for directory, dirs, files in os.walk(str(root)):
+        dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS)
+        if os.path.basename(directory) == 'migrations' and '__init__.py' in files:
+            found[os.path.basename(os.path.dirname(directory))] = directory
+            # Migrations do not nest apps.
+            dirs[:] = []
+    return found
+
+
+def _hash_directory(directory):
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.py'):
+            continue
+        with open(os.path.join(directory, name), 'rb') as f:
+            digest.update(name.encode('utf-8') + b'\0')
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def migration_fingerprints(root):
+    """
+    Returns a hash of the migration files of every app under `root`, by the
+    name of its app.
+    """
+    return dict((app, _hash_directory(directory))
+        for app, directory in find_migration_dirs(root).items())
+
+
+class MigrationState(object):
+    """
+    Tracks the migration files each app had the last time `comp migrate`
+    applied them to a compose project's database, so that migrating again
+    can be skipped when none of them changed.
+
+    >>> state = MigrationState(root_dir / 'www' / 'api', state_dir / 'migrate.json',
+    >>>     project_name(root_dir), database_path(root_dir))
+    >>> state.pending_apps()
+    >>> ['accounts']
+    >>> state.record()
+
+    Each project and database has its own record, since an instance's
+    database (or one restored from a snapshot) was not migrated along with
+    the others.
+    """
+    def __init__(self, root, path, project, database):
+        self.root = root
+        self.state = StepState(path)
+        self.name = self.key(project, database)
+        self._fingerprints = None
+
+    @staticmethod
+    def key(project, database):
+        return '%s:%s' % (project, os.path.realpath(str(database)))
+
+    @property
+    def fingerprints(self):
+        if self._fingerprints is None:
+            self._fingerprints = migration_fingerprints(self.root)
+        return self._fingerprints
+
+    def pending_apps(self):
+        """
+        Returns the apps whose migrations changed since they were last applied,
+        which is every app if they have never been applied.  Apps whose
+        migrations were removed are not included.
+        """
+        changed = self.state.changed(self.name, self.fingerprints)
+        if changed is None:
+            changed = self.fingerprints
+        return sorted(app for app in changed if app in self.fingerprints)
+
+    def record(self):
+        self.state.record(self.name, self.fingerprints)
+
+    def forget(self):
+        self.state.forget(self.name)
+
+
+def forget_migrations(path, database):
+    """
+    Forgets which migrations were applied to the database, in every project,
+    e.g. after its content was replaced.
+    """
+    state = StepState(path)
+    suffix = MigrationState.key('', database)
+    for name in list(state.steps):
+        if name.endswith(suffix):
+            state.forget(name)
@@ -0,0 +1,200 @@
+from __future__ import absolute_import
+
+import os
+import socket
+import struct
+
+from .utils.logging import get_logger
+
+
+__all__ = ('ListeningSocket', 'listening_sockets', 'socket_owners',
+    'find_conflicts', 'published_ports', )
+
+
+logger = get_logger()
+
+
+PROC_NET_TCP = ('/proc/net/tcp', '/proc/net/tcp6')
+
+# The `st` column of /proc/net/tcp, see include/net/tcp_states.h.
+TCP_LISTEN = '0A'
+
+
+class ListeningSocket(object):
+
+    def __init__(self, address, port, inode=None, pid=None, command=None):
+        self.address = address
+        self.port = port
+        self.inode = inode
+        self.pid = pid
+        self.command = command
+
+    @property
+    def owner(self):
+        if self.pid is None:
+            return "unknown process (owned by another user)"
+        return "%s (pid %s)" % (self.command or '?', self.pid)
+
+    def __str__(self):
+        return "Port %s is in use on %s by %s" % (
+            self.port, self.address, self.owner)
+
+
+def _decode_address(hex_address):
+    """
+    Decodes the `local_address` column of /proc/net/tcp{,6}, which is the
+    address as 32 bit words in host byte order followed by the port in hex.
+
+    >>> _decode_address('0100007F:1F40')
+    >>> ('127.0.0.1', 8000)
+    """
+    address, port = hex_address.split(':')
+    packed = b''.join(struct.pack('=I', int(address[i:i + 8], 16))
+        for i in range(0, len(address), 8))
+    family = socket.AF_INET if len(packed) == 4 else socket.AF_INET6
+    return socket.inet_ntop(family, packed), int(port, 16)
+
+
+def _proc_listening_sockets():
+    sockets = []
+    for path in PROC_NET_TCP:
+        try:
+            with open(path) as f:
+                lines = f.readlines()[1:]
+        except (IOError, OSError):
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 10 or fields[3] != TCP_LISTEN:
+                continue
+            address, port = _decode_address(fields[1])
+            sockets.append(ListeningSocket(address, port, inode=int(fields[9])))
+    return sockets
+
+
+def _psutil_listening_sockets():
+    """
+    Fallback for platforms without /proc (i.e. macOS), where psutil has to
+    ask the kernel about each process and may only see our own.
+    """
+    import psutil
+
+    sockets = []
+    try:
+        connections = psutil.net_connections(kind='tcp')
+    except psutil.AccessDenied:
+        connections = []
+        for proc in psutil.process_iter():
+            try:
+                connections += [c._replace(pid=proc.pid)
+                    for c in proc.connections(kind='tcp')]
+            except (psutil.AccessDenied, psutil.NoSuchProcess):
+                continue
+    for conn in connections:
+        if conn.status == psutil.CONN_LISTEN:
+            sockets.append(ListeningSocket(conn.laddr[0], conn.laddr[1],
+                pid=conn.pid))
+    return sockets
+
+
+def socket_owners(inodes, proc='/proc'):
+    """
+    Maps socket inodes to the PIDs that have them open, by reading the links
+    in /proc/<pid>/fd once.  Processes owned by other users cannot be read
+    without privileges and are skipped, rather than escalating with sudo.
+    """
+    wanted = set('socket:[%d]' % inode for inode in inodes)
+    owners = {}
+    if not wanted:
+        return owners
+    for pid in os.listdir(proc):
+        if not pid.isdigit():
+            continue
+        fd_dir = os.path.join(proc, pid, 'fd')
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        for fd in fds:
+            try:
+                target = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if target in wanted:
+                owners[int(target[8:-1])] = int(pid)
+                wanted.discard(target)
+        if not wanted:
+            break
+    return owners
+
+
+def _command(pid, proc='/proc'):
+    try:
+        with open(os.path.join(proc, str(pid), 'cmdline'), 'rb') as f:
+            return f.read().replace(b'\0', b' ').decode('utf-8', 'replace').strip()
+    except (IOError, OSError):
+        return None
+
+
+def listening_sockets(ports=None):
+    """
+    Returns the sockets listening for TCP connections, limited to `ports` if
+    given, along with the process that owns each of them when it is visible
+    to us.
+    """
+    if os.path.exists(PROC_NET_TCP[0]):
+        sockets = _proc_listening_sockets()
+        if ports is not None:
+            sockets = [s for s in sockets if s.port in ports]
+        owners = socket_owners([s.inode for s in sockets])
+        for s in sockets:
+            s.pid = owners.get(s.inode)
+    else:
+        sockets = _psutil_listening_sockets()
+        if ports is not None:
+            sockets = [s for s in sockets if s.port in ports]
+
+    for s in sockets:
+        if s.pid is not None:
+            s.command = _command(s.pid) or _psutil_command(s.pid)
+    return sockets
+
+
+def _psutil_command(pid):
+    try:
+        import psutil
+        return ' '.join(psutil.Process(pid).cmdline())
+    except Exception:
+        return None
+
+
+def published_ports(root, files=None):
+    """
+    Returns the host ports the project's running containers publish, which
+    are in use by the stack itself rather than conflicting with it.  Nothing
+    is, as far as we know, when Docker cannot be asked.
+    """
+    from .backends import get_backend
+    from .utils.exceptions import CompCommandError
+
+    try:
+        return get_backend(root, files=files).published_ports()
+    except (CompCommandError, OSError) as e:
+        logger.debug("Could not list the published ports: %s" % e)
+        return set()
+
+
+def find_conflicts(ports, exclude=None):
+    """
+    Returns a ListeningSocket for every port in `ports` that something is
+    already listening on, except for the ports in `exclude` (like the ones
+    the stack publishes, see published_ports).
+    """
+    ports = set(ports) - set(exclude or ())
+    seen = set()
+    conflicts = []
+    for s in sorted(listening_sockets(ports=ports), key=lambda s: s.port):
+        if (s.port, s.pid) not in seen:
+            seen.add((s.port, s.pid))
+            conflicts.append(s)
+    return conflicts
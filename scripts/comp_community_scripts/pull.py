@@ -0,0 +1,183 @@
+from __future__ import absolute_import
+
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .compose import ComposeModel
+from .utils.exceptions import PullError
+from .utils.logging import get_logger
+from .utils.terminal import colors
+from .utils.tracing import tracer
+
+
+__all__ = ('PullEngine', 'PullProgress', 'DEFAULT_PULL_CONCURRENCY', )
+
+
+logger = get_logger()
+
+
+# How many services are pulled at once, can be overridden with
+# COMP_PULL_CONCURRENCY or `comp setup --pull-concurrency`.
+DEFAULT_PULL_CONCURRENCY = 4
+
+
+class PullProgress(object):
+    """
+    A single view of the state of every service being pulled.
+
+    On a terminal the view is redrawn in place each time a service changes
+    state, otherwise (e.g. in CI logs) each change is written as its own line,
+    so the output of concurrent pulls is never interleaved.
+    """
+    STATE_COLORS = {
+        'waiting': colors.DARKGRAY,
+        'pulling': colors.LIGHTBLUE,
+        'retrying': colors.YELLOW,
+        'done': colors.GREEN,
+        'skipped': colors.DARKGRAY,
+        'failed': colors.RED,
+    }
+
+    def __init__(self, services, stream=None):
+        self.stream = stream or sys.stdout
+        self.services = list(services)
+        self.states = dict((s, ('waiting', '')) for s in self.services)
+        self.width = max([len(s) for s in self.services] or [0])
+        self.interactive = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self._drawn = 0
+        self._lock = threading.Lock()
+
+    def _line(self, service):
+        state, detail = self.states[service]
+        text = "%s  %s" % (service.ljust(self.width), state)
+        if detail:
+            text += " (%s)" % detail
+        return colors.format_text(text, color=self.STATE_COLORS[state])
+
+    def update(self, service, state, detail=''):
+        with self._lock:
+            self.states[service] = (state, detail)
+            if self.interactive:
+                self._redraw()
+            else:
+                self.stream.write(self._line(service) + "\n")
+            self.stream.flush()
+
+    def _redraw(self):
+        if self._drawn:
+            # Move the cursor back up to the first line of the view.
+            self.stream.write("\033[%dF" % self._drawn)
+        for service in self.services:
+            self.stream.write("\033[2K" + self._line(service) + "\n")
+        self._drawn = len(self.services)
+
+    def summary(self):
+        counts = {}
+        for state, _ in self.states.values():
+            counts[state] = counts.get(state, 0) + 1
+        return ", ".join("%d %s" % (n, state)
+            for state, n in sorted(counts.items()))
+
+
+class PullEngine(object):
+    """
+    Pulls each service's image separately, up to `concurrency` at a time.
+
+    >>> PullEngine(backend, concurrency=4).pull()
+
+    Services whose image already matches the registry's digest are skipped
+    (see updates.UpdateChecker).  Only services that fail are retried, after
+    an exponential backoff, and a PullError listing every service that still
+    failed is raised once the retries are exhausted.
+    """
+    def __init__(self, backend, concurrency=None, retries=3, backoff=1.0,
+            checker=None, force=False, stream=None):
+        self.backend = backend
+        self.concurrency = concurrency or int(os.environ.get(
+            'COMP_PULL_CONCURRENCY', DEFAULT_PULL_CONCURRENCY))
+        self.retries = retries
+        self.backoff = backoff
+        self.checker = checker
+        self.force = force
+        self.stream = stream
+
+    def pullable_services(self):
+        images = ComposeModel.load(self.backend.root,
+            files=self.backend.files).images
+        return sorted(name for name, image in images.items() if image)
+
+    def services_to_pull(self, services):
+        """
+        Returns the services that are out of date (or all of them when
+        forced), leaving out the ones whose registry cannot be reached.
+        """
+        if self.checker is None:
+            from .updates import UpdateChecker
+            self.checker = UpdateChecker(self.backend)
+        if not self.force:
+            return self.checker.services_needing_update(services=services)
+        images = dict((s, i) for s, i in self.checker.service_images().items()
+            if s in services)
+        offline = self.checker.offline_services(images)
+        return [s for s in services if s not in offline]
+
+    def _pull(self, service, progress, attempt):
+        progress.update(service, 'pulling' if attempt == 0 else 'retrying',
+            '' if attempt == 0 else 'attempt %d' % (attempt + 1))
+        try:
+            with tracer.span('pull %s' % service, attempt=attempt + 1):
+                self.backend.pull_service(service)
+        except Exception as e:
+            return service, e
+        progress.update(service, 'done')
+        return service, None
+
+    def delay(self, attempt):
+        """
+        Exponential backoff with jitter, so that services that failed together
+        do not all hit the registry again at the same moment.
+        """
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def pull(self, services=None):
+        services = sorted(services or self.pullable_services())
+        progress = PullProgress(services, stream=self.stream)
+        if not services:
+            return []
+
+        pending = self.services_to_pull(services)
+        for service in services:
+            if service in getattr(self.checker, 'offline', ()):
+                progress.update(service, 'skipped', 'registry unreachable')
+            elif service not in pending:
+                progress.update(service, 'skipped', 'up to date')
+
+        failures = {}
+        attempt = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while pending:
+                futures = [executor.submit(self._pull, s, progress, attempt)
+                    for s in pending]
+                results = [f.result() for f in futures]
+                failures = dict((s, e) for s, e in results if e is not None)
+                if not failures or attempt >= self.retries:
+                    break
+
+                delay = self.delay(attempt)
+                for service, error in failures.items():
+                    progress.update(service, 'retrying',
+                        'in %.1fs: %s' % (delay, error))
+                time.sleep(delay)
+                pending = sorted(failures)
+                attempt += 1
+
+        for service, error in failures.items():
+            progress.update(service, 'failed', str(error))
+        logger.info("Pull finished: %s" % progress.summary())
+        if failures:
+            raise PullError(failures)
+        return [s for s in services if progress.states[s][0] == 'done']
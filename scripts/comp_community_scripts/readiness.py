@@ -0,0 +1,151 @@
+from __future__ import absolute_import
+
+import asyncio
+import time
+
+from .app_ports import app_ports
+
+
+__all__ = ('TCPProbe', 'HTTPProbe', 'ServiceProbe', 'ProbeResult',
+    'default_probes', 'wait_until_ready', )
+
+
+# How each service in app_ports is checked for readiness, and how long (in
+# seconds) it is given to become ready.  Services that are not listed here
+# are checked with a plain TCP connect.
+READINESS_PROBES = {
+    'api': {'type': 'http', 'path': '/', 'timeout': 120},
+    'admin': {'type': 'http', 'path': '/', 'timeout': 120},
+}
+
+DEFAULT_TIMEOUT = 60
+
+
+class TCPProbe(object):
+    """
+    Ready as soon as something accepts a connection on the port.
+    """
+    def __init__(self, port, host='127.0.0.1'):
+        self.host = host
+        self.port = port
+
+    def __str__(self):
+        return 'tcp://%s:%s' % (self.host, self.port)
+
+    async def __call__(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        writer.close()
+        return True
+
+
+class HTTPProbe(TCPProbe):
+    """
+    Ready once a GET request gets a response that is not a server error,
+    since a 404 still means the application is serving requests.
+    """
+    def __init__(self, port, host='127.0.0.1', path='/'):
+        super(HTTPProbe, self).__init__(port, host=host)
+        self.path = path
+
+    def __str__(self):
+        return 'http://%s:%s%s' % (self.host, self.port, self.path)
+
+    async def __call__(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(("GET %s HTTP/1.0\r\nHost: %s:%s\r\n\r\n"
+                % (self.path, self.host, self.port)).encode('ascii'))
+            status_line = await reader.readline()
+        finally:
+            writer.close()
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            return False
+        return status < 500
+
+
+class ProbeResult(object):
+
+    def __init__(self, service, ready, elapsed, attempts, error=None):
+        self.service = service
+        self.ready = ready
+        self.elapsed = elapsed
+        self.attempts = attempts
+        self.error = error
+
+    def __str__(self):
+        if self.ready:
+            return "%s ready in %.2fs" % (self.service, self.elapsed)
+        return "%s not ready after %.2fs (%d attempts): %s" % (
+            self.service, self.elapsed, self.attempts, self.error)
+
+
+class ServiceProbe(object):
+    """
+    Repeatedly runs a probe against a service until it succeeds or the
+    service's timeout is reached.
+    """
+    def __init__(self, service, probe, timeout=DEFAULT_TIMEOUT, interval=0.25,
+            attempt_timeout=2):
+        self.service = service
+        self.probe = probe
+        self.timeout = timeout
+        self.interval = interval
+        self.attempt_timeout = attempt_timeout
+
+    async def wait(self, started=None):
+        started = started or time.time()
+        attempts = 0
+        error = None
+        while True:
+            attempts += 1
+            try:
+                if await asyncio.wait_for(self.probe(), self.attempt_timeout):
+                    return ProbeResult(self.service, True,
+                        time.time() - started, attempts)
+                error = "unexpected response from %s" % self.probe
+            except (OSError, asyncio.TimeoutError) as e:
+                error = str(e) or e.__class__.__name__
+
+            if time.time() - started + self.interval >= self.timeout:
+                return ProbeResult(self.service, False, time.time() - started,
+                    attempts, error=error)
+            await asyncio.sleep(self.interval)
+
+
+def default_probes(services=None, host='127.0.0.1', timeout=None,
+        ports=None):
+    """
+    Returns a ServiceProbe for every service in app_ports, limited to
+    `services` if given.
+    """
+    ports = ports or app_ports
+    probes = []
+    for service, port in sorted(ports.items()):
+        if services is not None and service not in services:
+            continue
+        config = READINESS_PROBES.get(service, {})
+        if config.get('type') == 'http':
+            probe = HTTPProbe(port, host=host, path=config.get('path', '/'))
+        else:
+            probe = TCPProbe(port, host=host)
+        probes.append(ServiceProbe(service, probe,
+            timeout=timeout or config.get('timeout', DEFAULT_TIMEOUT)))
+    return probes
+
+
+def wait_until_ready(probes):
+    """
+    Probes every service concurrently and returns a ProbeResult for each of
+    them, as soon as all of them are ready (or have timed out).
+    """
+    async def run():
+        started = time.time()
+        return await asyncio.gather(*[p.wait(started=started) for p in probes])
+
+    loop = asyncio.new_event_loop()
+    try:
+        return list(loop.run_until_complete(run()))
+    finally:
+        loop.close()
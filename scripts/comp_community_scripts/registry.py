@@ -0,0 +1,270 @@
+from __future__ import absolute_import
+
+import base64
+import json
+import os
+import re
+import subprocess
+import threading
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from .utils.logging import get_logger
+
+
+__all__ = ('ImageReference', 'RegistryClient', 'RegistryError',
+    'docker_credentials', 'registry_auth_header', )
+
+
+logger = get_logger()
+
+
+DOCKER_HUB = 'docker.io'
+DOCKER_HUB_URL = 'https://registry-1.docker.io'
+
+# Docker Hub can be swapped out for another registry (like a local stand-in
+# started with `docker run -p 5000:5000 registry:2`) with COMP_REGISTRY_URL.
+REGISTRY_URL_SETTING = 'COMP_REGISTRY_URL'
+
+# Asking for lists and indexes first makes the registry return the same digest
+# that docker records in an image's RepoDigests when pulling by tag.
+MANIFEST_MEDIA_TYPES = (
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.index.v1+json',
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+)
+
+
+# The key Docker Hub's credentials are stored under in ~/.docker/config.json.
+DOCKER_HUB_AUTH_KEY = 'https://index.docker.io/v1/'
+
+# How long (in seconds) a credential helper is given to answer.
+CREDENTIAL_HELPER_TIMEOUT = 10
+
+
+class RegistryError(Exception):
+    pass
+
+
+class ImageReference(object):
+    """
+    Splits an image, as it is written in a compose file, into the registry
+    it lives on, its repository and its tag or digest.
+
+    >>> ImageReference.parse('mysql')
+    >>> ImageReference('docker.io', 'library/mysql', tag='latest')
+
+    >>> ImageReference.parse('localhost:5000/comp/api:dev')
+    >>> ImageReference('localhost:5000', 'comp/api', tag='dev')
+    """
+    def __init__(self, registry, repository, tag=None, digest=None, name=None):
+        self.registry = registry
+        self.repository = repository
+        self.tag = tag
+        self.digest = digest
+        self.name = name or repository
+
+    @classmethod
+    def parse(cls, image):
+        name, digest = image, None
+        if '@' in name:
+            name, digest = name.split('@', 1)
+
+        tag = None
+        last = name.rsplit('/', 1)[-1]
+        if ':' in last:
+            name, tag = name.rsplit(':', 1)
+        if not digest:
+            tag = tag or 'latest'
+
+        parts = name.split('/', 1)
+        if len(parts) == 2 and re.search(r'[.:]|^localhost$', parts[0]):
+            registry, repository = parts
+        else:
+            registry, repository = DOCKER_HUB, name
+            if '/' not in repository:
+                repository = 'library/%s' % repository
+        return cls(registry, repository, tag=tag, digest=digest,
+            name=name)
+
+    @property
+    def reference(self):
+        return self.digest or self.tag
+
+    def __str__(self):
+        if self.digest:
+            return '%s@%s' % (self.name, self.digest)
+        return '%s:%s' % (self.name, self.tag)
+
+    def __repr__(self):
+        return 'ImageReference(%r, %r, tag=%r)' % (
+            self.registry, self.repository, self.tag)
+
+
+class RegistryClient(object):
+    """
+    Looks up manifest digests on a Docker registry (v2 API) with HEAD
+    requests, which only transfer headers, authenticating with anonymous
+    bearer tokens when the registry asks for them.
+    """
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        self._tokens = {}
+        self._tokens_lock = threading.Lock()
+
+    def registry_url(self, ref):
+        if ref.registry == DOCKER_HUB:
+            return os.environ.get(REGISTRY_URL_SETTING) or DOCKER_HUB_URL
+        scheme = 'http' if ref.registry.startswith('localhost') else 'https'
+        return '%s://%s' % (scheme, ref.registry)
+
+    def endpoint(self, ref):
+        """
+        The host and port the registry of an image is reached on, to check
+        that it can be reached at all before asking it anything.
+        """
+        from .connectivity import endpoint_from_url
+        return endpoint_from_url(self.registry_url(ref))
+
+    def _token(self, challenge):
+        """
+        Exchanges a `WWW-Authenticate: Bearer realm=...,service=...,scope=...`
+        challenge for an anonymous pull token.
+        """
+        params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+        realm = params.pop('realm', None)
+        if not realm:
+            raise RegistryError("Unsupported authentication: %s" % challenge)
+
+        key = (realm, params.get('service'), params.get('scope'))
+        with self._tokens_lock:
+            if key not in self._tokens:
+                url = '%s?%s' % (realm, urlencode(sorted(params.items())))
+                with urlopen(url, timeout=self.timeout) as response:
+                    data = json.loads(response.read().decode('utf-8'))
+                self._tokens[key] = data.get('token') or data.get('access_token')
+            return self._tokens[key]
+
+    def _head(self, url, token=None):
+        headers = {'Accept': ', '.join(MANIFEST_MEDIA_TYPES)}
+        if token:
+            headers['Authorization'] = 'Bearer %s' % token
+        request = Request(url, headers=headers, method='HEAD')
+        with urlopen(request, timeout=self.timeout) as response:
+            return response.headers
+
+    def manifest_digest(self, image):
+        """
+        Returns the digest the registry currently serves for the image's tag.
+        """
+        ref = image if isinstance(image, ImageReference) \
+            else ImageReference.parse(image)
+        url = '%s/v2/%s/manifests/%s' % (
+            self.registry_url(ref), ref.repository, ref.reference)
+        try:
+            try:
+                headers = self._head(url)
+            except HTTPError as e:
+                challenge = e.headers.get('WWW-Authenticate', '')
+                if e.code != 401 or not challenge.lower().startswith('bearer'):
+                    raise
+                headers = self._head(url, token=self._token(challenge))
+        except (HTTPError, URLError, OSError, ValueError) as e:
+            raise RegistryError("Could not look up %s: %s" % (ref, e))
+
+        digest = headers.get('Docker-Content-Digest')
+        if not digest:
+            raise RegistryError("Registry did not return a digest for %s" % ref)
+        return digest
+
+
+def _docker_config():
+    directory = os.environ.get('DOCKER_CONFIG') or os.path.expanduser(
+        '~/.docker')
+    try:
+        with open(os.path.join(directory, 'config.json')) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _auth_keys(registry):
+    if registry == DOCKER_HUB:
+        return [DOCKER_HUB_AUTH_KEY, 'index.docker.io', 'docker.io',
+            'registry-1.docker.io']
+    return [registry, 'https://%s' % registry, 'http://%s' % registry]
+
+
+def _credential_helper(helper, server):
+    try:
+        proc = subprocess.run(['docker-credential-%s' % helper, 'get'],
+            input=server.encode('utf-8'), stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, timeout=CREDENTIAL_HELPER_TIMEOUT)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.debug("Credential helper %s failed: %s" % (helper, e))
+        return None
+    if proc.returncode != 0:
+        # Helpers exit non-zero when they have no credentials for the server.
+        return None
+    try:
+        data = json.loads(proc.stdout.decode('utf-8'))
+    except ValueError:
+        return None
+    if data.get('Username') == '<token>':
+        return {'identitytoken': data.get('Secret'), 'serveraddress': server}
+    return {'username': data.get('Username'), 'password': data.get('Secret'),
+        'serveraddress': server}
+
+
+def docker_credentials(registry):
+    """
+    The credentials the Docker CLI would pull from the registry with, from
+    ~/.docker/config.json (or DOCKER_CONFIG): the registry's credential
+    helper, the credentials store, or the credentials stored in the file, in
+    that order.  Returns None when there are none.
+
+    >>> docker_credentials('ghcr.io')
+    >>> {'username': 'nick', 'password': '...', 'serveraddress': 'ghcr.io'}
+    """
+    config = _docker_config()
+    keys = _auth_keys(registry)
+
+    helpers = config.get('credHelpers') or {}
+    for key in keys:
+        if key in helpers:
+            return _credential_helper(helpers[key], key)
+    if config.get('credsStore'):
+        for key in keys:
+            credentials = _credential_helper(config['credsStore'], key)
+            if credentials:
+                return credentials
+
+    auths = config.get('auths') or {}
+    for key in keys:
+        entry = auths.get(key) or {}
+        if entry.get('identitytoken'):
+            return {'identitytoken': entry['identitytoken'],
+                'serveraddress': key}
+        if entry.get('auth'):
+            try:
+                decoded = base64.b64decode(entry['auth']).decode('utf-8')
+            except (ValueError, UnicodeDecodeError):
+                continue
+            username, _, password = decoded.partition(':')
+            return {'username': username, 'password': password,
+                'serveraddress': key}
+    return None
+
+
+def registry_auth_header(image):
+    """
+    The X-Registry-Auth header the Engine API expects with a pull of the
+    image, or None if there are no credentials for its registry.
+    """
+    credentials = docker_credentials(ImageReference.parse(image).registry)
+    if not credentials:
+        return None
+    return base64.urlsafe_b64encode(
+        json.dumps(credentials).encode('utf-8')).decode('ascii')
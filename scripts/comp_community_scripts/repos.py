@@ -0,0 +1,241 @@
+from __future__ import absolute_import
+
+import fcntl
+import hashlib
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from .utils.cache import cache_dir
+from .utils.exceptions import CompCommandError
+from .utils.git import git_dir, git_head
+from .utils.logging import get_logger
+from .utils.runner import run
+
+
+__all__ = ('SubRepository', 'SyncResult', 'default_repositories',
+    'remote_url', 'sync_repositories', )
+
+
+logger = get_logger()
+
+
+# The repositories checked out inside comp-community, as (name, path, the
+# variable the remote can be changed with, default remote).  Remotes that are
+# neither URLs nor paths are GitHub repositories.
+SUB_REPOSITORIES = (
+    ('api', os.path.join('www', 'api'), 'COMP_API_REPO',
+        'music-composition-community/comp-community-api.git'),
+)
+
+# How long (in seconds) cloning or fetching a repository may take.
+SYNC_TIMEOUT = 30 * 60
+
+SCP_LIKE = re.compile(r'^[\w.-]+@[\w.-]+:')
+
+
+def remote_url(remote):
+    """
+    The URL of a sub-repository's remote, where a bare "owner/repo.git" is on
+    GitHub.
+
+    >>> remote_url('music-composition-community/comp-community-api.git')
+    >>> 'git@github.com:music-composition-community/comp-community-api.git'
+    >>> remote_url('/srv/git/comp-community-api.git')
+    >>> '/srv/git/comp-community-api.git'
+    """
+    if '://' in remote or SCP_LIKE.match(remote) or \
+            remote.startswith(('/', '.', '~')):
+        return os.path.expanduser(remote)
+    return 'git@github.com:%s' % remote
+
+
+class SubRepository(object):
+
+    def __init__(self, name, path, url, branch=None):
+        self.name = name
+        self.path = path
+        self.url = url
+        self.branch = branch
+
+    @property
+    def cache_path(self):
+        """
+        The bare mirror of the remote the checkouts borrow objects from, named
+        after the URL so that forks do not share it.
+        """
+        digest = hashlib.sha1(self.url.encode('utf-8')).hexdigest()[:12]
+        return os.path.join(cache_dir('git'), '%s-%s.git' % (self.name, digest))
+
+    def __repr__(self):
+        return "SubRepository(%r, %r)" % (self.name, self.url)
+
+
+def default_repositories(root):
+    return [SubRepository(name, os.path.join(str(root), path),
+        remote_url(os.environ.get(setting) or remote))
+        for name, path, setting, remote in SUB_REPOSITORIES]
+
+
+class SyncResult(object):
+
+    CLONED = 'cloned'
+    FETCHED = 'fetched'
+    FAILED = 'failed'
+
+    def __init__(self, repo, status, head=None, behind=None, detail=None,
+            elapsed=None):
+        self.repo = repo
+        self.status = status
+        self.head = head
+        self.behind = behind
+        self.detail = detail
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.status != self.FAILED
+
+    def __repr__(self):
+        return "SyncResult(%r, %r)" % (self.repo.name, self.status)
+
+
+@contextmanager
+def _locked(path):
+    with open(path + '.lock', 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _git(args, timeout=SYNC_TIMEOUT, retcode=0):
+    return run(['git'] + list(args), retcode=retcode, timeout=timeout,
+        log=logger.debug)
+
+
+def update_cache(repo, timeout=SYNC_TIMEOUT):
+    """
+    Brings the repository's mirror in the cache up to date, cloning it the
+    first time, and returns its path.  Only what is new since the last sync
+    is downloaded, and checkouts made with the mirror as their reference
+    take the objects it has from it rather than from the remote.
+
+    The mirror is updated under a lock, so that checkouts syncing at the same
+    time (e.g. instances in other worktrees) download it once.
+    """
+    path = repo.cache_path
+    with _locked(path):
+        if os.path.isdir(path):
+            _git(['--git-dir', path, 'fetch', '--prune', '--quiet'],
+                timeout=timeout)
+        else:
+            partial = path + '.partial'
+            shutil.rmtree(partial, ignore_errors=True)
+            _git(['clone', '--mirror', '--quiet', repo.url, partial],
+                timeout=timeout)
+            os.rename(partial, path)
+    return path
+
+
+def _behind(path):
+    result = _git(['-C', path, 'rev-list', '--count', 'HEAD..@{upstream}'],
+        retcode=None, timeout=60)
+    if result.retcode != 0 or not result.stdout_tail:
+        return None
+    return int(result.stdout_tail[-1].strip())
+
+
+def _clone(repo, depth=None, reference=None, timeout=SYNC_TIMEOUT):
+    args = ['clone', '--quiet']
+    if repo.branch:
+        args += ['--branch', repo.branch]
+    if depth:
+        args += ['--depth', str(depth)]
+    elif reference is None:
+        # Without a mirror to borrow from, only commits and trees are
+        # downloaded, and file contents as they are checked out.
+        args += ['--filter=blob:none']
+    if reference is not None:
+        # The checkout gets its own copy of the objects, so that it keeps
+        # working if the cache is cleared.
+        args += ['--reference-if-able', reference, '--dissociate']
+
+    partial = repo.path + '.partial'
+    shutil.rmtree(partial, ignore_errors=True)
+    try:
+        _git(args + [repo.url, partial], timeout=timeout)
+    except CompCommandError:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    os.rename(partial, repo.path)
+
+
+def _fetch(repo, depth=None, timeout=SYNC_TIMEOUT):
+    args = ['-C', repo.path, 'fetch', '--prune', '--quiet']
+    if depth:
+        args += ['--depth', str(depth)]
+    _git(args + ['origin'], timeout=timeout)
+
+
+def sync_repository(repo, depth=None, use_cache=True, timeout=SYNC_TIMEOUT):
+    """
+    Clones the repository if it is not checked out yet, or fetches it
+    otherwise.  Checkouts are never changed once cloned: how far behind
+    their upstream they are is reported instead.
+
+    Shallow clones (with a `depth`) do not go through the cache: its mirror
+    has the whole history, which would take longer to download than the
+    clone saves.
+    """
+    started = time.time()
+    try:
+        if git_dir(repo.path) is None:
+            if os.path.exists(repo.path) and os.listdir(repo.path):
+                raise CompCommandError("%s exists and is not a git repository"
+                    % repo.path)
+            if os.path.isdir(repo.path):
+                os.rmdir(repo.path)
+            parent = os.path.dirname(repo.path)
+            if not os.path.isdir(parent):
+                os.makedirs(parent)
+
+            reference = None
+            if use_cache and not depth:
+                try:
+                    reference = update_cache(repo, timeout=timeout)
+                except CompCommandError as e:
+                    logger.warning("Could not update the cache of %s, "
+                        "cloning without it: %s" % (repo.name, e))
+            _clone(repo, depth=depth, reference=reference, timeout=timeout)
+            status = SyncResult.CLONED
+        else:
+            _fetch(repo, depth=depth, timeout=timeout)
+            status = SyncResult.FETCHED
+    except (CompCommandError, OSError) as e:
+        return SyncResult(repo, SyncResult.FAILED, detail=str(e),
+            elapsed=time.time() - started)
+    return SyncResult(repo, status, head=git_head(repo.path),
+        behind=_behind(repo.path), elapsed=time.time() - started)
+
+
+def sync_repositories(repos, jobs=None, **kwargs):
+    """
+    Syncs the repositories concurrently, and returns their SyncResults in
+    the same order.
+
+    >>> sync_repositories(default_repositories(root_dir), depth=1)
+    """
+    if not repos:
+        return []
+    executor = ThreadPoolExecutor(max_workers=jobs or len(repos))
+    try:
+        futures = [executor.submit(sync_repository, repo, **kwargs)
+            for repo in repos]
+        return [f.result() for f in futures]
+    finally:
+        executor.shutdown(wait=True)
@@ -0,0 +1,266 @@
+from __future__ import absolute_import
+
+import fcntl
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+from .utils.cache import write_atomic
+from .utils.exceptions import CompCommandError
+from .utils.logging import get_logger
+
+
+__all__ = ('Snapshot', 'SnapshotStore', 'database_path', 'backup_database', )
+
+
+logger = get_logger()
+
+
+# The api's SQLite database, relative to the root, next to its manage.py,
+# which can be changed with COMP_API_DATABASE.
+DEFAULT_DATABASE = os.path.join('www', 'api', 'apps', 'db.sqlite3')
+
+# How many pages the online backup copies at a time.  Between batches, the
+# api can write to the database, so a snapshot never holds it up for long.
+BACKUP_PAGES = 1024
+
+# Snapshots are compressed for the speed of restoring them rather than size.
+COMPRESS_LEVEL = 1
+
+CHUNK_BYTES = 1024 * 1024
+
+SNAPSHOT_NAME = re.compile(r'^[\w.-]+$')
+
+
+def database_path(root):
+    path = os.environ.get('COMP_API_DATABASE') or DEFAULT_DATABASE
+    return os.path.join(str(root), path)
+
+
+def backup_database(source, destination, pages=BACKUP_PAGES):
+    """
+    Copies the SQLite database at `source` into a new database at
+    `destination` with SQLite's online backup, `pages` at a time, so that
+    it can be taken while the api is using the database.  Returns how many
+    pages were copied.
+
+    A write to the database between two batches makes the backup start
+    over, which SQLite does on its own.
+    """
+    if not os.path.exists(source):
+        raise CompCommandError("There is no database at %s" % source)
+    progress = {}
+
+    def record(status, remaining, total):
+        progress['total'] = total
+
+    src = sqlite3.connect(source, timeout=30)
+    try:
+        dest = sqlite3.connect(destination)
+        try:
+            src.backup(dest, pages=pages, progress=record)
+        finally:
+            dest.close()
+    except sqlite3.Error as e:
+        raise CompCommandError("Could not back up %s: %s" % (source, e))
+    finally:
+        src.close()
+    return progress.get('total', 0)
+
+
+class Snapshot(object):
+
+    def __init__(self, name, digest, size, pages=None, created=None,
+            migrations=None):
+        self.name = name
+        self.digest = digest
+        self.size = size
+        self.pages = pages
+        self.created = created
+        self.migrations = migrations
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(**data)
+
+    def to_json(self):
+        return {
+            'name': self.name,
+            'digest': self.digest,
+            'size': self.size,
+            'pages': self.pages,
+            'created': self.created,
+            'migrations': self.migrations,
+        }
+
+    def __repr__(self):
+        return "Snapshot(%r, %r)" % (self.name, self.digest[:12])
+
+
+class SnapshotStore(object):
+    """
+    Named snapshots of the api's database, in .comp/db.
+
+    >>> store = SnapshotStore(state_dir / 'db')
+    >>> store.snapshot('seeded', database_path(root_dir))
+    >>> store.restore('seeded', database_path(root_dir))
+
+    Snapshots are stored compressed, by the sha256 of their content, and an
+    index maps their names to their content, so that snapshots of the same
+    data are only stored once.  Restoring one decompresses it next to the
+    database and renames it into place, which swaps the whole database at
+    once, rather than resetting it with migrations and fixtures.
+    """
+    def __init__(self, path):
+        self.path = str(path)
+        self.objects = os.path.join(self.path, 'objects')
+        self.index_path = os.path.join(self.path, 'index.json')
+
+    @contextmanager
+    def lock(self):
+        if not os.path.isdir(self.objects):
+            os.makedirs(self.objects)
+        with open(os.path.join(self.path, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            data = {}
+        return dict((name, Snapshot.from_json(snapshot))
+            for name, snapshot in data.items())
+
+    def _save(self, snapshots):
+        write_atomic(self.index_path, json.dumps(dict(
+            (name, snapshot.to_json()) for name, snapshot in snapshots.items()),
+            indent=2, sort_keys=True))
+
+    def object_path(self, digest):
+        return os.path.join(self.objects, '%s.sqlite3.gz' % digest)
+
+    def all(self):
+        snapshots = self._load()
+        return [snapshots[name] for name in sorted(snapshots)]
+
+    def get(self, name):
+        return self._load().get(name)
+
+    def snapshot(self, name, database, migrations=None, pages=BACKUP_PAGES):
+        """
+        Takes a snapshot of the database under the name, replacing any
+        snapshot of the same name, and returns it.
+        """
+        if not SNAPSHOT_NAME.match(name):
+            raise CompCommandError("Invalid snapshot name %r, use letters, "
+                "digits, '.', '-' and '_'" % name)
+        with self.lock():
+            fd, backup = tempfile.mkstemp(dir=self.path, suffix='.sqlite3')
+            os.close(fd)
+            try:
+                total = backup_database(database, backup, pages=pages)
+                digest, size = self._store(backup)
+            finally:
+                os.unlink(backup)
+
+            snapshots = self._load()
+            snapshots[name] = Snapshot(name, digest, size, pages=total,
+                created=time.time(), migrations=migrations)
+            self._save(snapshots)
+            self._prune(snapshots)
+            return snapshots[name]
+
+    def _store(self, path):
+        digest = hashlib.sha256()
+        size = 0
+        fd, compressed = tempfile.mkstemp(dir=self.objects, suffix='.gz')
+        try:
+            with open(path, 'rb') as src, os.fdopen(fd, 'wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb',
+                        compresslevel=COMPRESS_LEVEL, mtime=0) as dest:
+                    for chunk in iter(lambda: src.read(CHUNK_BYTES), b''):
+                        digest.update(chunk)
+                        size += len(chunk)
+                        dest.write(chunk)
+            digest = digest.hexdigest()
+            if os.path.exists(self.object_path(digest)):
+                os.unlink(compressed)
+            else:
+                os.replace(compressed, self.object_path(digest))
+        except BaseException:
+            if os.path.exists(compressed):
+                os.unlink(compressed)
+            raise
+        return digest, size
+
+    def _prune(self, snapshots):
+        referenced = set(s.digest for s in snapshots.values())
+        for name in os.listdir(self.objects):
+            digest = name.split('.', 1)[0]
+            if name.endswith('.sqlite3.gz') and digest not in referenced:
+                logger.debug("Removing the unreferenced snapshot %s" % digest)
+                os.unlink(os.path.join(self.objects, name))
+
+    def delete(self, name):
+        with self.lock():
+            snapshots = self._load()
+            if snapshots.pop(name, None) is None:
+                return False
+            self._save(snapshots)
+            self._prune(snapshots)
+            return True
+
+    def restore(self, name, database):
+        """
+        Replaces the database with the snapshot, and returns the snapshot.
+
+        The snapshot is written to a temporary file in the database's
+        directory, and renamed over the database, so that the database is
+        never partially restored.  Its journal files are removed, since they
+        belong to the database being replaced.
+        """
+        with self.lock():
+            snapshot = self.get(name)
+            if snapshot is None:
+                raise CompCommandError("There is no snapshot named %r" % name)
+            directory = os.path.dirname(os.path.abspath(database))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            fd, restored = tempfile.mkstemp(dir=directory,
+                prefix='.%s.' % os.path.basename(database))
+            try:
+                digest = hashlib.sha256()
+                with gzip.open(self.object_path(snapshot.digest), 'rb') as src, \
+                        os.fdopen(fd, 'wb') as dest:
+                    for chunk in iter(lambda: src.read(CHUNK_BYTES), b''):
+                        digest.update(chunk)
+                        dest.write(chunk)
+                    dest.flush()
+                    os.fsync(dest.fileno())
+                if digest.hexdigest() != snapshot.digest:
+                    raise CompCommandError("The snapshot %r is corrupt" % name)
+                if os.path.exists(database):
+                    shutil.copymode(database, restored)
+                for suffix in ('-wal', '-shm', '-journal'):
+                    if os.path.exists(database + suffix):
+                        os.unlink(database + suffix)
+                os.replace(restored, database)
+            except (IOError, OSError) as e:
+                raise CompCommandError("Could not restore %r: %s" % (name, e))
+            finally:
+                if os.path.exists(restored):
+                    os.unlink(restored)
+            return snapshot
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+"""
+Measures how long it takes `comp` to start up.
+
+`comp --profile-startup` prints a report of the slowest imports, and running
+this module directly acts as a benchmark that fails when `comp --help` takes
+longer than the startup budget:
+
+>>> python -m comp_community_scripts.startup --budget 0.25 --runs 10
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+__all__ = ('STARTUP_BUDGET', 'profile_startup', 'time_startup',
+    'benchmark_startup', )
+
+
+# Seconds that `comp --help` is allowed to take, measured as the median of
+# several runs.  Can be overridden with COMP_STARTUP_BUDGET.
+STARTUP_BUDGET = 0.35
+
+COMP_COMMAND = [sys.executable, '-m', 'comp_community_scripts']
+
+
+def _scripts_env():
+    """
+    Makes sure the subprocess imports the same comp_community_scripts that
+    we are running from, even if it is not installed.
+    """
+    scripts_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), '..'))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [scripts_dir] + [p for p in [env.get('PYTHONPATH')] if p])
+    return env
+
+
+def _parse_importtime(output):
+    """
+    Parses the stderr of `python -X importtime`, which looks like:
+
+    >>> import time: self [us] | cumulative | imported package
+    >>> import time:       224 |        224 |   _io
+
+    and returns a list of (module, self_us, cumulative_us, depth).
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            depth = (len(name) - len(name.lstrip())) // 2
+            imports.append(
+                (name.strip(), int(self_us), int(cumulative_us), depth))
+        except ValueError:
+            continue
+    return imports
+
+
+def time_startup(args=None, runs=1):
+    """
+    Runs `comp <args>` in a fresh interpreter `runs` times and returns the
+    wall time of each run in seconds.
+    """
+    args = args or ['--help']
+    env = _scripts_env()
+    timings = []
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.call(COMP_COMMAND + args, stdout=devnull, stderr=devnull,
+                env=env)
+            timings.append(time.time() - start)
+    return timings
+
+
+def profile_startup(args=None, limit=15, stream=None):
+    """
+    Re-runs `comp <args>` with `-X importtime` and reports the total startup
+    time along with the imports that contributed to it the most.
+    """
+    args = args or ['--help']
+    stream = stream or sys.stdout
+
+    start = time.time()
+    proc = subprocess.Popen(
+        [sys.executable, '-X', 'importtime'] + COMP_COMMAND[1:] + args,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, env=_scripts_env())
+    _, stderr = proc.communicate()
+    elapsed = time.time() - start
+
+    imports = _parse_importtime(stderr)
+    total_us = sum(i[1] for i in imports)
+
+    print("Startup of `comp %s`: %.1f ms wall, %.1f ms importing %d modules"
+        % (' '.join(args), elapsed * 1000, total_us / 1000.0, len(imports)),
+        file=stream)
+    print("", file=stream)
+    print("%10s  %10s  %s" % ('self [ms]', 'cumul [ms]', 'module'), file=stream)
+
+    # Only the top level imports are reported by cumulative time, otherwise the
+    # packages they pull in would be counted more than once.
+    top_level = [i for i in imports if i[3] <= 1]
+    for name, self_us, cumulative_us, _ in sorted(
+            top_level, key=lambda i: i[2], reverse=True)[:limit]:
+        print("%10.1f  %10.1f  %s" % (self_us / 1000.0, cumulative_us / 1000.0,
+            name), file=stream)
+    return elapsed
+
+
+def benchmark_startup(budget=None, runs=10, args=None, stream=None):
+    """
+    Returns True if the median startup time of `comp <args>` is within the
+    budget.
+    """
+    stream = stream or sys.stdout
+    if budget is None:
+        budget = float(os.environ.get('COMP_STARTUP_BUDGET', STARTUP_BUDGET))
+
+    # The first run warms up the filesystem and bytecode caches.
+    time_startup(args=args, runs=1)
+    timings = sorted(time_startup(args=args, runs=runs))
+    median = timings[len(timings) // 2]
+
+    print("`comp %s` startup over %d runs: min %.1f ms, median %.1f ms, "
+        "max %.1f ms (budget %.1f ms)" % (' '.join(args or ['--help']), runs,
+        timings[0] * 1000, median * 1000, timings[-1] * 1000, budget * 1000),
+        file=stream)
+    return median <= budget
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Fails if `comp --help` starts slower than the budget.")
+    parser.add_argument('--budget', type=float, default=None,
+        help="Budget in seconds (default: %s)" % STARTUP_BUDGET)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--profile', action='store_true',
+        help="Print an import time report after the benchmark.")
+    options = parser.parse_args()
+
+    within_budget = benchmark_startup(budget=options.budget, runs=options.runs)
+    if options.profile:
+        print("")
+        profile_startup()
+    if not within_budget:
+        print("Startup time is over budget.")
+        sys.exit(1)
@@ -0,0 +1,462 @@
+from __future__ import absolute_import
+
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from array import array
+
+from .utils.logging import get_logger
+
+
+__all__ = ('SampleBuffer', 'SampleLog', 'HostProbe', 'CgroupProbe', 'ContainerProbes',
+    'Sampler', 'summarize', 'to_csv', 'to_prometheus', )
+
+
+logger = get_logger()
+
+
+# Where the cgroup hierarchy is mounted, can be moved with COMP_CGROUP_ROOT.
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+# How often (in seconds) the list of the project's containers is refreshed,
+# so that containers that are started while sampling are picked up.
+CONTAINER_REFRESH = 10
+
+NAN = float('nan')
+
+
+def metric(name, **labels):
+    """
+    >>> metric('container_cpu_percent', service='api')
+    >>> 'container_cpu_percent{service="api"}'
+    """
+    if not labels:
+        return name
+    return '%s{%s}' % (name, ','.join('%s="%s"' % (k, v)
+        for k, v in sorted(labels.items())))
+
+
+class SampleBuffer(object):
+    """
+    The last `capacity` samples of every metric, in preallocated arrays of
+    doubles that are written in place as a ring, so that sampling never
+    allocates or grows.
+
+    >>> buffer = SampleBuffer(capacity=300)
+    >>> buffer.append(time.time(), {'host_cpu_percent': 12.5})
+    >>> buffer.values('host_cpu_percent')
+
+    Every metric has a slot for every sample, where a sample that did not
+    have the metric (e.g. before a container was started) is NaN, so that
+    the samples of all of the metrics stay aligned.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = array('d', [NAN]) * capacity
+        self.series = {}
+        self.index = 0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def append(self, timestamp, values):
+        with self._lock:
+            for name in values:
+                if name not in self.series:
+                    self.series[name] = array('d', [NAN]) * self.capacity
+            self.timestamps[self.index] = timestamp
+            for name, series in self.series.items():
+                series[self.index] = values.get(name, NAN)
+            self.index = (self.index + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+
+    def _ordered(self, data, last=None):
+        count = min(last or self.count, self.count)
+        start = (self.index - count) % self.capacity
+        if start + count <= self.capacity:
+            return data[start:start + count]
+        return data[start:] + data[:self.index]
+
+    def values(self, name, last=None):
+        """
+        The metric's values, oldest first, of the last `last` samples.
+        """
+        with self._lock:
+            return self._ordered(self.series[name], last)
+
+    def rows(self, last=None):
+        """
+        Yields (timestamp, {metric: value}) for the samples, oldest first.
+        """
+        with self._lock:
+            names = sorted(self.series)
+            columns = [self._ordered(self.series[n], last) for n in names]
+            timestamps = self._ordered(self.timestamps, last)
+        for i, timestamp in enumerate(timestamps):
+            yield timestamp, dict((n, c[i]) for n, c in zip(names, columns))
+
+    @property
+    def names(self):
+        with self._lock:
+            return sorted(self.series)
+
+
+class SampleLog(object):
+    """
+    Every sample, for writing them all out when sampling is done (e.g. with
+    to_csv), however long it ran.  Unlike a SampleBuffer, it grows with every
+    sample, so the samples are appended to a temporary file as they are
+    taken rather than kept in memory.
+
+    >>> with SampleLog() as log:
+    >>>     log.append(time.time(), {'host_cpu_percent': 12.5})
+    >>>     to_csv(log, stream)
+    """
+    def __init__(self):
+        self.file = tempfile.TemporaryFile('w+')
+        self.count = 0
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def append(self, timestamp, values):
+        with self._lock:
+            self.file.write(json.dumps([timestamp, values]) + '\n')
+            self._names.update(values)
+            self.count += 1
+
+    def rows(self):
+        """
+        Yields (timestamp, {metric: value}) for the samples, oldest first,
+        where a metric the sample did not have is NaN.  Nothing can be
+        appended until they have all been read.
+        """
+        with self._lock:
+            names = sorted(self._names)
+            self.file.flush()
+            self.file.seek(0)
+            try:
+                for line in self.file:
+                    timestamp, values = json.loads(line)
+                    yield timestamp, dict((n, values.get(n, NAN))
+                        for n in names)
+            finally:
+                self.file.seek(0, os.SEEK_END)
+
+    @property
+    def names(self):
+        with self._lock:
+            return sorted(self._names)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def summarize(values):
+    """
+    Returns the (min, mean, p95, last) of the values that are not NaN, or
+    None if there are none.
+    """
+    values = [v for v in values if not math.isnan(v)]
+    if not values:
+        return None
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(math.ceil(0.95 * len(ordered))) - 1)]
+    return ordered[0], sum(ordered) / len(ordered), p95, values[-1]
+
+
+class HostProbe(object):
+    """
+    The host's CPU, memory, disk and network usage, from psutil.  Rates are
+    computed from the counters' change since the previous sample.
+    """
+    def __init__(self):
+        import psutil
+
+        self.psutil = psutil
+        self.previous = None
+        # The first call only sets the baseline the next ones are relative to.
+        psutil.cpu_percent(interval=None)
+
+    def _counters(self):
+        disk = self.psutil.disk_io_counters()
+        net = self.psutil.net_io_counters()
+        return {
+            'disk_read': disk.read_bytes if disk else 0,
+            'disk_write': disk.write_bytes if disk else 0,
+            'net_recv': net.bytes_recv if net else 0,
+            'net_sent': net.bytes_sent if net else 0,
+        }
+
+    def sample(self, now):
+        memory = self.psutil.virtual_memory()
+        values = {
+            'host_cpu_percent': self.psutil.cpu_percent(interval=None),
+            'host_memory_percent': memory.percent,
+            'host_memory_used_bytes': float(memory.used),
+        }
+        counters = self._counters()
+        if self.previous is not None:
+            elapsed = now - self.previous[0]
+            for name, value in counters.items():
+                values['host_%s_bytes_per_second' % name] = max(
+                    0, value - self.previous[1][name]) / elapsed
+        self.previous = (now, counters)
+        return values
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except (IOError, OSError):
+        return None
+
+
+class CgroupProbe(object):
+    """
+    A container's CPU, memory and block IO usage, read straight from its
+    cgroup (v2, or v1's cpuacct, memory and blkio controllers), which costs
+    a few small file reads rather than a request to the Docker daemon.
+    """
+    def __init__(self, container, root=None):
+        self.container = container
+        self.root = root or os.environ.get('COMP_CGROUP_ROOT', CGROUP_ROOT)
+        self.paths = self._find()
+        self.previous = None
+
+    def _candidates(self, controller=''):
+        base = os.path.join(self.root, controller)
+        container_id = self.container.id
+        return [
+            os.path.join(base, 'system.slice', 'docker-%s.scope' % container_id),
+            os.path.join(base, 'docker', container_id),
+        ]
+
+    def _find(self):
+        for path in self._candidates():
+            if os.path.exists(os.path.join(path, 'cgroup.controllers')):
+                return {'version': 2, 'cpu': path, 'memory': path, 'io': path}
+        paths = {'version': 1}
+        for controller in ('cpuacct', 'memory', 'blkio'):
+            for path in self._candidates(controller):
+                if os.path.isdir(path):
+                    paths[controller] = path
+                    break
+        return paths if len(paths) > 1 else None
+
+    @property
+    def available(self):
+        return self.paths is not None
+
+    def _cpu_seconds(self):
+        if self.paths['version'] == 2:
+            stat = _read(os.path.join(self.paths['cpu'], 'cpu.stat')) or ''
+            for line in stat.splitlines():
+                if line.startswith('usage_usec '):
+                    return int(line.split()[1]) / 1e6
+            return None
+        if 'cpuacct' in self.paths:
+            usage = _read(os.path.join(self.paths['cpuacct'], 'cpuacct.usage'))
+            return int(usage) / 1e9 if usage else None
+        return None
+
+    def _memory_bytes(self):
+        usage = None
+        if self.paths['version'] == 2:
+            usage = _read(os.path.join(self.paths['memory'], 'memory.current'))
+        elif 'memory' in self.paths:
+            usage = _read(os.path.join(self.paths['memory'],
+                'memory.usage_in_bytes'))
+        return float(usage) if usage else None
+
+    def _io_bytes(self):
+        read = written = 0
+        if self.paths['version'] == 2:
+            stat = _read(os.path.join(self.paths['io'], 'io.stat')) or ''
+            for line in stat.splitlines():
+                for field in line.split()[1:]:
+                    key, _, value = field.partition('=')
+                    if key == 'rbytes':
+                        read += int(value)
+                    elif key == 'wbytes':
+                        written += int(value)
+        elif 'blkio' in self.paths:
+            stat = _read(os.path.join(self.paths['blkio'],
+                'blkio.throttle.io_service_bytes')) or ''
+            for line in stat.splitlines():
+                parts = line.split()
+                if len(parts) == 3 and parts[1] == 'Read':
+                    read += int(parts[2])
+                elif len(parts) == 3 and parts[1] == 'Write':
+                    written += int(parts[2])
+        return read, written
+
+    def sample(self, now):
+        service = self.container.service or self.container.name
+        values = {}
+        memory = self._memory_bytes()
+        if memory is not None:
+            values[metric('container_memory_bytes', service=service)] = memory
+
+        counters = (self._cpu_seconds(),) + self._io_bytes()
+        if self.previous is not None:
+            elapsed = now - self.previous[0]
+            cpu, read, written = counters
+            previous_cpu, previous_read, previous_written = self.previous[1]
+            if cpu is not None and previous_cpu is not None:
+                values[metric('container_cpu_percent', service=service)] = \
+                    max(0, cpu - previous_cpu) / elapsed * 100
+            values[metric('container_io_read_bytes_per_second',
+                service=service)] = max(0, read - previous_read) / elapsed
+            values[metric('container_io_write_bytes_per_second',
+                service=service)] = max(0, written - previous_written) / elapsed
+        self.previous = (now, counters)
+        return values
+
+
+class ContainerProbes(object):
+    """
+    A CgroupProbe for each of the project's running containers, refreshed
+    every CONTAINER_REFRESH seconds.
+    """
+    def __init__(self, backend, refresh=CONTAINER_REFRESH):
+        self.backend = backend
+        self.refresh = refresh
+        self.probes = {}
+        self.unavailable = set()
+        self.refreshed = None
+
+    def _refresh(self, now):
+        running = dict((c.id, c) for c in self.backend.container_states())
+        for container_id in list(self.probes):
+            if container_id not in running:
+                del self.probes[container_id]
+        for container_id, container in running.items():
+            if container_id in self.probes or container_id in self.unavailable:
+                continue
+            probe = CgroupProbe(container)
+            if probe.available:
+                self.probes[container_id] = probe
+            else:
+                logger.debug("No cgroup found for %s" % (
+                    container.name or container_id[:12]))
+                self.unavailable.add(container_id)
+        self.refreshed = now
+
+    def sample(self, now):
+        if self.refreshed is None or now - self.refreshed >= self.refresh:
+            self._refresh(now)
+        values = {}
+        for probe in self.probes.values():
+            values.update(probe.sample(now))
+        return values
+
+
+class Sampler(object):
+    """
+    Samples the probes every `interval` seconds on a background thread, into
+    a SampleBuffer of the last `capacity` samples, and into `log` (a
+    SampleLog) if one is given.
+
+    >>> with Sampler([HostProbe()], interval=1, capacity=300) as sampler:
+    >>>     time.sleep(60)
+    >>>     summarize(sampler.buffer.values('host_cpu_percent'))
+
+    Samples are taken on a fixed schedule (a slow sample delays the next one
+    rather than shifting all of the ones after it), and how long each one
+    took is kept as `sampler_milliseconds`, which is the cost of measuring.
+    """
+    def __init__(self, probes, interval=1.0, capacity=600, log=None):
+        self.probes = probes
+        self.interval = interval
+        self.buffer = SampleBuffer(capacity)
+        self.log = log
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        started = time.time()
+        values = {}
+        for probe in self.probes:
+            try:
+                values.update(probe.sample(started))
+            except Exception as e:
+                logger.debug("Sampling %s failed: %s"
+                    % (probe.__class__.__name__, e))
+        values['sampler_milliseconds'] = (time.time() - started) * 1000
+        self.buffer.append(started, values)
+        if self.log is not None:
+            self.log.append(started, values)
+
+    def _run(self):
+        deadline = time.time()
+        while not self._stopped.is_set():
+            self.sample()
+            deadline += self.interval
+            # After falling behind (e.g. the machine was suspended), start
+            # again from now instead of catching up with a burst of samples.
+            if deadline < time.time():
+                deadline = time.time() + self.interval
+            self._stopped.wait(deadline - time.time())
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='comp-stats')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def to_csv(buffer, stream):
+    """
+    Writes every sample of a SampleLog (or a SampleBuffer) as a row, with a
+    column per metric.
+    """
+    import csv
+
+    names = buffer.names
+    writer = csv.writer(stream)
+    writer.writerow(['timestamp'] + names)
+    for timestamp, values in buffer.rows():
+        writer.writerow(['%.3f' % timestamp] + [
+            '' if math.isnan(values[n]) else '%g' % values[n] for n in names])
+
+
+def to_prometheus(buffer, stream, last=None):
+    """
+    Writes the min, mean, p95 and last value of each metric over the last
+    `last` samples in Prometheus' text exposition format, e.g. for
+    node_exporter's textfile collector.
+    """
+    written = set()
+    for name in sorted(buffer.names, key=lambda n: n.partition('{')[::2]):
+        summary = summarize(buffer.values(name, last))
+        if summary is None:
+            continue
+        base, _, labels = name.partition('{')
+        base = 'comp_' + base
+        labels = labels.rstrip('}')
+        if base not in written:
+            stream.write('# TYPE %s gauge\n' % base)
+            written.add(base)
+        for stat, value in zip(('min', 'mean', 'p95', 'last'), summary):
+            stream.write('%s{%s} %r\n' % (base, ','.join(filter(None,
+                [labels, 'stat="%s"' % stat])), value))
@@ -0,0 +1,273 @@
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .utils.cache import write_atomic
+from .utils.logging import get_logger
+from .utils.tracing import tracer
+
+
+__all__ = ('Step', 'StepPlan', 'StepGraph', 'StepState', 'fingerprint', )
+
+
+logger = get_logger()
+
+
+def fingerprint(inputs):
+    """
+    A short, stable hash of a step's inputs.
+    """
+    data = json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+class Step(object):
+    """
+    A unit of work in a StepGraph.
+
+    A step runs when any of these say so:
+
+    - `inputs` returns a dict that differs from the one recorded the last
+      time the step succeeded (e.g. the compose files' hash, or the commit
+      checked out in a sub-repository).
+    - `check` returns a reason for it to run (e.g. containers are running and
+      have to be stopped).
+    - A step it `requires` runs, since that changes what this step works on.
+
+    A step with neither `inputs` nor `check` only runs when a step it
+    requires runs.  Steps listed in `after` are only waited for, and do not
+    make the step run.
+    """
+    def __init__(self, name, action, requires=(), after=(), inputs=None,
+            check=None, description=None):
+        self.name = name
+        self.action = action
+        self.requires = tuple(requires)
+        self.after = tuple(after)
+        self.inputs = inputs
+        self.check = check
+        self.description = description or name
+
+    @property
+    def dependencies(self):
+        return self.requires + self.after
+
+    def __repr__(self):
+        return "Step(%r)" % self.name
+
+
+class StepPlan(object):
+    """
+    Whether a step will run, and why.
+    """
+    def __init__(self, step, run, reasons, inputs=None):
+        self.step = step
+        self.run = run
+        self.reasons = reasons
+        self.inputs = inputs
+
+    def __str__(self):
+        return "%s %s: %s" % ('run ' if self.run else 'skip', self.step.name,
+            "; ".join(self.reasons))
+
+
+class StepState(object):
+    """
+    The inputs each step had the last time it succeeded, persisted as JSON.
+    """
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self.steps = json.load(f)
+        except (IOError, OSError, ValueError):
+            self.steps = {}
+
+    def get(self, name):
+        return self.steps.get(name)
+
+    def record(self, name, inputs):
+        with self._lock:
+            self.steps[name] = {'inputs': inputs,
+                'fingerprint': fingerprint(inputs), 'time': time.time()}
+            self.save()
+
+    def changed(self, name, inputs):
+        """
+        Returns the keys of `inputs` that differ from the ones recorded for
+        the step, or None if it was never recorded.
+        """
+        previous = self.get(name)
+        if previous is None:
+            return None
+        return _changed_inputs(previous.get('inputs') or {}, inputs)
+
+    def forget(self, name):
+        with self._lock:
+            self.steps.pop(name, None)
+            self.save()
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        write_atomic(self.path, json.dumps(self.steps, indent=2, sort_keys=True))
+
+
+def _changed_inputs(previous, current):
+    keys = set(previous) | set(current)
+    return sorted(k for k in keys if previous.get(k) != current.get(k))
+
+
+class StepGraph(object):
+    """
+    Runs a set of steps in dependency order, skipping the ones that are up to
+    date and running the ones that do not depend on each other concurrently.
+
+    >>> graph = StepGraph([
+    >>>     Step('stop', stop, check=containers_running),
+    >>>     Step('pull', pull, check=images_outdated),
+    >>>     Step('up', up, requires=['pull'], after=['stop'], inputs=up_inputs),
+    >>> ], state=StepState(root_dir / '.comp' / 'setup.json'))
+    >>> for plan in graph.plan():
+    >>>     print(plan)
+    >>> graph.run()
+    """
+    def __init__(self, steps, state, max_workers=4):
+        self.steps = dict((step.name, step) for step in steps)
+        self.order = self._sort(steps)
+        self.state = state
+        self.max_workers = max_workers
+
+    def _sort(self, steps):
+        order, visiting, done = [], set(), set()
+
+        def visit(step):
+            if step.name in done:
+                return
+            if step.name in visiting:
+                raise ValueError("Steps have a circular dependency on %s"
+                    % step.name)
+            visiting.add(step.name)
+            for name in step.dependencies:
+                if name not in self.steps:
+                    raise ValueError("Step %s depends on unknown step %s"
+                        % (step.name, name))
+                visit(self.steps[name])
+            visiting.discard(step.name)
+            done.add(step.name)
+            order.append(step)
+
+        for step in steps:
+            visit(step)
+        return order
+
+    def _plan_step(self, step, plans, force):
+        reasons = []
+        inputs = step.inputs() if step.inputs else None
+        if force:
+            reasons.append("forced")
+
+        if inputs is not None:
+            changed = self.state.changed(step.name, inputs)
+            if changed is None:
+                reasons.append("has not run before")
+            elif changed:
+                reasons.append("changed: %s" % ", ".join(changed))
+        if step.check:
+            reason = step.check()
+            if reason:
+                reasons.append(reason)
+        for name in step.requires:
+            if plans[name].run:
+                reasons.append("%s will run" % name)
+
+        if reasons:
+            return StepPlan(step, True, reasons, inputs=inputs)
+        if inputs is None and not step.check:
+            reason = "nothing it requires will run"
+        elif inputs is not None:
+            reason = "up to date"
+        else:
+            reason = "nothing to do"
+        return StepPlan(step, False, [reason], inputs=inputs)
+
+    def plan(self, force=False):
+        """
+        Returns a StepPlan for every step, in the order they can run in.
+        """
+        plans = {}
+        for step in self.order:
+            with tracer.span('plan %s' % step.name):
+                plans[step.name] = self._plan_step(step, plans, force)
+        return [plans[step.name] for step in self.order]
+
+    def _run_step(self, plan):
+        step = plan.step
+        logger.info("%s (%s)" % (step.description, "; ".join(plan.reasons)))
+        # The steps it depends on (e.g. a pull) can change its inputs after
+        # they were planned, so it records the ones it actually ran with.
+        inputs = step.inputs() if plan.inputs is not None else None
+        with tracer.span(step.name):
+            step.action()
+        if inputs is not None:
+            self.state.record(step.name, inputs)
+
+    def run(self, plans=None, force=False):
+        """
+        Runs the steps that are planned to run, each as soon as the steps it
+        depends on are done, and returns the names of the steps that ran.
+
+        If a step fails, the steps that depend on it are not started and its
+        error is raised once the steps already running are done.
+        """
+        plans = plans or self.plan(force=force)
+        pending = dict((p.step.name, p) for p in plans)
+        done, ran = set(), []
+        running = {}
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                if error is None:
+                    for name, plan in list(pending.items()):
+                        if not all(d in done for d in plan.step.dependencies):
+                            continue
+                        del pending[name]
+                        if not plan.run:
+                            logger.debug("Skipping %s (%s)"
+                                % (name, "; ".join(plan.reasons)))
+                            done.add(name)
+                            continue
+                        running[executor.submit(self._run_step, plan)] = name
+
+                    # Skipping steps can make others ready without anything
+                    # running yet.
+                    if not running and pending and any(
+                            all(d in done for d in p.step.dependencies)
+                            for p in pending.values()):
+                        continue
+                if not running:
+                    break
+
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                    except BaseException as e:
+                        if error is None:
+                            error = e
+                        continue
+                    done.add(name)
+                    ran.append(name)
+
+        if error is not None:
+            raise error
+        return ran
@@ -0,0 +1,133 @@
+from __future__ import absolute_import
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .compose import ComposeModel
+from .registry import ImageReference, RegistryClient, RegistryError
+from .utils.cache import JSONCache
+from .utils.logging import get_logger
+
+
+__all__ = ('UpdateChecker', 'DIGEST_CACHE_TTL', )
+
+
+logger = get_logger()
+
+
+# How long (in seconds) the digest a registry serves for a tag is trusted
+# before it is looked up again.  Can be overridden with COMP_DIGEST_CACHE_TTL.
+DIGEST_CACHE_TTL = 10 * 60
+
+
+class UpdateChecker(object):
+    """
+    Determines which services' images are out of date by comparing the digests
+    of the local images against the digests the registry currently serves for
+    their tags.
+
+    >>> checker = UpdateChecker(backend)
+    >>> checker.services_needing_update()
+    >>> ['mysqld']
+
+    The registry is only asked (with concurrent HEAD requests) about images
+    whose digest is not already in the on-disk cache, so repeated checks within
+    DIGEST_CACHE_TTL do not touch the network at all.
+    """
+    def __init__(self, backend, registry=None, cache=None, max_workers=8,
+            connectivity=None):
+        self.backend = backend
+        self.registry = registry or RegistryClient()
+        self.connectivity = connectivity
+        self.offline = set()
+        self.unknown = set()
+        self.cache = cache or JSONCache('digests', ttl=float(
+            os.environ.get('COMP_DIGEST_CACHE_TTL', DIGEST_CACHE_TTL)))
+        self.max_workers = max_workers
+
+    def service_images(self):
+        """
+        Returns the image of every service in the compose files that is
+        pulled from a registry, rather than built locally.
+        """
+        images = ComposeModel.load(self.backend.root,
+            files=self.backend.files).images
+        return dict((name, image) for name, image in images.items() if image)
+
+    def _lookup(self, image):
+        try:
+            return image, self.registry.manifest_digest(image)
+        except RegistryError as e:
+            logger.debug(str(e))
+            return image, None
+
+    def remote_digests(self, images):
+        """
+        Returns a dict of image to the digest the registry serves for it, with
+        None for images that could not be looked up.
+        """
+        digests = {}
+        missing = []
+        for image in set(images):
+            if ImageReference.parse(image).digest:
+                # Images pinned to a digest can never be out of date.
+                digests[image] = ImageReference.parse(image).digest
+            elif image in self.cache:
+                digests[image] = self.cache.get(image)
+            else:
+                missing.append(image)
+
+        if missing:
+            workers = min(self.max_workers, len(missing))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for image, digest in executor.map(self._lookup, missing):
+                    digests[image] = digest
+                    if digest:
+                        self.cache.set(image, digest)
+            self.cache.save()
+        return digests
+
+    def offline_services(self, images):
+        """
+        Returns the services whose image's registry cannot be reached, which
+        is known within a couple of seconds at most (and then cached), rather
+        than after each lookup times out.
+        """
+        from .connectivity import ConnectivityChecker, reachable
+
+        endpoints = dict((service, self.registry.endpoint(
+            ImageReference.parse(image))) for service, image in images.items())
+        online = reachable(set(endpoints.values()),
+            checker=self.connectivity or ConnectivityChecker())
+        offline = sorted(s for s, e in endpoints.items() if e not in online)
+        self.offline.update(offline)
+        return offline
+
+    def services_needing_update(self, services=None):
+        images = self.service_images()
+        if services:
+            images = dict((k, v) for k, v in images.items() if k in services)
+        if not images:
+            return []
+
+        offline = self.offline_services(images)
+        if offline:
+            logger.warning("Cannot reach the registry of %s, not checking for "
+                "updates to them." % ", ".join(offline))
+            images = dict((k, v) for k, v in images.items() if k not in offline)
+
+        remote = self.remote_digests(images.values())
+        outdated = []
+        for service, image in sorted(images.items()):
+            local = self.backend.image_digests(image)
+            if local is None:
+                outdated.append(service)
+            elif remote.get(image) is None:
+                # The registry could not tell (e.g. the repository is
+                # private), so the image is pulled to be sure, rather than
+                # never updated.
+                self.unknown.add(service)
+                outdated.append(service)
+            elif remote[image] not in local:
+                outdated.append(service)
+        return outdated
@@ -0,0 +1,102 @@
+from __future__ import absolute_import
+
+import json
+import os
+import tempfile
+import time
+
+
+__all__ = ('cache_dir', 'JSONCache', )
+
+
+def cache_dir(*parts):
+    """
+    Returns (and creates) a directory under the user's cache for comp, which
+    can be moved with COMP_CACHE_DIR.
+
+    >>> cache_dir('digests')
+    >>> '/Users/nick/.cache/comp-community/digests'
+    """
+    base = os.environ.get('COMP_CACHE_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'comp-community')
+    path = os.path.join(base, *parts)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
+
+
+def write_atomic(path, data):
+    """
+    Writes the data to a temporary file next to `path` and renames it into
+    place, so that concurrent readers never see a partially written file.
+    """
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path),
+        prefix='.%s.' % os.path.basename(path))
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class JSONCache(object):
+    """
+    A small key/value cache persisted as a single JSON file, where every entry
+    expires `ttl` seconds after it was set.
+
+    >>> cache = JSONCache('digests', ttl=600)
+    >>> cache.set('mysql:latest', 'sha256:...')
+    >>> cache.get('mysql:latest')
+    >>> 'sha256:...'
+
+    The file is read once and only written back when `save` is called, so
+    looking up many keys costs a single read.
+    """
+    def __init__(self, name, ttl, directory=None):
+        self.ttl = ttl
+        self.path = os.path.join(directory or cache_dir(), '%s.json' % name)
+        self._entries = None
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except (IOError, OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def is_fresh(self, entry, now=None):
+        now = now or time.time()
+        return now - entry.get('time', 0) < self.ttl
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None or not self.is_fresh(entry):
+            return default
+        return entry['value']
+
+    def __contains__(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and self.is_fresh(entry)
+
+    def set(self, key, value):
+        self.entries[key] = {'value': value, 'time': time.time()}
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self._entries = {}
+
+    def save(self):
+        now = time.time()
+        entries = dict((k, v) for k, v in self.entries.items()
+            if self.is_fresh(v, now=now))
+        write_atomic(self.path, json.dumps(entries, indent=2, sort_keys=True))
@@ -1,7 +1,10 @@
 from __future__ import absolute_import
 
 import inspect
-from collections import Iterable
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
 
 from .exceptions import (MissingParameterError, InvalidParameterError,
     InvalidInputError)
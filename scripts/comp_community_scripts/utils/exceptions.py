@@ -6,6 +6,13 @@ __all__ = (
     'InvalidParameterError',
     'InvalidInputError',
     'BooleanInputError',
+    'DockerEngineError',
+    'PullError',
+    'CommandFailed',
+    'CommandTimeout',
+    'ComposeFileError',
+    'PortAllocationError',
+    'InstanceConflictError',
 )
 
 
@@ -44,3 +51,76 @@ class InvalidInputError(CompCommandError):
 class BooleanInputError(InvalidInputError):
     def __str__(self):
         return "Invalid choice %s." % self.value
+
+
+class DockerEngineError(CompCommandError):
+    """
+    Raised when the Docker Engine API responds with an error, or cannot be
+    reached over its socket.
+    """
+    def __init__(self, message, status=None):
+        self.status = status
+        super(DockerEngineError, self).__init__(message)
+
+
+class PullError(CompCommandError):
+    """
+    Raised when one or more services could not be pulled, even after being
+    retried.  `failures` maps each of those services to its last error.
+    """
+    def __init__(self, failures):
+        self.failures = failures
+        lines = ["%s: %s" % (service, error)
+            for service, error in sorted(failures.items())]
+        super(PullError, self).__init__(
+            "Could not pull %d service(s):\n%s\nAre you logged into docker hub?"
+            % (len(failures), "\n".join(lines)))
+
+
+class CommandFailed(CompCommandError):
+    """
+    Raised when an external command exits with an unexpected return code.
+    `tail` holds the last lines of its output.
+    """
+    def __init__(self, argv, retcode, tail=None, message=None):
+        self.argv = argv
+        self.retcode = retcode
+        self.tail = list(tail or [])
+        message = message or "Command '%s' exited with %s" % (
+            ' '.join(argv), retcode)
+        if self.tail:
+            message += ":\n" + "\n".join(self.tail[-10:])
+        super(CommandFailed, self).__init__(message)
+
+
+class CommandTimeout(CommandFailed):
+    """
+    Raised when an external command does not finish within its timeout, after
+    it has been killed.
+    """
+    def __init__(self, argv, timeout, tail=None):
+        self.timeout = timeout
+        super(CommandTimeout, self).__init__(argv, None, tail=tail,
+            message="Command '%s' timed out after %ss" % (' '.join(argv), timeout))
+
+
+class ComposeFileError(CompCommandError):
+    """
+    Raised when the compose files cannot be read or parsed.
+    """
+    pass
+
+
+class PortAllocationError(CompCommandError):
+    """
+    Raised when no free host ports are left to lease to an instance.
+    """
+    pass
+
+
+class InstanceConflictError(CompCommandError):
+    """
+    Raised when another instance of the same checkout is running, which an
+    instance cannot run alongside since they would share its database.
+    """
+    pass
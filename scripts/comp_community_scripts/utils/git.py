@@ -0,0 +1,74 @@
+from __future__ import absolute_import
+
+import os
+
+
+__all__ = ('git_dir', 'git_head', )
+
+
+def git_dir(path):
+    """
+    Returns the .git directory of the repository checked out at `path`, which
+    for worktrees and submodules is pointed to by a .git file, or None if
+    `path` is not a repository.
+    """
+    dot_git = os.path.join(str(path), '.git')
+    if os.path.isdir(dot_git):
+        return dot_git
+    try:
+        with open(dot_git) as f:
+            line = f.readline().strip()
+    except (IOError, OSError):
+        return None
+    if line.startswith('gitdir:'):
+        return os.path.normpath(os.path.join(str(path), line[7:].strip()))
+    return None
+
+
+def _resolve_ref(directory, ref):
+    try:
+        with open(os.path.join(directory, ref)) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        pass
+    try:
+        with open(os.path.join(directory, 'packed-refs')) as f:
+            for line in f:
+                parts = line.strip().split(' ')
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def git_head(path):
+    """
+    Returns the commit checked out in the repository at `path`, or None if it
+    is not a repository.  The refs are read directly, rather than running git,
+    since this is asked on every `comp setup`.
+
+    >>> git_head(root_dir / 'www' / 'api')
+    >>> '3f1e2a...'
+    """
+    directory = git_dir(path)
+    if directory is None:
+        return None
+    try:
+        with open(os.path.join(directory, 'HEAD')) as f:
+            head = f.read().strip()
+    except (IOError, OSError):
+        return None
+    if not head.startswith('ref:'):
+        return head
+    ref = head[4:].strip()
+    commit = _resolve_ref(directory, ref)
+    if commit is None:
+        # Worktrees keep their shared refs in the main repository.
+        try:
+            with open(os.path.join(directory, 'commondir')) as f:
+                common = os.path.join(directory, f.read().strip())
+            commit = _resolve_ref(os.path.normpath(common), ref)
+        except (IOError, OSError):
+            pass
+    return commit
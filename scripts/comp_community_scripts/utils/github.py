@@ -1,16 +1,17 @@
 from __future__ import print_function
 
-import socket
-
 
 __all__ = ('github_is_online', )
 
 
-def github_is_online():
-    s = socket.socket()
-    try:
-        s.connect(('github.com', 22))
-    except:
-        return False
-    else:
-        return True
+GITHUB_ENDPOINT = 'github.com:22'
+
+
+def github_is_online(checker=None):
+    """
+    Whether GitHub accepts connections over SSH, which is checked within a
+    couple of seconds at most and cached for a little while, see
+    connectivity.ConnectivityChecker.
+    """
+    from ..connectivity import is_online
+    return is_online([GITHUB_ENDPOINT], checker=checker)
@@ -1,13 +1,59 @@
 from __future__ import print_function
 
 import logging
-from tornado.log import LogFormatter
+import sys
+
+from .terminal import colors
 
 
 logger = None
 
 
-__all__ = ('get_logger', )
+__all__ = ('get_logger', 'LogFormatter', )
+
+
+class LogFormatter(logging.Formatter):
+    """
+    Minimal replacement for tornado.log.LogFormatter, so that getting a logger
+    does not require importing tornado on every `comp` invocation.
+
+    Supports the same `%(color)s` and `%(end_color)s` placeholders, which are
+    only filled in when the stream is a terminal.
+    """
+    DEFAULT_FORMAT = '%(color)s[%(asctime)s]%(end_color)s %(message)s'
+    DEFAULT_DATE_FORMAT = '%y%m%d %H:%M:%S'
+    DEFAULT_COLORS = {
+        logging.DEBUG: colors.BLUE,
+        logging.INFO: colors.GREEN,
+        logging.WARNING: colors.ORANGE,
+        logging.ERROR: colors.RED,
+        logging.CRITICAL: colors.RED,
+    }
+
+    def __init__(self, fmt=DEFAULT_FORMAT, datefmt=DEFAULT_DATE_FORMAT,
+            color=True, stream=None):
+        super(LogFormatter, self).__init__(datefmt=datefmt)
+        self._fmt = fmt
+        stream = stream or sys.stderr
+        self._colors = {}
+        if color and hasattr(stream, 'isatty') and stream.isatty():
+            self._colors = self.DEFAULT_COLORS
+
+    def format(self, record):
+        record.message = record.getMessage()
+        record.asctime = self.formatTime(record, self.datefmt)
+        if record.levelno in self._colors:
+            record.color = self._colors[record.levelno]
+            record.end_color = colors.RESET
+        else:
+            record.color = record.end_color = ''
+
+        formatted = self._fmt % record.__dict__
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            formatted = formatted.rstrip() + "\n" + record.exc_text
+        return formatted.replace("\n", "\n    ")
 
 
 def get_logger():
@@ -1,43 +1,63 @@
-import contextlib
-
 import plumbum
-from plumbum.commands.processes import run_proc
-
-
-__all__ = ('FG', )
-
-
-@contextlib.contextmanager
-def bgrun(cmd, retcode=0, timeout=None):
-    p = cmd.popen(stdin=None, stdout=None, stderr=None)
-    was_run = [False]
-
-    def runner():
-        if was_run[0]:
-            return  # already done
-        was_run[0] = True
-        try:
-            return run_proc(p, retcode=0, timeout=None)
-        except KeyboardInterrupt:
-            p.wait()
-            raise
-        finally:
-            del p.run  # to break cyclic reference p -> cell -> p
-            for f in [p.stdin, p.stdout, p.stderr]:
-                try:
-                    f.close()
-                except Exception:
-                    pass
-    p.run = runner
-    yield p
-    runner()
+
+from .exceptions import CompCommandError
+
+
+__all__ = ('FG', 'LazyCommand', )
+
+
+class LazyCommand(object):
+    """
+    Stands in for a `plumbum.cmd` binary, but only resolves it on the PATH the
+    first time it is used.
+
+    >>> docker_compose = LazyCommand('docker-compose')
+    >>> docker_compose['ps'] & FG
+
+    Importing `plumbum.cmd.docker_compose` at module level searches the PATH
+    (and fails outright if the binary is missing) on every invocation of
+    `comp`, even for commands like `comp --help` that never run it.
+    """
+    def __init__(self, name):
+        self.name = name
+        self._command = None
+
+    @property
+    def command(self):
+        if self._command is None:
+            try:
+                self._command = plumbum.local[self.name]
+            except plumbum.CommandNotFound:
+                # CommandNotFound is an AttributeError, which would send the
+                # lookup of `command` back through __getattr__.
+                raise CompCommandError("%s could not be found on the PATH"
+                    % self.name)
+        return self._command
+
+    def __getitem__(self, args):
+        return self.command[args]
+
+    def __call__(self, *args, **kwargs):
+        return self.command(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.command, name)
+
+    def __repr__(self):
+        return "LazyCommand(%r)" % self.name
 
 
 class FG(type(plumbum.FG)):
+    """
+    Like plumbum.FG, runs the command in the foreground, but actually honors
+    the `retcode` and `timeout` it is given:
 
+    >>> docker_compose['exec', 'api', 'bash'] & FG(retcode=None, timeout=60)
+    """
     def __rand__(self, cmd):
-        with bgrun(cmd, retcode=self.retcode, timeout=self.timeout) as p:
-            p.run()
+        from .runner import run
+        return run(cmd, retcode=self.retcode, timeout=self.timeout,
+            interactive=True)
 
 
 FG = FG()
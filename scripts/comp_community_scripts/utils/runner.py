@@ -0,0 +1,291 @@
+from __future__ import absolute_import
+
+import collections
+import os
+import selectors
+import signal
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .exceptions import CommandFailed, CommandTimeout
+from .logging import get_logger
+from .tracing import tracer
+
+
+__all__ = ('CommandResult', 'run', 'run_many', 'argv_for', )
+
+
+logger = get_logger()
+
+
+# How many of the last lines of a command's output are kept, to be shown when
+# it fails.
+DEFAULT_TAIL = 200
+
+# How long a command is given to exit after SIGTERM before it is killed.
+KILL_GRACE_PERIOD = 5
+
+
+class CommandResult(object):
+    """
+    The outcome of running a command with `run`.
+
+    `tail` holds the last lines of stdout and stderr as they were
+    interleaved, for showing, and `stdout_tail` the last lines of stdout
+    alone (all of them for commands run with `capture`), for parsing.
+    """
+    def __init__(self, argv, retcode=None, elapsed=None, tail=None,
+            output_bytes=0, error=None, stdout_tail=None):
+        self.argv = argv
+        self.retcode = retcode
+        self.elapsed = elapsed
+        self.tail = list(tail or [])
+        self.stdout_tail = list(stdout_tail or [])
+        self.output_bytes = output_bytes
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def output(self):
+        return "\n".join(self.tail)
+
+    @property
+    def stdout(self):
+        return "\n".join(self.stdout_tail)
+
+    def __repr__(self):
+        return "CommandResult(%r, retcode=%r)" % (' '.join(self.argv), self.retcode)
+
+
+def argv_for(cmd):
+    """
+    Returns the argument list for a plumbum command (bound or not), or for an
+    argument list itself.
+
+    >>> argv_for(docker_compose['ps'])
+    >>> ['/usr/local/bin/docker-compose', 'ps']
+    """
+    if isinstance(cmd, (list, tuple)):
+        return [str(a) for a in cmd]
+    if hasattr(cmd, 'cmd') and hasattr(cmd, 'args'):
+        return argv_for(cmd.cmd) + [str(a) for a in cmd.args]
+    return list(cmd.formulate(0))
+
+
+def _plumbum_context():
+    """
+    Commands are run in plumbum's current working directory and environment,
+    so that `with local.cwd(...)` and `with local.env(...)` keep working
+    around them.
+    """
+    try:
+        from plumbum import local
+    except ImportError:
+        return None, None
+    return str(local.cwd), local.env.getdict()
+
+
+def _check_retcode(argv, returncode, retcode, tail):
+    if retcode is None:
+        return
+    allowed = retcode if isinstance(retcode, (list, tuple, set)) else [retcode]
+    if returncode not in allowed:
+        raise CommandFailed(argv, returncode, tail=tail)
+
+
+def _terminate(proc):
+    if proc.poll() is not None:
+        return
+    proc.terminate()
+    try:
+        proc.wait(KILL_GRACE_PERIOD)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def _run_interactive(proc, argv, timeout):
+    """
+    Waits on a command that inherited our terminal, e.g. `docker-compose exec`
+    into a shell.  Ctrl-C is delivered to the command by the terminal, so we
+    only have to wait for it to exit.
+    """
+    try:
+        return proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+        _terminate(proc)
+        raise CommandTimeout(argv, timeout)
+    except KeyboardInterrupt:
+        proc.send_signal(signal.SIGINT)
+        proc.wait()
+        raise
+
+
+def _run_streaming(proc, argv, timeout, tail, log, prefix, capture=False):
+    """
+    Reads stdout and stderr through non-blocking pipes as output becomes
+    available, handing each complete line to `log` and keeping the last
+    `tail` lines in a ring buffer, and the last `tail` lines of stdout (or
+    all of them, to `capture` it) in another.
+    """
+    buffer = collections.deque(maxlen=tail)
+    stdout = collections.deque(maxlen=None if capture else tail)
+    pending = {}
+    output_bytes = 0
+    deadline = time.time() + timeout if timeout else None
+
+    def emit(pipe, line):
+        line = line.decode('utf-8', 'replace').rstrip('\r')
+        buffer.append(line)
+        if pipe is proc.stdout:
+            stdout.append(line)
+        if log:
+            log("%s%s" % (prefix, line))
+
+    with selectors.DefaultSelector() as selector:
+        for pipe in (proc.stdout, proc.stderr):
+            os.set_blocking(pipe.fileno(), False)
+            selector.register(pipe, selectors.EVENT_READ)
+            pending[pipe] = b''
+
+        try:
+            while selector.get_map():
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        _terminate(proc)
+                        raise CommandTimeout(argv, timeout, tail=buffer)
+                for key, _ in selector.select(remaining):
+                    chunk = os.read(key.fd, 65536)
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        if pending[key.fileobj]:
+                            emit(key.fileobj, pending.pop(key.fileobj))
+                        continue
+                    output_bytes += len(chunk)
+                    lines = (pending[key.fileobj] + chunk).split(b'\n')
+                    pending[key.fileobj] = lines.pop()
+                    for line in lines:
+                        emit(key.fileobj, line)
+        except KeyboardInterrupt:
+            _terminate(proc)
+            raise
+
+    remaining = deadline - time.time() if deadline is not None else None
+    try:
+        returncode = proc.wait(max(remaining, 0) if remaining is not None else None)
+    except subprocess.TimeoutExpired:
+        _terminate(proc)
+        raise CommandTimeout(argv, timeout, tail=buffer)
+    return returncode, buffer, stdout, output_bytes
+
+
+def run(cmd, retcode=0, timeout=None, interactive=False, tail=DEFAULT_TAIL,
+        log=None, prefix='', cwd=None, env=None, capture=False):
+    """
+    Runs a command to completion and returns a CommandResult.
+
+    >>> run(docker_compose['pull'], timeout=600)
+
+    Unless `interactive` is set, the command's stdout and stderr are streamed
+    line by line to `log` (by default the comp logger) as they are produced.
+    `interactive` commands inherit the terminal instead, for shells and
+    attached `up`s.
+
+    Only the last `tail` lines of the output are kept, unless the command's
+    stdout is parsed and set to `capture`, which keeps all of it:
+
+    >>> run(docker['ps', '--format', '{{json .}}'], capture=True).stdout_tail
+
+    A CommandTimeout is raised (after killing the command) if it runs longer
+    than `timeout` seconds, and a CommandFailed if it exits with a code other
+    than `retcode`, which can also be a list of codes or None to accept any.
+    """
+    argv = argv_for(cmd)
+    default_cwd, default_env = _plumbum_context()
+    cwd = cwd or default_cwd
+    env = env or default_env
+    if log is None and not interactive:
+        log = logger.info
+
+    with tracer.span(_span_name(argv), category='command',
+            argv=' '.join(argv)) as span:
+        try:
+            result = _run(argv, retcode, timeout, interactive, tail, log,
+                prefix, cwd, env, capture)
+        except CommandFailed as e:
+            if span is not None:
+                span.args.update(exit_code=e.retcode)
+            raise
+        if span is not None:
+            span.args.update(exit_code=result.retcode,
+                output_bytes=result.output_bytes)
+        return result
+
+
+def _span_name(argv):
+    """
+    Names a command's span after the binary and its first non-flag argument,
+    e.g. "docker-compose pull".
+    """
+    name = os.path.basename(argv[0])
+    args = iter(argv[1:])
+    for arg in args:
+        if arg in ('-f', '--file', '-p', '--project-name'):
+            next(args, None)
+        elif not arg.startswith('-'):
+            return '%s %s' % (name, arg)
+    return name
+
+
+def _run(argv, retcode, timeout, interactive, tail, log, prefix, cwd, env,
+        capture):
+    started = time.time()
+    if interactive:
+        proc = subprocess.Popen(argv, cwd=cwd, env=env)
+        returncode = _run_interactive(proc, argv, timeout)
+        buffer, stdout, output_bytes = [], [], 0
+    else:
+        proc = subprocess.Popen(argv, cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            returncode, buffer, stdout, output_bytes = _run_streaming(
+                proc, argv, timeout, tail, log, prefix, capture)
+        finally:
+            proc.stdout.close()
+            proc.stderr.close()
+
+    _check_retcode(argv, returncode, retcode, buffer)
+    return CommandResult(argv, retcode=returncode, elapsed=time.time() - started,
+        tail=buffer, output_bytes=output_bytes, stdout_tail=stdout)
+
+
+def run_many(cmds, max_workers=None, **kwargs):
+    """
+    Runs several commands concurrently with `run`, and returns a CommandResult
+    for each of them in the same order.  A command that fails does not stop
+    the others: its result's `error` holds the exception instead.
+
+    Each line that is logged is prefixed with the index of its command, unless
+    `prefixes` gives a prefix for each command.
+    """
+    cmds = list(cmds)
+    prefixes = kwargs.pop('prefixes', None) or [
+        '[%d] ' % i for i in range(len(cmds))]
+
+    def _run(args):
+        cmd, prefix = args
+        try:
+            return run(cmd, prefix=prefix, **kwargs)
+        except CommandFailed as e:
+            return CommandResult(e.argv, retcode=e.retcode, tail=e.tail, error=e)
+
+    if not cmds:
+        return []
+    with ThreadPoolExecutor(max_workers=max_workers or len(cmds)) as executor:
+        return list(executor.map(_run, zip(cmds, prefixes)))
@@ -0,0 +1,161 @@
+from __future__ import absolute_import
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+__all__ = ('Span', 'Tracer', 'tracer', 'traced', )
+
+
+def _cpu_time():
+    """
+    CPU time (user + system) used by this process and by the children it has
+    waited on, so that the time spent in external commands is counted too.
+    """
+    if resource is None:
+        times = os.times()
+        return times[0] + times[1] + times[2] + times[3]
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+class Span(object):
+    """
+    A timed section of a comp invocation, like a CompositionApplication step
+    or an external command.  Extra details (exit codes, output sizes...) go in
+    `args`.
+    """
+    def __init__(self, name, category, parent=None, args=None):
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.args = dict(args or {})
+        self.thread_id = threading.current_thread().ident
+        self.start = time.time()
+        self.cpu_start = _cpu_time()
+        self.end = None
+        self.cpu = None
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.time()
+            self.cpu = _cpu_time() - self.cpu_start
+
+    @property
+    def wall(self):
+        return (self.end or time.time()) - self.start
+
+    def to_chrome_event(self, pid):
+        args = dict(self.args)
+        args['cpu_ms'] = round((self.cpu or 0) * 1000, 3)
+        return {
+            'name': self.name,
+            'cat': self.category,
+            'ph': 'X',
+            'ts': int(self.start * 1e6),
+            'dur': int(self.wall * 1e6),
+            'pid': pid,
+            'tid': self.thread_id,
+            'args': args,
+        }
+
+
+class Tracer(object):
+    """
+    Records spans for the current invocation when enabled, and does nothing
+    (beyond a flag check) otherwise.
+
+    >>> with tracer.span('pull_from_docker_hub'):
+    >>>     ...
+    >>> tracer.export_chrome('out.json')
+
+    Spans are nested per thread, and the exported file is in Chrome's trace
+    event format, which chrome://tracing or https://ui.perfetto.dev can show
+    as a flame view.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @property
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def start_span(self, name, category='step', **args):
+        span = Span(name, category, parent=self.current, args=args)
+        self._stack().append(span)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def finish_span(self, span):
+        span.finish()
+        stack = self._stack()
+        if span in stack:
+            stack.remove(span)
+
+    @contextlib.contextmanager
+    def span(self, name, category='step', **args):
+        if not self.enabled:
+            yield None
+            return
+        span = self.start_span(name, category=category, **args)
+        try:
+            yield span
+        except BaseException as e:
+            span.args.setdefault('error', repr(e))
+            raise
+        finally:
+            self.finish_span(span)
+
+    def export_chrome(self, path):
+        pid = os.getpid()
+        for span in self.spans:
+            span.finish()
+        events = [s.to_chrome_event(pid) for s in self.spans]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f,
+                indent=1)
+        return events
+
+
+tracer = Tracer()
+
+
+def traced(name=None, category='step'):
+    """
+    Decorator that records a span around each call of the function.
+
+    >>> @classmethod
+    >>> @traced('stop_docker')
+    >>> def stop_docker(cls, ...):
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name, category=category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
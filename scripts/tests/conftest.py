@@ -0,0 +1,99 @@
+import json
+import os
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+
+# The tests import comp_community_scripts from this checkout, whether or not
+# it is installed.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+class FakeEngine(object):
+    """
+    A stand-in for the Docker daemon, serving HTTP on a unix socket.  Each
+    route maps (method, path without the API version) to a function that is
+    given the request and returns (status, body), where a body that is not
+    bytes is sent as JSON.  Requests are kept in `requests`.
+    """
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self.routes = {}
+        self.requests = []
+        self.connections = 0
+
+    def route(self, method, path, status=200, body=None, handler=None):
+        self.routes[(method, path)] = handler or (lambda request: (status, body))
+
+
+def _handler(engine):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            BaseHTTPRequestHandler.setup(self)
+            engine.connections += 1
+
+        def address_string(self):
+            return 'fake-engine'
+
+        def log_message(self, *args):
+            pass
+
+        def _respond(self, method):
+            url = urlparse(self.path)
+            path = url.path.split('/', 2)[2] if url.path.startswith('/v1.') \
+                else url.path.lstrip('/')
+            length = int(self.headers.get('Content-Length') or 0)
+            request = {'method': method, 'path': '/' + path,
+                'query': dict((k, v[0]) for k, v in parse_qs(url.query).items()),
+                'headers': self.headers, 'body': self.rfile.read(length)}
+            engine.requests.append(request)
+            route = engine.routes.get((method, request['path']))
+            status, body = route(request) if route else (404,
+                {'message': 'no such route'})
+            if not isinstance(body, bytes):
+                body = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._respond('GET')
+
+        def do_POST(self):
+            self._respond('POST')
+
+    return Handler
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+@pytest.fixture
+def engine():
+    # Unix socket paths are limited to about a hundred characters.
+    directory = tempfile.mkdtemp(prefix='engine-', dir='/tmp')
+    fake = FakeEngine(os.path.join(directory, 'docker.sock'))
+    server = _Server(fake.socket_path, _handler(fake))
+    thread = threading.Thread(target=server.serve_forever,
+        kwargs={'poll_interval': 0.05})
+    thread.daemon = True
+    thread.start()
+    try:
+        yield fake
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,59 @@
+import json
+import os
+import stat
+
+from comp_community_scripts.base import root_dir
+from comp_community_scripts.bench import shim
+from comp_community_scripts.bench.harness import Harness
+
+
+def _tree(path):
+    """
+    Every file under `path`, with its content.
+    """
+    files = {}
+    for directory, _, names in os.walk(str(path)):
+        for name in names:
+            full = os.path.join(directory, name)
+            with open(full, 'rb') as f:
+                files[os.path.relpath(full, str(path))] = f.read()
+    return files
+
+
+def _fake_binary(path, output):
+    with open(path, 'w') as f:
+        f.write("#!/bin/sh\necho %s \"$@\"\n" % output)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+def test_benchmarks_leave_the_checkouts_state_alone():
+    before = _tree(root_dir / '.comp')
+    with Harness() as harness:
+        result = harness.run_once(['migrate'])
+        written = _tree(os.path.join(harness.workdir, 'state'))
+    assert result['exit'] == 0
+    assert 'migrate.json' in written
+    assert _tree(root_dir / '.comp') == before
+
+
+def test_record_forwards_each_binary_to_its_own_real_binary(tmp_path,
+        monkeypatch):
+    scenario = str(tmp_path / 'scenario.json')
+    monkeypatch.setenv('COMP_BENCH_MODE', 'record')
+    monkeypatch.setenv('COMP_BENCH_REAL_COMPOSE',
+        _fake_binary(str(tmp_path / 'compose'), 'compose'))
+    monkeypatch.setenv('COMP_BENCH_REAL_DOCKER',
+        _fake_binary(str(tmp_path / 'docker'), 'docker'))
+    monkeypatch.setenv('COMP_BENCH_SCENARIO', scenario)
+    monkeypatch.delenv('COMP_BENCH_RECORD', raising=False)
+
+    monkeypatch.setenv('COMP_BENCH_BINARY', 'docker-compose')
+    assert shim.main(['pull', 'api']) == 0
+    monkeypatch.setenv('COMP_BENCH_BINARY', 'docker')
+    assert shim.main(['ps', '--format', '{{json .}}']) == 0
+
+    with open(scenario) as f:
+        recorded = json.load(f)
+    assert recorded['pull']['stdout'] == "compose pull api\n"
+    assert recorded['docker ps']['stdout'] == "docker ps --format {{json .}}\n"
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+from comp_community_scripts.build import (BuildContext, ContextHasher,
+    DockerIgnore, build_contexts)
+from comp_community_scripts.compose import ComposeModel
+
+
+@pytest.mark.parametrize('patterns, path, excluded', [
+    (['*.pyc'], 'views.pyc', True),
+    # Patterns without ** only match from the context's root.
+    (['*.pyc'], 'api/views.pyc', False),
+    (['**/*.py[co]'], 'api/views.pyc', True),
+    (['**/*.py[co]'], 'api/views.py', False),
+    (['.git'], '.git/HEAD', True),
+    (['node_modules'], 'api/node_modules', False),
+    (['**/node_modules'], 'api/node_modules/x.js', True),
+    (['*.pyc', '!keep.pyc'], 'keep.pyc', False),
+    # The last pattern that matches decides.
+    (['!keep.pyc', '*.pyc'], 'keep.pyc', True),
+    (['docs', '!docs/README.md'], 'docs/README.md', False),
+    (['docs', '!docs/README.md'], 'docs/index.md', True),
+    (['/static/'], 'static/app.js', True),
+    (['# *.py', ''], 'app.py', False),
+])
+def test_dockerignore(patterns, path, excluded):
+    assert DockerIgnore(patterns).excluded(path) == excluded
+
+
+@pytest.fixture
+def context(tmp_path, monkeypatch):
+    monkeypatch.setenv('COMP_CACHE_DIR', str(tmp_path / 'cache'))
+    root = tmp_path / 'api'
+    (root / 'app').mkdir(parents=True)
+    (root / 'Dockerfile').write_text("FROM python:3.7\n")
+    (root / '.dockerignore').write_text("**/*.pyc\n")
+    (root / 'app' / 'views.py').write_text("print('hello')\n")
+    return BuildContext('api', str(root))
+
+
+def test_hashes_are_stable(context):
+    hasher = ContextHasher()
+    first = hasher.hash(context)
+    assert hasher.hash(context) == first
+    assert ContextHasher().hash(context) == first
+
+
+def test_touching_a_file_keeps_the_hash(context):
+    first = ContextHasher().hash(context)
+    path = os.path.join(context.path, 'app', 'views.py')
+    os.utime(path, (1, 1))
+    assert ContextHasher().hash(context) == first
+
+
+def test_content_and_mode_change_the_hash(context):
+    path = os.path.join(context.path, 'app', 'views.py')
+    first = ContextHasher().hash(context)
+    with open(path, 'w') as f:
+        f.write("print('bye')\n")
+    # As an edit would, which changes the file's mtime.
+    os.utime(path, (2, 2))
+    second = ContextHasher().hash(context)
+    assert second != first
+    os.chmod(path, 0o755)
+    assert ContextHasher().hash(context) not in (first, second)
+
+
+def test_ignored_files_do_not_change_the_hash(context):
+    first = ContextHasher().hash(context)
+    with open(os.path.join(context.path, 'app', 'views.pyc'), 'wb') as f:
+        f.write(b'\0')
+    assert ContextHasher().hash(context) == first
+
+
+def test_build_options_change_the_hash(context):
+    first = ContextHasher().hash(context)
+    context.args = {'DEBUG': '1'}
+    assert ContextHasher().hash(context) != first
+
+
+def test_images_are_tagged_as_docker_compose_tags_them(tmp_path, monkeypatch):
+    monkeypatch.delenv('COMPOSE_PROJECT_NAME', raising=False)
+    root = tmp_path / 'comp-community'
+    root.mkdir()
+    model = ComposeModel(root, ['docker-compose.yml'], {'services': {
+        'api': {'build': './www/api'},
+        'admin': {'build': {'context': './www/admin'}, 'image': 'comp/admin'},
+        'mysqld': {'image': 'mysql'},
+    }})
+    tags = dict((c.service, c.tag) for c in build_contexts(model))
+    assert tags == {'api': 'compcommunity_api', 'admin': 'comp/admin'}
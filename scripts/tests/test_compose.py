@@ -0,0 +1,20 @@
+from comp_community_scripts.compose import files_from_flags, project_name
+
+
+def test_project_name_is_normalized_as_docker_compose_does(tmp_path,
+        monkeypatch):
+    # docker-compose 1.16 drops everything but letters and digits.
+    monkeypatch.delenv('COMPOSE_PROJECT_NAME', raising=False)
+    root = tmp_path / 'Comp-Community_2'
+    root.mkdir()
+    assert project_name(root) == 'compcommunity2'
+
+
+def test_project_name_from_the_environment(monkeypatch):
+    monkeypatch.setenv('COMPOSE_PROJECT_NAME', 'ci-shard_3')
+    assert project_name('/anywhere') == 'cishard3'
+
+
+def test_files_from_flags():
+    assert files_from_flags(['-f', 'a.yml', '--file', 'b.yml', 'up']) == [
+        'a.yml', 'b.yml']
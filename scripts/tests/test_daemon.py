@@ -0,0 +1,22 @@
+import pytest
+
+from comp_community_scripts.daemon import _is_daemon_eligible
+
+
+@pytest.mark.parametrize('argv, eligible', [
+    (['doctor'], True),
+    # Only switches before the subcommand are comp's own.
+    (['doctor', '-v'], True),
+    (['-v', 'doctor'], False),
+    (['--trace', 'trace.json', 'setup'], False),
+    (['daemon', 'start'], False),
+    (['logs', '--help'], True),
+])
+def test_eligible(argv, eligible):
+    assert _is_daemon_eligible(argv, tty=False) == eligible
+
+
+@pytest.mark.parametrize('argv', [['shell'], ['start'], ['migrate']])
+def test_terminal_commands_run_in_process_on_a_terminal(argv):
+    assert not _is_daemon_eligible(argv, tty=True)
+    assert _is_daemon_eligible(argv, tty=False)
@@ -0,0 +1,92 @@
+import os
+import stat
+
+import pytest
+from plumbum import local
+
+from comp_community_scripts import datadirs
+from comp_community_scripts.backends import compose as compose_backend
+from comp_community_scripts.compose import project_name
+
+
+FAKE = """#!/bin/sh
+echo "$(basename "$0") $*" >> %(log)s
+case "$1 $2" in
+    "inspect --format") echo true ;;
+esac
+exit 0
+"""
+
+FAILING = """#!/bin/sh
+exit 1
+"""
+
+
+def _binary(directory, name, script):
+    path = directory / name
+    path.write_text(script)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return path
+
+
+@pytest.fixture
+def binaries(tmp_path, monkeypatch):
+    """
+    Fake docker and docker-compose binaries that log their arguments.
+    """
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    log = tmp_path / 'commands.log'
+    log.write_text('')
+    for name, lazy in (('docker', compose_backend.docker),
+            ('docker-compose', compose_backend.docker_compose)):
+        path = _binary(bin_dir, name, FAKE % {'log': log})
+        monkeypatch.setattr(lazy, '_command', local[str(path)])
+    monkeypatch.setattr(datadirs, 'STOP_TIMEOUT', 1)
+
+    def commands():
+        return log.read_text().splitlines()
+    commands.bin_dir = bin_dir
+    return commands
+
+
+def test_initialize_aliases_mysqld_in_a_project_of_its_own(tmp_path,
+        binaries):
+    datadirs.initialize_data_dir(tmp_path, str(tmp_path / 'data'))
+
+    project = '%sinit%d' % (project_name(tmp_path), os.getpid())
+    container = '%s_mysqld' % project
+    network = '%s_default' % project
+    commands = binaries()
+    assert commands[0] == ('docker-compose run -d --no-deps --name %s mysqld'
+        % container)
+    assert '--use-aliases' not in commands[0]
+    assert commands[1:3] == [
+        'docker network disconnect %s %s' % (network, container),
+        'docker network connect --alias mysqld %s %s' % (network, container),
+    ]
+    assert ('docker-compose run --rm --no-deps api /api/apps/manage.py '
+        'migrate') in commands
+    assert commands[-3:] == [
+        'docker stop -t 1 %s' % container,
+        'docker rm -f %s' % container,
+        'docker-compose down',
+    ]
+
+
+def test_clone_tree_copies_in_a_container_when_cp_fails(tmp_path, binaries,
+        monkeypatch):
+    _binary(binaries.bin_dir, 'cp', FAILING)
+    monkeypatch.setenv('PATH', '%s:%s' % (binaries.bin_dir,
+        os.environ['PATH']))
+    source = tmp_path / 'seeds' / 'data'
+    destination = tmp_path / 'stacks' / 'data'
+
+    with local.env(PATH=os.environ['PATH']):
+        datadirs.clone_tree(str(source), str(destination), image='mysql:5.7')
+
+    assert binaries() == [
+        'docker run --rm --user root --entrypoint cp -v %s:%s -v %s:%s '
+        'mysql:5.7 -a %s %s' % (source.parent, source.parent,
+            destination.parent, destination.parent, source, destination),
+    ]
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+from comp_community_scripts.commands import db
+from comp_community_scripts.containers import ContainerState
+from comp_community_scripts.snapshots import SnapshotStore
+
+
+class Backend(object):
+
+    def __init__(self, services):
+        self.services = services
+
+    def container_states(self, all=False):
+        return [ContainerState(service, service=service, state='running')
+            for service in self.services]
+
+
+def _execute(database, sql):
+    connection = sqlite3.connect(str(database))
+    try:
+        rows = connection.execute(sql).fetchall()
+        connection.commit()
+        return rows
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    monkeypatch.setattr(db.DatabaseCommand, 'store', store)
+    database = tmp_path / 'db.sqlite3'
+    _execute(database, "CREATE TABLE users (name TEXT)")
+    store.snapshot('seeded', str(database))
+    _execute(database, "INSERT INTO users VALUES ('nick')")
+    return database
+
+
+def restore(monkeypatch, database, services):
+    monkeypatch.setattr(db.CompositionDatabaseRestore, 'get_backend',
+        classmethod(lambda cls, **kwargs: Backend(services)))
+    monkeypatch.setattr('comp_community_scripts.migrations.forget_migrations',
+        lambda *args: None)
+    app = db.CompositionDatabaseRestore('restore')
+    app.database = str(database)
+    return app.main('seeded')
+
+
+def test_refuses_while_the_api_is_running(database, monkeypatch):
+    assert restore(monkeypatch, database, ['api', 'nginx']) == 1
+    assert _execute(database, "SELECT name FROM users") == [('nick', )]
+
+
+def test_restores_once_the_api_is_stopped(database, monkeypatch):
+    assert restore(monkeypatch, database, ['nginx']) == 0
+    assert _execute(database, "SELECT name FROM users") == []
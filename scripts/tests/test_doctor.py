@@ -0,0 +1,63 @@
+import pytest
+from plumbum import local
+
+from comp_community_scripts.doctor import (CheckFailed, _gitconfig_paths,
+    _gitconfig_value, check_gitconfig)
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.delenv('XDG_CONFIG_HOME', raising=False)
+    monkeypatch.delenv('GIT_CONFIG_GLOBAL', raising=False)
+    monkeypatch.setenv('GIT_CONFIG_NOSYSTEM', '1')
+    # Commands are run with plumbum's environment.
+    with local.env(HOME=str(tmp_path), GIT_CONFIG_NOSYSTEM='1'):
+        yield tmp_path
+
+
+@pytest.mark.parametrize('raw, value', [
+    ('Nick Florin', 'Nick Florin'),
+    ('"Nick Florin"', 'Nick Florin'),
+    ('nick@example.com ; work', 'nick@example.com'),
+    ('"Nick #1" # me', 'Nick #1'),
+    (r'"say \"hi\""', 'say "hi"'),
+])
+def test_value(raw, value):
+    assert _gitconfig_value(raw) == value
+
+
+def test_quoted_values(home):
+    (home / '.gitconfig').write_text('[user]\n'
+        '\tname = "Nick Florin"\n\temail = nick@example.com # work\n')
+    assert check_gitconfig() == 'Nick Florin <nick@example.com>'
+
+
+def test_gitconfig_overrides_xdg_config(home):
+    (home / '.config' / 'git').mkdir(parents=True)
+    (home / '.config' / 'git' / 'config').write_text(
+        '[user]\n\tname = Old\n\temail = old@example.com\n')
+    (home / '.gitconfig').write_text('[user]\n\tname = New\n')
+    assert check_gitconfig() == 'New <old@example.com>'
+
+
+def test_git_config_global(home, monkeypatch):
+    other = home / 'other.gitconfig'
+    other.write_text('[user]\n\tname = Nick\n\temail = nick@example.com\n')
+    monkeypatch.setenv('GIT_CONFIG_GLOBAL', str(other))
+    assert check_gitconfig() == 'Nick <nick@example.com>'
+    assert _gitconfig_paths() == [str(other)]
+
+
+def test_includes_are_resolved_by_git(home):
+    (home / 'user.gitconfig').write_text(
+        '[user]\n\tname = Nick\n\temail = nick@example.com\n')
+    (home / '.gitconfig').write_text('[include]\n\tpath = user.gitconfig\n')
+    assert check_gitconfig() == 'Nick <nick@example.com>'
+    assert str(home / 'user.gitconfig') in _gitconfig_paths()
+
+
+def test_missing(home):
+    (home / '.gitconfig').write_text('[user]\n\tname = Nick\n')
+    with pytest.raises(CheckFailed, match='user.email is not set'):
+        check_gitconfig()
@@ -0,0 +1,88 @@
+import base64
+import json
+
+import pytest
+
+from comp_community_scripts.backends.engine import EngineBackend, EngineClient
+from comp_community_scripts.utils.exceptions import DockerEngineError
+
+
+def test_ping(engine):
+    engine.route('GET', '/_ping', body=b'OK')
+    assert EngineClient(engine.socket_path).ping()
+
+
+def test_ping_without_a_daemon(tmp_path):
+    assert not EngineClient(str(tmp_path / 'none.sock')).ping()
+
+
+def test_requests_reuse_a_pooled_connection(engine):
+    engine.route('GET', '/containers/json', body=[])
+    client = EngineClient(engine.socket_path)
+    for _ in range(3):
+        client.containers()
+    assert engine.connections == 1
+
+
+def test_containers_are_filtered_by_label(engine):
+    engine.route('GET', '/containers/json', body=[{'Id': 'c0ffee'}])
+    client = EngineClient(engine.socket_path)
+    assert client.containers(all=True, labels=['a=b']) == [{'Id': 'c0ffee'}]
+    query = engine.requests[-1]['query']
+    assert query['all'] == '1'
+    assert json.loads(query['filters']) == {'label': ['a=b']}
+
+
+def test_errors_carry_the_daemons_message(engine):
+    engine.route('POST', '/containers/c0ffee/stop', status=500,
+        body={'message': 'cannot stop'})
+    with pytest.raises(DockerEngineError) as e:
+        EngineClient(engine.socket_path).stop_container('c0ffee')
+    assert e.value.status == 500
+    assert 'cannot stop' in str(e.value)
+
+
+def test_missing_images_are_none(engine):
+    engine.route('GET', '/images/api:latest/json', status=404,
+        body={'message': 'No such image'})
+    assert EngineClient(engine.socket_path).inspect_image('api:latest') is None
+
+
+def test_pulls_send_the_clis_credentials(engine, tmp_path, monkeypatch):
+    auth = base64.b64encode(b'nick:secret').decode('ascii')
+    (tmp_path / 'config.json').write_text(json.dumps(
+        {'auths': {'ghcr.io': {'auth': auth}}}))
+    monkeypatch.setenv('DOCKER_CONFIG', str(tmp_path))
+    engine.route('POST', '/images/create', body=b'{"status": "done"}\n')
+
+    EngineClient(engine.socket_path).pull_image('ghcr.io/comp/api:1.0')
+    request = engine.requests[-1]
+    assert request['query'] == {'fromImage': 'ghcr.io/comp/api', 'tag': '1.0'}
+    credentials = json.loads(base64.urlsafe_b64decode(
+        request['headers']['X-Registry-Auth']))
+    assert credentials['username'] == 'nick'
+    assert credentials['password'] == 'secret'
+
+
+def test_pull_errors_in_the_stream_are_raised(engine, tmp_path, monkeypatch):
+    monkeypatch.setenv('DOCKER_CONFIG', str(tmp_path))
+    engine.route('POST', '/images/create',
+        body=b'{"status": "Pulling"}\n{"error": "manifest unknown"}\n')
+    with pytest.raises(DockerEngineError) as e:
+        EngineClient(engine.socket_path).pull_image('api:latest')
+    assert 'manifest unknown' in str(e.value)
+
+
+def test_backend_filters_on_docker_composes_project_label(engine, tmp_path,
+        monkeypatch):
+    monkeypatch.delenv('COMPOSE_PROJECT_NAME', raising=False)
+    root = tmp_path / 'comp-community'
+    root.mkdir()
+    engine.route('GET', '/containers/json', body=[{'Id': 'c0ffee', 'Ports': [
+        {'PrivatePort': 8000, 'PublicPort': 8000, 'Type': 'tcp'},
+        {'PrivatePort': 3306, 'Type': 'tcp'}]}])
+    backend = EngineBackend(str(root), client=EngineClient(engine.socket_path))
+
+    assert backend.published_ports() == {8000}
+    assert json.loads(engine.requests[-1]['query']['filters']) == {
+        'label': ['com.docker.compose.project=compcommunity']}
@@ -0,0 +1,38 @@
+import pytest
+
+from comp_community_scripts.instances import PortLeases, instance_project
+from comp_community_scripts.utils.exceptions import InstanceConflictError
+
+
+@pytest.fixture
+def leases(tmp_path):
+    return PortLeases(path=str(tmp_path / 'leases.json'), ports=(39000, 39099))
+
+
+def test_instance_projects_are_named_as_docker_compose_names_them(tmp_path,
+        monkeypatch):
+    monkeypatch.delenv('COMPOSE_PROJECT_NAME', raising=False)
+    root = tmp_path / 'comp-community'
+    root.mkdir()
+    assert instance_project(root, instance=2) == 'compcommunity2'
+    assert instance_project(root, project='ci-shard_3') == 'cishard3'
+
+
+def test_an_instance_keeps_its_ports(leases, tmp_path):
+    ports = leases.lease('comp2', ['api', 'admin'], root=str(tmp_path))
+    assert leases.lease('comp2', ['api', 'admin'], root=str(tmp_path)) == ports
+    assert len(set(ports.values())) == 2
+
+
+def test_instances_of_one_checkout_cannot_run_together(leases, tmp_path):
+    leases.lease('comp2', ['api'], root=str(tmp_path))
+    with pytest.raises(InstanceConflictError):
+        leases.lease('comp3', ['api'], root=str(tmp_path))
+
+
+def test_instances_of_other_checkouts_get_other_ports(leases, tmp_path):
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    first = leases.lease('a2', ['api'], root=str(tmp_path / 'a'))
+    second = leases.lease('b2', ['api'], root=str(tmp_path / 'b'))
+    assert first['api'] != second['api']
@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+from comp_community_scripts.logs import LogMultiplexer
+
+
+class Source(object):
+
+    def __init__(self, count):
+        self.count = count
+
+    async def lines(self):
+        for i in range(self.count):
+            yield '2018-06-02T17:41:%02d.%06dZ line %d' % (i // 10 ** 6 % 60,
+                i % 10 ** 6, i), 'stdout'
+
+    def close(self):
+        pass
+
+
+def run(multiplexer, timeout=10):
+    """
+    Runs the multiplexer on a thread, so that a hang fails the test.
+    """
+    outcome = {}
+
+    def target():
+        try:
+            outcome['written'] = multiplexer.run()
+        except Exception as e:
+            outcome['error'] = e
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "the multiplexer hung"
+    return outcome
+
+
+def test_merges_sources_in_order():
+    lines = []
+    multiplexer = LogMultiplexer({'api': Source(50), 'nginx': Source(30)},
+        buffer=5, sink=lines.append)
+    assert run(multiplexer) == {'written': 80}
+    timestamps = [line.timestamp for line in lines]
+    assert timestamps == sorted(timestamps)
+
+
+def test_a_failing_sink_does_not_hang_on_full_queues():
+    written = []
+
+    def sink(line):
+        # Once the readers have filled their queues again.
+        written.append(line)
+        if len(written) == 10:
+            raise IOError("broken pipe")
+
+    multiplexer = LogMultiplexer({'api': Source(1000), 'nginx': Source(1000)},
+        buffer=1, sink=sink)
+    outcome = run(multiplexer)
+    assert isinstance(outcome.get('error'), IOError)
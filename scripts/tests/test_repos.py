@@ -0,0 +1,80 @@
+import os
+import subprocess
+
+import pytest
+
+from comp_community_scripts.repos import (SubRepository, SyncResult,
+    sync_repositories)
+
+
+def _git(*args, **kwargs):
+    return subprocess.check_output(('git',) + args, **kwargs).decode().strip()
+
+
+def _commit(work, message):
+    with open(os.path.join(work, 'README'), 'a') as f:
+        f.write(message + '\n')
+    _git('-C', work, 'add', 'README')
+    _git('-C', work, '-c', 'user.name=comp', '-c', 'user.email=comp@test',
+        'commit', '--quiet', '-m', message)
+    _git('-C', work, 'push', '--quiet', 'origin', 'HEAD:master')
+    return _git('-C', work, 'rev-parse', 'HEAD')
+
+
+@pytest.fixture
+def remote(tmp_path, monkeypatch):
+    """
+    A bare repository with two commits, and a working copy to push more to
+    it from.
+    """
+    monkeypatch.setenv('COMP_CACHE_DIR', str(tmp_path / 'cache'))
+    bare = str(tmp_path / 'api.git')
+    work = str(tmp_path / 'work')
+    _git('init', '--quiet', '--bare', '--initial-branch=master', bare)
+    _git('clone', '--quiet', bare, work, stderr=subprocess.DEVNULL)
+    _commit(work, 'first')
+    _commit(work, 'second')
+    return bare, work
+
+
+def _repo(tmp_path, remote, name='api'):
+    return SubRepository(name, str(tmp_path / 'checkout' / name), remote[0])
+
+
+def test_clone_through_the_cache_then_fetch(tmp_path, remote):
+    repo = _repo(tmp_path, remote)
+
+    [result] = sync_repositories([repo])
+    assert result.status == SyncResult.CLONED, result.detail
+    assert result.head == _git('-C', remote[1], 'rev-parse', 'HEAD')
+    assert os.path.isdir(repo.cache_path)
+    # The checkout does not depend on the mirror.
+    assert not os.path.exists(os.path.join(repo.path, '.git', 'objects',
+        'info', 'alternates'))
+
+    _commit(remote[1], 'third')
+    [result] = sync_repositories([repo])
+    assert result.status == SyncResult.FETCHED, result.detail
+    assert result.behind == 1
+
+
+def test_shallow_clone_skips_the_cache(tmp_path, remote):
+    # git ignores --depth for remotes given as plain paths.
+    repo = SubRepository('api', str(tmp_path / 'checkout' / 'api'),
+        'file://' + remote[0])
+
+    [result] = sync_repositories([repo], depth=1)
+    assert result.status == SyncResult.CLONED, result.detail
+    assert not os.path.exists(repo.cache_path)
+    assert _git('-C', repo.path, 'rev-list', '--count', 'HEAD') == '1'
+
+
+def test_failures_are_reported_per_repository(tmp_path, remote):
+    good = _repo(tmp_path, remote)
+    bad = SubRepository('missing', str(tmp_path / 'checkout' / 'missing'),
+        str(tmp_path / 'missing.git'))
+
+    results = sync_repositories([good, bad], use_cache=False)
+    assert [r.status for r in results] == [SyncResult.CLONED,
+        SyncResult.FAILED]
+    assert not os.path.exists(bad.path + '.partial')
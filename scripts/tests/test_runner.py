@@ -0,0 +1,20 @@
+import sys
+
+from comp_community_scripts.utils.runner import DEFAULT_TAIL, run
+
+
+LINES = [sys.executable, '-c',
+    'import sys\nfor i in range(500): print(i); print(i, file=sys.stderr)']
+
+
+def test_stdout_is_tailed():
+    result = run(LINES, log=lambda line: None)
+    assert len(result.stdout_tail) == DEFAULT_TAIL
+    assert result.stdout_tail[-1] == '499'
+
+
+def test_capture_keeps_all_of_stdout():
+    result = run(LINES, log=lambda line: None, capture=True)
+    assert result.stdout_tail == [str(i) for i in range(500)]
+    # What is kept to show on failures is still bounded.
+    assert len(result.tail) == DEFAULT_TAIL
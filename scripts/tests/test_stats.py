@@ -0,0 +1,17 @@
+import pytest
+
+from comp_community_scripts.commands.stats import CompositionStats
+
+
+@pytest.mark.parametrize('argv', [
+    ['--window', '0'],
+    ['--window', '-5'],
+    ['--interval', '0'],
+    ['--refresh', '-1'],
+    ['--duration', '0'],
+])
+def test_invalid_switches_are_rejected(argv, monkeypatch):
+    monkeypatch.setattr(CompositionStats, 'main',
+        lambda self: pytest.fail("main should not run"))
+    _, retcode = CompositionStats.run(['stats'] + argv, exit=False)
+    assert retcode == 2